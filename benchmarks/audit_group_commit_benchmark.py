@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""
+Compares inserting user search audit records in a transaction each with the group-commit writer.
+
+Writes records (with user id 'bench-audit') from concurrent threads, standing in for the requests of a
+gevent worker, into the database configured in the environment, then deletes them. Run from the top-level
+directory, after sourcing environment.sh:
+
+    python benchmarks/audit_group_commit_benchmark.py --threads 32 --records 50
+"""
+import argparse
+import threading
+import time
+from datetime import datetime, timedelta
+
+from service import app, audit_writer, db, metrics
+from service.models import UserSearchAndResults
+
+TABLE = UserSearchAndResults.__table__
+USER_ID = 'bench-audit'
+
+
+def make_record(thread_number, number):
+    return dict(
+        search_datetime=datetime(2016, 1, 1) + timedelta(seconds=thread_number, microseconds=number),
+        user_id=USER_ID, title_number='BENCH1', search_type='D', purchase_type='drvSummary', amount=300,
+        cart_id='cart', viewed_datetime=None, lro_trans_ref=None, valid=False,
+    )
+
+
+def insert_one(engine, record):
+    with engine.begin() as connection:
+        connection.execute(TABLE.insert().values(record))
+
+
+def benchmark(name, write, args):
+    def run(thread_number):
+        for number in range(args.records):
+            write(make_record(thread_number, number))
+
+    threads = [threading.Thread(target=run, args=(thread_number,)) for thread_number in range(args.threads)]
+    start = time.time()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.time() - start
+    print('{:<8} {:>8.0f} records/s'.format(name, args.threads * args.records / elapsed))
+
+
+def delete_records(engine):
+    with engine.begin() as connection:
+        connection.execute(TABLE.delete().where(TABLE.c.user_id == USER_ID))
+
+
+def _parse_command_line_args():
+    parser = argparse.ArgumentParser(description='Compares a transaction per audit record with group commit')
+    parser.add_argument('-t', '--threads', type=int, default=32, help='Concurrent writers')
+    parser.add_argument('-r', '--records', type=int, default=50, help='Records written by each')
+    parser.add_argument('-w', '--max-wait-ms', type=int, default=5, help='Group commit wait')
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    args = _parse_command_line_args()
+    with app.app_context():
+        engine = db.get_engine(app)
+        delete_records(engine)
+        try:
+            benchmark('single', lambda record: insert_one(engine, record), args)
+            delete_records(engine)
+
+            metrics.reset()
+            writer = audit_writer.GroupCommitWriter(engine, TABLE, max_batch_size=100, max_wait_ms=args.max_wait_ms)
+            benchmark('group', writer.write, args)
+            timings = metrics.snapshot()['timings']
+            print('group commit: {count} batches, {mean:.1f} records each on average'.format(
+                **timings['audit_writer.batch_size']))
+            print('commit latency: {mean:.2f} ms mean, {max:.2f} ms max'.format(**timings['audit_writer.commit_ms']))
+        finally:
+            delete_records(engine)
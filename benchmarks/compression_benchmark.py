@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+"""
+Reports bytes on the wire and CPU time per request for each response encoding.
+
+Serves large synthetic titles through the API in-process, with the database and Elasticsearch replaced
+by stand-ins that answer immediately, so the CPU time is the application's own. Title requests are
+measured with and without the cache of compressed bodies. Run from the top-level directory, after
+sourcing environment.sh:
+
+    python benchmarks/compression_benchmark.py --entries 2000 --requests 200
+"""
+import argparse
+import time
+from collections import namedtuple
+from datetime import datetime
+from elasticsearch_dsl.utils import AttrList  # type: ignore
+
+from benchmarks.db_driver_benchmark import make_title
+from service import app, compression
+from service.server import db_access, es_access
+
+ENCODINGS = ('identity',) + tuple(reversed(compression.available_encodings()))
+
+Title = namedtuple('Title', ['title_number', 'register_data', 'geometry_data', 'official_copy_data', 'last_modified'])
+AddressHit = namedtuple('AddressHit', ['title_number', 'address_string'])
+
+
+def install_stand_ins(args):
+    titles = {}
+    for number in range(app.config['SEARCH_RESULTS_PER_PAGE']):
+        title = make_title(number, args.entries)
+        titles[title['title_number']] = Title(
+            title['title_number'], title['register_data'], title['geometry_data'],
+            title['official_copy_data'], datetime(2016, 1, 1),
+        )
+
+    def get_properties_for_address(address, page_size, page_number):
+        hits = AttrList([AddressHit(title_number, address) for title_number in titles])
+        hits.total = len(titles)
+        return hits
+
+    db_access.get_title_register = titles.get
+    db_access.get_official_copy_data = titles.get
+    db_access.get_title_registers = lambda title_numbers: [titles[number] for number in title_numbers]
+    es_access.get_properties_for_address = get_properties_for_address
+    return sorted(titles)[0]
+
+
+def measure(client, url, encoding, args):
+    client.get(url, headers={'Accept-Encoding': encoding})  # warm up
+    wire_bytes = 0
+    wall_start, cpu_start = time.time(), time.process_time()
+    for _ in range(args.requests):
+        wire_bytes = len(client.get(url, headers={'Accept-Encoding': encoding}).data)
+    wall, cpu = time.time() - wall_start, time.process_time() - cpu_start
+    return wire_bytes, 1000 * cpu / args.requests, 1000 * wall / args.requests
+
+
+def _parse_command_line_args():
+    parser = argparse.ArgumentParser(description='Compares response encodings by size and CPU cost')
+    parser.add_argument('-e', '--entries', type=int, default=500, help='Register entries per title')
+    parser.add_argument('-r', '--requests', type=int, default=100, help='Requests per route and encoding')
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    args = _parse_command_line_args()
+    title_number = install_stand_ins(args)
+    client = app.test_client()
+    cache_size = app.config['COMPRESSED_BODY_CACHE_SIZE']
+
+    cases = (
+        ('official copy', '/titles/{}/official-copy'.format(title_number), cache_size),
+        ('official copy, no cache', '/titles/{}/official-copy'.format(title_number), 0),
+        ('address search page', '/title_search_address/street', cache_size),
+    )
+    for name, url, cache_size in cases:
+        app.config['COMPRESSED_BODY_CACHE_SIZE'] = cache_size
+        compression.clear_cache()
+        for encoding in ENCODINGS:
+            wire_bytes, cpu_ms, wall_ms = measure(client, url, encoding, args)
+            print('{:<24} {:<9} {:>10} bytes {:>8.2f} ms CPU/request {:>8.2f} ms wall/request'.format(
+                name, encoding, wire_bytes, cpu_ms, wall_ms))
@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+"""
+Measures the Python overhead of each db_access point lookup, with the database round trip stubbed out: the
+engine's connections are fakes that answer every query with canned rows, so what's timed is building the
+statement, compiling it, executing it through SQLAlchemy and loading the result.
+
+Compares the ORM queries the lookups used to build for every call ('per call') with the prebuilt statements
+they now compile once and read into records ('prebuilt'). No database is needed. Run from the top-level directory, after sourcing
+environment.sh:
+
+    python benchmarks/db_access_overhead_benchmark.py --calls 5000
+"""
+import argparse
+import json
+import mock
+import re
+import sqlalchemy  # type: ignore
+import time
+from datetime import datetime
+from sqlalchemy import false                                     # type: ignore
+from sqlalchemy.orm.strategy_options import Load                 # type: ignore
+
+from config import CONFIG_DICT
+from service import circuit_breaker, create_app, db, db_access, read_replicas
+from service.models import TitleLrUprn, TitleRegisterData, UprnMapping
+
+JSON_COLUMNS = ('register_data', 'geometry_data', 'official_copy_data', 'title_summary')
+CANNED_VALUES = {
+    'uprn': '1', 'lr_uprn': '1', 'last_modified': datetime(2016, 1, 26, 13, 0, 30),
+    'is_deleted': False, 'lr_uprns': ['1'],
+}
+CANNED_JSON = json.dumps({'tenure': 'Freehold', 'entries': ['entry {}'.format(i) for i in range(20)]})
+
+
+class StubCursor:
+    """Answers any query with rows_per_query rows of canned values for the columns its SQL selects"""
+
+    rowcount = -1
+    rows_per_query = 1
+
+    def __init__(self):
+        self.description = None
+        self._rows = []
+
+    def execute(self, sql, params=None):
+        if sql == 'select version()':
+            labels, rows = ['version'], [('PostgreSQL 9.4.1',)]
+        else:
+            labels = _selected_labels(sql)
+            rows = [tuple(_canned_value(label, number) for label in labels)
+                    for number in range(1, self.rows_per_query + 1)]
+        self.description = [(label.encode(), 25, None, None, None, None, None) for label in labels]
+        self._rows = rows
+
+    def fetchone(self):
+        return self._rows.pop(0) if self._rows else None
+
+    def fetchall(self):
+        rows, self._rows = self._rows, []
+        return rows
+
+    def fetchmany(self, size=None):
+        return self.fetchall()
+
+    def close(self):
+        pass
+
+
+class StubConnection:
+
+    autocommit = False
+
+    def cursor(self):
+        return StubCursor()
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        pass
+
+    def close(self):
+        pass
+
+
+def _selected_labels(sql):
+    """The names of the columns the SQL selects: their labels if they have them, e.g. 'title_number'"""
+    select_list = re.match(r'SELECT (.*?)\s+FROM\s', sql, re.DOTALL)
+    if not select_list:
+        return ['value']
+    return [re.split(r'\.| AS ', column)[-1] for column in re.split(r',\s*', select_list.group(1))]
+
+
+def _canned_value(label, number):
+    column = next((name for name in JSON_COLUMNS + ('title_number',) + tuple(CANNED_VALUES)
+                   if label.endswith(name)), None)
+    if column in JSON_COLUMNS:
+        return CANNED_JSON
+    if column == 'title_number':
+        return 'BENCH{}'.format(number)
+    return CANNED_VALUES.get(column, 'value')
+
+
+# The lookups as they were, building and compiling an ORM query for every call
+
+@circuit_breaker.protected(circuit_breaker.POSTGRES)
+@read_replicas.read_from_replica
+def get_title_register_per_call(title_number):
+    return TitleRegisterData.query.options(
+        Load(TitleRegisterData).load_only(
+            TitleRegisterData.title_number.name, TitleRegisterData.register_data.name,
+            TitleRegisterData.geometry_data.name, TitleRegisterData.last_modified.name)
+    ).filter(TitleRegisterData.title_number == title_number, TitleRegisterData.is_deleted == false()).first()
+
+
+@circuit_breaker.protected(circuit_breaker.POSTGRES)
+@read_replicas.read_from_replica
+def get_official_copy_data_per_call(title_number):
+    return TitleRegisterData.query.options(
+        Load(TitleRegisterData).load_only(
+            TitleRegisterData.title_number.name, TitleRegisterData.official_copy_data.name,
+            TitleRegisterData.last_modified.name)
+    ).filter(TitleRegisterData.title_number == title_number, TitleRegisterData.is_deleted == false()).first()
+
+
+@circuit_breaker.protected(circuit_breaker.POSTGRES)
+@read_replicas.read_from_replica
+def get_mapped_lruprn_per_call(address_base_uprn):
+    return UprnMapping.query.options(
+        Load(UprnMapping).load_only(UprnMapping.lr_uprn.name, UprnMapping.uprn.name)
+    ).filter(UprnMapping.uprn == address_base_uprn).first()
+
+
+@circuit_breaker.protected(circuit_breaker.POSTGRES)
+@read_replicas.read_from_replica
+def get_title_number_and_register_data_per_call(lr_uprn):
+    return db.session.query(TitleRegisterData).select_from(TitleRegisterData).join(
+        TitleLrUprn, TitleLrUprn.title_number == TitleRegisterData.title_number
+    ).options(
+        Load(TitleRegisterData).load_only(
+            TitleRegisterData.lr_uprns, TitleRegisterData.title_number, TitleRegisterData.register_data)
+    ).filter(
+        TitleRegisterData.is_deleted == false(), TitleLrUprn.lr_uprn == lr_uprn
+    ).order_by(TitleLrUprn.lr_uprn, TitleRegisterData.title_number).first()
+
+
+LOOKUPS = [
+    ('get_title_register', get_title_register_per_call, db_access.get_title_register, 'BENCH1'),
+    ('get_official_copy_data', get_official_copy_data_per_call, db_access.get_official_copy_data, 'BENCH1'),
+    ('get_mapped_lruprn', get_mapped_lruprn_per_call, db_access.get_mapped_lruprn, '1'),
+    ('get_title_number_and_register_data', get_title_number_and_register_data_per_call,
+     db_access.get_title_number_and_register_data, '1'),
+]
+
+
+def time_calls(lookup, argument, calls):
+    """Returns the CPU microseconds per call, each made in a new session as a request's would be"""
+    lookup(argument)  # warm up
+    db.session.remove()
+    start = time.process_time()
+    for _ in range(calls):
+        lookup(argument)
+        db.session.remove()
+    return (time.process_time() - start) * 1000000 / calls
+
+
+def _create_stubbed_app():
+    app = create_app(dict(CONFIG_DICT, DB_POOL_PRE_PING=False, SQLALCHEMY_BINDS={}))
+    create_engine = sqlalchemy.create_engine
+    with mock.patch.object(sqlalchemy, 'create_engine',
+                           lambda url, **options: create_engine(url, creator=StubConnection, **options)):
+        db.get_engine(app)
+    return app
+
+
+def _parse_command_line_args():
+    parser = argparse.ArgumentParser(description='Measures the Python overhead of the db_access point lookups')
+    parser.add_argument('-c', '--calls', type=int, default=5000, help='Calls timed per lookup and form')
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    args = _parse_command_line_args()
+    stubbed_app = _create_stubbed_app()
+    print('{:<36} {:>14} {:>14} {:>8}'.format('lookup', 'per call us', 'prebuilt us', 'saved'))
+    with stubbed_app.app_context():
+        for name, per_call, prebuilt, lookup_argument in LOOKUPS:
+            before = time_calls(per_call, lookup_argument, args.calls)
+            after = time_calls(prebuilt, lookup_argument, args.calls)
+            print('{:<36} {:>14.1f} {:>14.1f} {:>8.0%}'.format(name, before, after, 1 - after / before))
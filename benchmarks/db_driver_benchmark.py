@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""
+Measures rows per second and CPU time per request when reading large titles through each Postgres driver.
+
+Inserts temporary titles (numbers starting with 'BENCH-') into the database configured in the environment,
+runs the title and search page queries against them, then deletes them. Run from the top-level directory,
+after sourcing environment.sh:
+
+    python benchmarks/db_driver_benchmark.py --entries 2000 --requests 200
+"""
+import argparse
+import time
+from sqlalchemy import create_engine, false, select  # type: ignore
+
+import config
+from service.models import TitleRegisterData
+
+TITLE_PREFIX = 'BENCH-'
+TITLES = TitleRegisterData.__table__
+
+
+def make_title(number, entries):
+    """Builds a title whose register and official copy have the given number of entries"""
+    register_entries = [
+        {'entry_number': i, 'text': 'Entry {} of a large leasehold register, with some typical wording.'.format(i)}
+        for i in range(entries)
+    ]
+    return {
+        'title_number': '{}{}'.format(TITLE_PREFIX, number),
+        'register_data': {'tenure': 'Leasehold', 'entries': register_entries},
+        'geometry_data': {'type': 'Polygon', 'coordinates': [[[i, i + 1] for i in range(entries // 10)]]},
+        'official_copy_data': {'sub_registers': [{'A': register_entries}, {'B': register_entries}]},
+        'is_deleted': False,
+        'lr_uprns': [str(number)],
+    }
+
+
+def benchmark_driver(driver, args):
+    engine = create_engine(_get_db_uri(driver))
+    title_numbers = ['{}{}'.format(TITLE_PREFIX, i) for i in range(args.titles)]
+
+    single_title_query = select([TITLES.c.title_number, TITLES.c.register_data, TITLES.c.geometry_data]).where(
+        (TITLES.c.title_number == title_numbers[0]) & (TITLES.c.is_deleted == false())
+    )
+    page_query = select([TITLES.c.title_number, TITLES.c.register_data, TITLES.c.geometry_data]).where(
+        TITLES.c.title_number.in_(title_numbers) & (TITLES.c.is_deleted == false())
+    )
+
+    with engine.connect() as connection:
+        for name, query in (('title', single_title_query), ('page', page_query)):
+            _read_rows(connection.execute(query))  # warm up
+            wall_start, cpu_start = time.time(), time.process_time()
+            rows = 0
+            for _ in range(args.requests):
+                rows += len(_read_rows(connection.execute(query)))
+            wall, cpu = time.time() - wall_start, time.process_time() - cpu_start
+
+            print('{:<9} {:<6} {:>9.0f} rows/s {:>8.2f} ms CPU/request {:>8.2f} ms wall/request'.format(
+                driver, name, rows / wall, 1000 * cpu / args.requests, 1000 * wall / args.requests))
+
+    engine.dispose()
+
+
+def _read_rows(result):
+    # Touching the JSON columns makes SQLAlchemy decode them when the driver hasn't already done so
+    return [(row.title_number, row.register_data, row.geometry_data) for row in result]
+
+
+def _get_db_uri(driver):
+    return config.db_uri_template.format(
+        driver, config.user, config.password, config.host, config.port, config.database
+    )
+
+
+def _insert_titles(args):
+    engine = create_engine(_get_db_uri(args.drivers.split(',')[0]))
+    with engine.begin() as connection:
+        connection.execute(TITLES.delete().where(TITLES.c.title_number.startswith(TITLE_PREFIX)))
+        connection.execute(TITLES.insert(), [make_title(i, args.entries) for i in range(args.titles)])
+    return engine
+
+
+def _delete_titles(engine):
+    with engine.begin() as connection:
+        connection.execute(TITLES.delete().where(TITLES.c.title_number.startswith(TITLE_PREFIX)))
+    engine.dispose()
+
+
+def _parse_command_line_args():
+    parser = argparse.ArgumentParser(description='Compares Postgres drivers reading large titles')
+    parser.add_argument('-d', '--drivers', default=','.join(config.SUPPORTED_DB_DRIVERS), help='Comma-separated drivers')
+    parser.add_argument('-t', '--titles', type=int, default=50, help='Titles inserted (and returned by the page query)')
+    parser.add_argument('-e', '--entries', type=int, default=2000, help='Register entries per title')
+    parser.add_argument('-r', '--requests', type=int, default=100, help='Requests per query and driver')
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    args = _parse_command_line_args()
+    engine = _insert_titles(args)
+    try:
+        for driver in args.drivers.split(','):
+            benchmark_driver(driver, args)
+    finally:
+        _delete_titles(engine)
@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+"""
+Reports the CPU time and size of encoding response bodies with each JSON encoder, and with Flask's jsonify
+as the API used it before (pretty-printed, as it is unless JSONIFY_PRETTYPRINT_REGULAR is turned off).
+
+The bodies are those of the title, official copy and search page routes for titles of a realistic size,
+built as in db_driver_benchmark.py. No database is needed. Run from the top-level directory, after sourcing
+environment.sh:
+
+    python benchmarks/json_encoder_benchmark.py --entries 500 --repeats 200
+"""
+import argparse
+import time
+from flask import jsonify  # type: ignore
+
+from benchmarks.compression_benchmark import Title
+from benchmarks.db_driver_benchmark import make_title
+from service import app, json_encoding, server
+
+ENCODER_NAMES = ['json'] + (['orjson'] if json_encoding.orjson else [])
+
+
+def make_bodies(args):
+    titles = []
+    for number in range(app.config['SEARCH_RESULTS_PER_PAGE']):
+        title = make_title(number, args.entries)
+        titles.append(Title(title['title_number'], title['register_data'], title['geometry_data'],
+                            title['official_copy_data'], None))
+    search_page = {
+        'titles': [{'title_number': title.title_number, 'data': title.register_data} for title in titles],
+        'number_pages': 1, 'page_number': 0, 'number_results': len(titles),
+    }
+    return [
+        ('title', server.title_result(titles[0])),
+        ('official copy', server.official_copy_result(titles[0])),
+        ('search page', search_page),
+    ]
+
+
+def encode_with_jsonify(body):
+    return jsonify(body).get_data()
+
+
+def measure(encode, body, repeats):
+    """Returns the size of the encoded body and the CPU milliseconds taken to encode it"""
+    size = len(encode(body))  # warm up
+    start = time.process_time()
+    for _ in range(repeats):
+        encode(body)
+    return size, (time.process_time() - start) * 1000 / repeats
+
+
+def _parse_command_line_args():
+    parser = argparse.ArgumentParser(description='Compares the JSON encoders by CPU time and size')
+    parser.add_argument('-e', '--entries', type=int, default=500, help='Register entries per title')
+    parser.add_argument('-r', '--repeats', type=int, default=200, help='Encodings timed per body and encoder')
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    args = _parse_command_line_args()
+    encoders = [('jsonify', encode_with_jsonify)] + [
+        (name, json_encoding.get_encoder(name)) for name in ENCODER_NAMES
+    ]
+    with app.test_request_context():
+        for body_name, response_body in make_bodies(args):
+            for encoder_name, encoder in encoders:
+                body_size, cpu_ms = measure(encoder, response_body, args.repeats)
+                print('{:<14} {:<8} {:>10} bytes {:>8.2f} ms CPU'.format(body_name, encoder_name, body_size, cpu_ms))
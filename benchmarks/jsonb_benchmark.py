@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""
+Compares query latency on title data stored as JSON (before the migration) and as JSONB with the
+expression indexes (after it).
+
+Creates two scratch tables (bench_titles_json and bench_titles_jsonb) in the database configured in
+the environment, fills them with the same synthetic titles, runs the queries against each, then drops
+them. Run from the top-level directory, after sourcing environment.sh:
+
+    python benchmarks/jsonb_benchmark.py --titles 20000 --requests 200
+"""
+import argparse
+import json
+import statistics
+import time
+from sqlalchemy import create_engine, text  # type: ignore
+
+import config
+from benchmarks.db_driver_benchmark import make_title
+from service import jsonb_migration
+
+QUERIES = (
+    ('tenure filter', "SELECT count(*) FROM {table} WHERE register_data ->> 'tenure' = 'Freehold'"),
+    ('tenure lookup', "SELECT title_number FROM {table} WHERE register_data ->> 'tenure' = 'Freehold' LIMIT 10"),
+    ('title by number', "SELECT register_data, geometry_data FROM {table} WHERE title_number = 'BENCH-7'"),
+    ('sub-register', "SELECT official_copy_data -> 'sub_registers' -> 0 FROM {table} WHERE title_number = 'BENCH-7'"),
+)
+
+
+def create_tables(engine, args):
+    titles = []
+    for number in range(args.titles):
+        title = make_title(number, args.entries)
+        # One title in a hundred is freehold, so the tenure queries are selective
+        title['register_data']['tenure'] = 'Freehold' if number % 100 == 0 else 'Leasehold'
+        titles.append({key: title[key] for key in ('title_number',) + jsonb_migration.JSON_COLUMNS})
+
+    with engine.begin() as connection:
+        for column_type in ('json', 'jsonb'):
+            table = 'bench_titles_{}'.format(column_type)
+            connection.execute('DROP TABLE IF EXISTS {}'.format(table))
+            connection.execute(
+                'CREATE TABLE {0} (title_number varchar(20) PRIMARY KEY, register_data {1}, geometry_data {1}, '
+                'official_copy_data {1})'.format(table, column_type)
+            )
+            # All the titles in one parameter, as inserting them one at a time takes a round trip each
+            connection.execute(
+                text("INSERT INTO {0} SELECT title ->> 'title_number', CAST(title -> 'register_data' AS {1}), "
+                     "CAST(title -> 'geometry_data' AS {1}), CAST(title -> 'official_copy_data' AS {1}) "
+                     "FROM json_array_elements(CAST(:titles AS json)) AS title".format(table, column_type)),
+                titles=json.dumps(titles),
+            )
+
+        for index_name, expression in jsonb_migration.EXPRESSION_INDEXES.items():
+            connection.execute('CREATE INDEX bench_{} ON bench_titles_jsonb ({})'.format(index_name, expression))
+        connection.execute('ANALYZE bench_titles_json')
+        connection.execute('ANALYZE bench_titles_jsonb')
+
+
+def drop_tables(engine):
+    with engine.begin() as connection:
+        connection.execute('DROP TABLE IF EXISTS bench_titles_json')
+        connection.execute('DROP TABLE IF EXISTS bench_titles_jsonb')
+
+
+def benchmark(engine, args):
+    with engine.connect() as connection:
+        for name, query in QUERIES:
+            latencies = {}
+            for column_type in ('json', 'jsonb'):
+                statement = query.format(table='bench_titles_{}'.format(column_type))
+                connection.execute(statement).fetchall()  # warm up
+                timings = []
+                for _ in range(args.requests):
+                    start = time.time()
+                    connection.execute(statement).fetchall()
+                    timings.append((time.time() - start) * 1000)
+                latencies[column_type] = statistics.median(timings)
+            print('{:<16} json {:>8.2f} ms   jsonb {:>8.2f} ms   (median)'.format(name, latencies['json'], latencies['jsonb']))
+
+
+def _parse_command_line_args():
+    parser = argparse.ArgumentParser(description='Compares query latency on JSON and JSONB columns')
+    parser.add_argument('-t', '--titles', type=int, default=20000, help='Titles in each table')
+    parser.add_argument('-e', '--entries', type=int, default=50, help='Register entries per title')
+    parser.add_argument('-r', '--requests', type=int, default=50, help='Runs of each query')
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    args = _parse_command_line_args()
+    engine = create_engine(config.sql_alchemy_uri)
+    create_tables(engine, args)
+    try:
+        benchmark(engine, args)
+    finally:
+        drop_tables(engine)
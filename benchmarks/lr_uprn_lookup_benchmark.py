@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+"""
+Compares looking up titles by lr_uprn through the GIN index on title_register_data.lr_uprns with
+looking them up through the B-tree indexed title_lr_uprn table.
+
+Inserts temporary titles (numbers starting with 'BL-') into the database configured in the environment,
+each with a few lr_uprns, runs point and batch lookups both ways, then deletes them. Run from the
+top-level directory, after sourcing environment.sh:
+
+    python benchmarks/lr_uprn_lookup_benchmark.py --titles 100000 --requests 500
+"""
+import argparse
+import random
+import statistics
+import time
+from sqlalchemy import cast, false, String, text                 # type: ignore
+from sqlalchemy.dialects.postgresql import array, ARRAY          # type: ignore
+from sqlalchemy.orm.strategy_options import Load                 # type: ignore
+
+from service import app, db, db_access
+from service.models import TitleRegisterData
+
+TITLE_PREFIX = 'BL-'
+LR_UPRNS_PER_TITLE = 3
+BATCH_SIZE = 20
+
+INSERT_TITLES = text(
+    "INSERT INTO title_register_data (title_number, register_data, geometry_data, official_copy_data, is_deleted, "
+    "last_modified, lr_uprns) "
+    "SELECT '{0}' || i, '{{\"tenure\": \"Freehold\"}}', '{{}}', '{{}}', false, now(), "
+    "ARRAY(SELECT '{0}' || (i * :per_title + j) FROM generate_series(0, :per_title - 1) AS j) "
+    "FROM generate_series(0, :titles - 1) AS i".format(TITLE_PREFIX)
+)
+DELETE_TITLES = text("DELETE FROM title_register_data WHERE title_number LIKE '{}%'".format(TITLE_PREFIX))
+INDEX_SIZES = text(
+    "SELECT pg_size_pretty(pg_relation_size('idx_title_uprns')), "
+    "pg_size_pretty(pg_relation_size('title_lr_uprn_pkey') + pg_relation_size('idx_title_lr_uprn_title_number'))"
+)
+
+
+def gin_lookup(lr_uprn):
+    # The query the point lookup ran before the title_lr_uprn table
+    return TitleRegisterData.query.options(
+        Load(TitleRegisterData).load_only(TitleRegisterData.lr_uprns, TitleRegisterData.title_number,
+                                          TitleRegisterData.register_data)
+    ).filter(
+        TitleRegisterData.lr_uprns.contains(cast(array([lr_uprn]), ARRAY(String))),
+        TitleRegisterData.is_deleted == false()
+    ).all()
+
+
+def gin_batch_lookup(lr_uprns):
+    return TitleRegisterData.query.options(
+        Load(TitleRegisterData).load_only(TitleRegisterData.lr_uprns, TitleRegisterData.title_number,
+                                          TitleRegisterData.register_data)
+    ).filter(
+        TitleRegisterData.lr_uprns.overlap(cast(array(lr_uprns), ARRAY(String))),
+        TitleRegisterData.is_deleted == false()
+    ).all()
+
+
+def benchmark(name, lookup, make_argument, args):
+    timings = []
+    for _ in range(args.requests):
+        argument = make_argument()
+        start = time.time()
+        lookup(argument)
+        timings.append((time.time() - start) * 1000)
+        db.session.remove()
+    print('{:<28} {:>8.2f} ms median {:>8.2f} ms p95'.format(
+        name, statistics.median(timings), sorted(timings)[int(len(timings) * 0.95)]))
+
+
+def _random_lr_uprn(args):
+    return '{}{}'.format(TITLE_PREFIX, random.randrange(args.titles * LR_UPRNS_PER_TITLE))
+
+
+def _parse_command_line_args():
+    parser = argparse.ArgumentParser(description='Compares lr_uprn lookups through the GIN index and title_lr_uprn')
+    parser.add_argument('-t', '--titles', type=int, default=100000, help='Titles to insert')
+    parser.add_argument('-r', '--requests', type=int, default=500, help='Lookups of each kind')
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    args = _parse_command_line_args()
+    with app.app_context():
+        engine = db.get_engine(app)
+        with engine.begin() as connection:
+            connection.execute(DELETE_TITLES)
+            start = time.time()
+            connection.execute(INSERT_TITLES, titles=args.titles, per_title=LR_UPRNS_PER_TITLE)
+            print('Inserted {} titles in {:.1f} s'.format(args.titles, time.time() - start))
+        with engine.begin() as connection:
+            connection.execute('ANALYZE title_register_data')
+            connection.execute('ANALYZE title_lr_uprn')
+            print('Index sizes: GIN {}, title_lr_uprn {}'.format(*connection.execute(INDEX_SIZES).first()))
+        try:
+            single, batch = (lambda: _random_lr_uprn(args)), (lambda: [_random_lr_uprn(args) for _ in range(BATCH_SIZE)])
+            benchmark('point lookup, GIN', gin_lookup, single, args)
+            benchmark('point lookup, title_lr_uprn', db_access.get_title_number_and_register_data, single, args)
+            benchmark('batch of {}, GIN'.format(BATCH_SIZE), gin_batch_lookup, batch, args)
+            benchmark('batch of {}, title_lr_uprn'.format(BATCH_SIZE), db_access.get_titles_and_register_data, batch, args)
+        finally:
+            with engine.begin() as connection:
+                connection.execute(DELETE_TITLES)
@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+"""
+Compares the encodings of the legacy transmission messages: messages encoded per second and bytes per message.
+
+'before' is how messages were sent until the codec layer: JSON-encoded, then JSON-encoded again by kombu and
+always zlib-compressed. The others are the codecs of service/message_codec.py, compressed only at or above the
+threshold. Needs no broker. Run from the top-level directory:
+
+    python benchmarks/message_codec_benchmark.py --messages 20000
+"""
+import argparse
+import json
+import time
+from datetime import datetime
+from decimal import Decimal
+from kombu.compression import compress  # type: ignore
+from kombu.serialization import dumps  # type: ignore
+
+from service import legacy_transmission_queue, message_codec
+
+SEARCH_RESULT = {
+    'SEARCH_DATETIME': datetime(2016, 1, 26, 13, 0, 30, 5449), 'USER_ID': 'Test User', 'TITLE_NUMBER': 'GR12345',
+    'SEARCH_TYPE': 'D', 'PURCHASE_TYPE': 'drvSummaryView', 'AMOUNT': Decimal('2'), 'CART_ID': '374f501f4567',
+    'LRO_TRANS_REF': None, 'VIEWED_DATETIME': None,
+}
+
+
+def encode_before(message):
+    body = dumps(json.dumps(message), serializer='json')[2]
+    return compress(body, 'zlib')[0]
+
+
+def encode_with(codec_name, compress_min_bytes):
+    def encode(message):
+        encoded = message_codec.encode(message, codec_name, compress_min_bytes)
+        return compress(encoded.body, encoded.compression)[0] if encoded.compression else encoded.body
+    return encode
+
+
+def benchmark(name, encode, args):
+    message = legacy_transmission_queue.build_user_search_message(SEARCH_RESULT)
+    start = time.time()
+    for _ in range(args.messages):
+        body = encode(message)
+    elapsed = time.time() - start
+    print('{:<8} {:>10.0f} messages/s {:>6} bytes/message'.format(name, args.messages / elapsed, len(body)))
+
+
+def _parse_command_line_args():
+    parser = argparse.ArgumentParser(description='Compares the encodings of the legacy transmission messages')
+    parser.add_argument('-m', '--messages', type=int, default=20000, help='Messages encoded with each')
+    parser.add_argument('-c', '--compress-min-bytes', type=int, default=1024, help='Compression threshold')
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    args = _parse_command_line_args()
+    benchmark('before', encode_before, args)
+    for codec_name in sorted(message_codec.CODECS):
+        if codec_name == 'msgpack' and message_codec.msgpack is None:
+            print('msgpack  not installed')
+            continue
+        benchmark(codec_name, encode_with(codec_name, args.compress_min_bytes), args)
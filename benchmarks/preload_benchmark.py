@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""
+Compares gunicorn with and without preload_app: time until all workers serve requests, time for a killed
+worker to be replaced, and memory per worker. PSS (proportional set size) counts pages shared with other
+processes fractionally, so unlike RSS it shows the memory saved by sharing with the master.
+
+Linux only (reads /proc). Run from the top-level directory, after sourcing environment.sh:
+
+    python benchmarks/preload_benchmark.py --workers 4
+"""
+import argparse
+import os
+import re
+import signal
+import subprocess
+import tempfile
+import time
+
+
+def benchmark(preload, args):
+    env = dict(os.environ, GUNICORN_PRELOAD_APP='true' if preload else 'false')
+    bind = '127.0.0.1:{}'.format(args.port)
+    log = tempfile.NamedTemporaryFile(mode='r')
+    start = time.time()
+    master = subprocess.Popen(
+        ['gunicorn', '-w', str(args.workers), '-b', bind, '-c', 'gunicorn_settings.py', 'service:app'],
+        env=env, stdout=subprocess.DEVNULL, stderr=open(log.name, 'w'),
+    )
+
+    try:
+        workers = _wait_for_ready_workers(log, args.workers)
+        boot_time = time.time() - start
+        memory = [_get_memory_kb(pid) for pid in workers]
+
+        restart_start = time.time()
+        os.kill(workers[0], signal.SIGKILL)
+        _wait_for_ready_workers(log, 1)
+        restart_time = time.time() - restart_start
+    finally:
+        master.terminate()
+        master.wait()
+        log.close()
+
+    return {
+        'boot_s': boot_time,
+        'restart_s': restart_time,
+        'rss_mb': sum(rss for rss, _ in memory) / len(memory) / 1024,
+        'pss_mb': sum(pss for _, pss in memory) / len(memory) / 1024,
+    }
+
+
+def _wait_for_ready_workers(log, number_of_workers, timeout=60):
+    """Follows the gunicorn log until the given number of workers have reported being ready"""
+    deadline = time.time() + timeout
+    workers = []
+    while len(workers) < number_of_workers:
+        if time.time() > deadline:
+            raise Exception('Workers did not start in time')
+        line = log.readline()
+        if line:
+            match = re.search(r'Worker ready \(pid: (\d+)\)', line)
+            if match:
+                workers.append(int(match.group(1)))
+        else:
+            time.sleep(0.01)
+    return workers
+
+
+def _get_memory_kb(pid):
+    rss = pss = 0
+    try:
+        with open('/proc/{}/smaps_rollup'.format(pid)) as smaps_file:
+            for line in smaps_file:
+                if line.startswith('Rss:'):
+                    rss = int(line.split()[1])
+                elif line.startswith('Pss:'):
+                    pss = int(line.split()[1])
+    except IOError:
+        pass
+    return rss, pss
+
+
+def _parse_command_line_args():
+    parser = argparse.ArgumentParser(description='Compares gunicorn with and without preload_app')
+    parser.add_argument('-w', '--workers', type=int, default=4, help='Number of gunicorn workers')
+    parser.add_argument('-p', '--port', type=int, default=8766, help='Port to run gunicorn on')
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    args = _parse_command_line_args()
+    for preload in (False, True):
+        result = benchmark(preload, args)
+        print('preload={:<5} boot {:.2f}s, worker restart {:.2f}s, per worker RSS {:.1f}MB PSS {:.1f}MB'.format(
+            str(preload), result['boot_s'], result['restart_s'], result['rss_mb'], result['pss_mb']))
@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""
+Measures reading the titles of a page of search results (50 hits by default), as ORM instances the way
+get_title_registers and get_title_summaries used to ('ORM'), and as the records they now return ('records').
+The database is stubbed out as in db_access_overhead_benchmark.py, so no database is needed.
+
+For each, prints the CPU time per page and per row, and from tracemalloc the bytes per row allocated at the
+peak of reading a page and still held once it has been read (the results and any session state).
+Run from the top-level directory, after sourcing environment.sh:
+
+    python benchmarks/search_page_benchmark.py --hits 50 --pages 1000
+"""
+import argparse
+import time
+import tracemalloc
+from sqlalchemy import false                                     # type: ignore
+from sqlalchemy.orm.strategy_options import Load                 # type: ignore
+
+from benchmarks.db_access_overhead_benchmark import StubCursor, _create_stubbed_app
+from service import circuit_breaker, db, db_access, read_replicas
+from service.models import TitleRegisterData
+
+
+# The reads as they were, loading ORM instances into the session
+
+@circuit_breaker.protected(circuit_breaker.POSTGRES)
+@read_replicas.read_from_replica
+def get_title_registers_orm(title_numbers):
+    fields = [TitleRegisterData.title_number.name, TitleRegisterData.register_data.name,
+              TitleRegisterData.geometry_data.name, TitleRegisterData.last_modified.name]
+    query = TitleRegisterData.query.options(Load(TitleRegisterData).load_only(*fields))
+    return query.filter(TitleRegisterData.title_number.in_(title_numbers),
+                        TitleRegisterData.is_deleted == false()).all()
+
+
+@circuit_breaker.protected(circuit_breaker.POSTGRES)
+@read_replicas.read_from_replica
+def get_title_summaries_orm(title_numbers):
+    fields = [TitleRegisterData.title_number.name, TitleRegisterData.title_summary.name]
+    query = TitleRegisterData.query.options(Load(TitleRegisterData).load_only(*fields))
+    return query.filter(TitleRegisterData.title_number.in_(title_numbers),
+                        TitleRegisterData.is_deleted == false()).all()
+
+
+READS = [
+    ('get_title_registers', get_title_registers_orm, db_access.get_title_registers),
+    ('get_title_summaries', get_title_summaries_orm, db_access.get_title_summaries),
+]
+
+
+def time_pages(read, title_numbers, pages):
+    """Returns the CPU microseconds per page, each read in a new session as a request's would be"""
+    read(title_numbers)  # warm up
+    db.session.remove()
+    start = time.process_time()
+    for _ in range(pages):
+        read(title_numbers)
+        db.session.remove()
+    return (time.process_time() - start) * 1000000 / pages
+
+
+def measure_allocations(read, title_numbers):
+    """Returns the (peak, held) bytes allocated per row in reading a page"""
+    read(title_numbers)  # warm up, so that only the page's own allocations are traced
+    db.session.remove()
+    tracemalloc.start()
+    try:
+        tracemalloc.clear_traces()
+        rows = read(title_numbers)
+        held, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    db.session.remove()
+    return peak / len(rows), held / len(rows)
+
+
+def _parse_command_line_args():
+    parser = argparse.ArgumentParser(description='Measures reading a page of search results as ORM instances '
+                                                 'and as records')
+    parser.add_argument('-n', '--hits', type=int, default=50, help='Titles on each page')
+    parser.add_argument('-p', '--pages', type=int, default=1000, help='Pages timed per read and form')
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    args = _parse_command_line_args()
+    StubCursor.rows_per_query = args.hits
+    page_title_numbers = ['BENCH{}'.format(number) for number in range(1, args.hits + 1)]
+    stubbed_app = _create_stubbed_app()
+    print('{:<22} {:<8} {:>12} {:>12} {:>16} {:>16}'.format(
+        'read', 'form', 'us per page', 'us per row', 'peak B per row', 'held B per row'))
+    with stubbed_app.app_context():
+        for name, *forms in READS:
+            for form, read in zip(('ORM', 'records'), forms):
+                per_page = time_pages(read, page_title_numbers, args.pages)
+                peak, held = measure_allocations(read, page_title_numbers)
+                print('{:<22} {:<8} {:>12.1f} {:>12.1f} {:>16.0f} {:>16.0f}'.format(
+                    name, form, per_page, per_page / args.hits, peak, held))
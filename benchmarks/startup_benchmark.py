@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+"""
+Measures how long a new process takes to import the application, and to serve its first requests.
+
+Each run is a fresh Python process, so nothing is cached between runs. The first title request
+connects to the database configured in the environment. Also shows which of the dependencies only
+some routes need have been loaded by then, and what importing them costs. Run from the top-level
+directory, after sourcing environment.sh:
+
+    python benchmarks/startup_benchmark.py --runs 10
+"""
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+
+DEFERRED_MODULES = ('elasticsearch', 'elasticsearch_dsl', 'kombu')
+
+# Runs in each new process and prints its measurements as JSON
+MEASURE = '''
+import importlib, json, sys, time
+start = time.perf_counter()
+app = getattr(importlib.import_module(%(module)r), %(attribute)r)
+measurements = {"import_ms": (time.perf_counter() - start) * 1000}
+loaded = [name for name in %(modules)r if name in sys.modules]
+
+client = app.test_client()
+for name, url in (("first_metrics_ms", "/metrics"), ("first_title_ms", "/titles/STARTUP-BENCHMARK")):
+    start = time.perf_counter()
+    client.get(url)
+    measurements[name] = (time.perf_counter() - start) * 1000
+
+start = time.perf_counter()
+for name in %(modules)r:
+    __import__(name)
+measurements["deferred_import_ms"] = (time.perf_counter() - start) * 1000
+measurements["loaded_at_startup"] = loaded
+print(json.dumps(measurements))
+'''
+
+
+def run_once(app):
+    module, attribute = app.split(':')
+    script = MEASURE % {'module': module, 'attribute': attribute, 'modules': DEFERRED_MODULES}
+    output = subprocess.check_output([sys.executable, '-c', script])
+    return json.loads(output.decode().splitlines()[-1])
+
+
+def _parse_command_line_args():
+    parser = argparse.ArgumentParser(description='Measures application import and first-request latency')
+    parser.add_argument('-a', '--app', default='service:app', help='The application, as given to gunicorn')
+    parser.add_argument('-r', '--runs', type=int, default=10, help='Number of fresh processes to measure')
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    args = _parse_command_line_args()
+    results = [run_once(args.app) for _ in range(args.runs)]
+
+    for name in ('import_ms', 'first_metrics_ms', 'first_title_ms', 'deferred_import_ms'):
+        values = [result[name] for result in results]
+        print('{:<20} median {:>8.1f}ms  min {:>8.1f}ms  max {:>8.1f}ms'.format(
+            name, statistics.median(values), min(values), max(values)))
+
+    loaded = results[0]['loaded_at_startup']
+    print('loaded at startup: {}'.format(', '.join(loaded) if loaded else 'none'))
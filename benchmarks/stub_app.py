@@ -0,0 +1,115 @@
+"""
+The API with its dependencies replaced by local stand-ins that answer after a fixed delay.
+
+Serve it with gunicorn, e.g. 'gunicorn -k gevent benchmarks.stub_app:app'. The delay is set (in
+milliseconds) by STUB_DEPENDENCY_LATENCY_MS and the number of addresses per postcode page by
+STUB_ADDRESSES_PER_PAGE.
+"""
+import os
+import time
+from datetime import datetime
+from collections import namedtuple
+from elasticsearch_dsl.utils import AttrList  # type: ignore
+
+from service import app
+from service.server import api_client, db_access, es_access
+
+LATENCY_SECONDS = int(os.getenv('STUB_DEPENDENCY_LATENCY_MS', '20')) / 1000
+ADDRESSES_PER_PAGE = int(os.getenv('STUB_ADDRESSES_PER_PAGE', '20'))
+STUB_LAST_MODIFIED = datetime(2016, 1, 1)
+
+StubTitle = namedtuple(
+    'StubTitle', ['title_number', 'register_data', 'geometry_data', 'official_copy_data', 'last_modified']
+)
+StubUprnMapping = namedtuple('StubUprnMapping', ['uprn', 'lr_uprn'])
+StubAddressHit = namedtuple('StubAddressHit', ['title_number', 'address_string'])
+
+
+def _wait():
+    # time.sleep is patched by gevent, so under a gevent worker this yields like a socket read would
+    time.sleep(LATENCY_SECONDS)
+
+
+def _title(title_number):
+    return StubTitle(
+        title_number,
+        {'tenure': 'Freehold', 'register': 'data {}'.format(title_number)},
+        {'geometry': 'data {}'.format(title_number)},
+        {'sub_registers': [{'A': 'register A {}'.format(title_number)}]},
+        STUB_LAST_MODIFIED,
+    )
+
+
+def get_titles_by_postcode(postcode, page_number, page_size):
+    _wait()
+    addresses = [
+        {'uprn': str(1000 + i), 'joined_fields': '{} STUB STREET, {}'.format(i, postcode)}
+        for i in range(ADDRESSES_PER_PAGE)
+    ]
+    return {'data': {'addresses': addresses, 'total': ADDRESSES_PER_PAGE}}
+
+
+def get_mapped_lruprn(address_base_uprn):
+    _wait()
+    return StubUprnMapping(address_base_uprn, address_base_uprn)
+
+
+def get_title_number_and_register_data(lr_uprn):
+    _wait()
+    return _title('STUB{}'.format(lr_uprn))
+
+
+def get_title_register(title_number):
+    _wait()
+    return _title(title_number)
+
+
+def get_title_registers(title_numbers):
+    _wait()
+    return [_title(title_number) for title_number in title_numbers]
+
+
+def get_official_copy_data(title_number):
+    _wait()
+    return _title(title_number)
+
+
+def get_properties_for_address(address, page_size, page_number):
+    _wait()
+    hits = AttrList([StubAddressHit('STUB{}'.format(i), '{} {}'.format(i, address)) for i in range(page_size)])
+    hits.total = page_size
+    return hits
+
+
+def user_can_view(user_id, title_number):
+    _wait()
+    return True
+
+
+def get_price(product):
+    _wait()
+    return 300
+
+
+def save_user_search_details(params):
+    _wait()
+    return 'stubcart{}'.format(params.get('MC_titleNumber', ''))
+
+
+def get_address_suggestions(text, size):
+    _wait()
+    return [{'title_number': 'STUB{}'.format(i), 'address': '{} {} STUB STREET'.format(i, text.upper())}
+            for i in range(size)]
+
+
+api_client.get_titles_by_postcode = get_titles_by_postcode
+db_access.get_mapped_lruprn = get_mapped_lruprn
+db_access.get_title_number_and_register_data = get_title_number_and_register_data
+db_access.get_title_register = get_title_register
+db_access.get_title_registers = get_title_registers
+db_access.get_official_copy_data = get_official_copy_data
+db_access.user_can_view = user_can_view
+db_access.get_price = get_price
+db_access.save_user_search_details = save_user_search_details
+es_access.get_properties_for_address = get_properties_for_address
+es_access.get_address_suggestions = get_address_suggestions
@@ -0,0 +1,52 @@
+#!/usr/bin/env python3
+"""
+Compares fetching a large leasehold title's whole official copy with fetching one of its sub-registers.
+
+Inserts temporary titles (numbers starting with 'BENCH-') into the database configured in the environment,
+reads them through db_access.get_official_copy_data, then deletes them. Run from the top-level directory,
+after sourcing environment.sh:
+
+    python benchmarks/sub_register_benchmark.py --entries 2000 --requests 200
+"""
+import argparse
+import json
+import time
+
+from benchmarks.db_driver_benchmark import make_title, TITLE_PREFIX, TITLES
+from service import app, db, db_access
+
+
+def benchmark(name, sub_register_names, args):
+    title_number = '{}0'.format(TITLE_PREFIX)
+    db_access.get_official_copy_data(title_number, sub_register_names)  # warm up
+    wall_start, cpu_start = time.time(), time.process_time()
+    for _ in range(args.requests):
+        title = db_access.get_official_copy_data(title_number, sub_register_names)
+        db.session.remove()
+    wall, cpu = time.time() - wall_start, time.process_time() - cpu_start
+
+    size = len(json.dumps(title.official_copy_data))
+    print('{:<16} {:>10} bytes {:>8.2f} ms CPU/request {:>8.2f} ms wall/request'.format(
+        name, size, 1000 * cpu / args.requests, 1000 * wall / args.requests))
+
+
+def _parse_command_line_args():
+    parser = argparse.ArgumentParser(description='Compares whole official copies with single sub-registers')
+    parser.add_argument('-e', '--entries', type=int, default=2000, help='Register entries per sub-register')
+    parser.add_argument('-r', '--requests', type=int, default=100, help='Requests per case')
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    args = _parse_command_line_args()
+    with app.app_context():
+        engine = db.get_engine(app)
+        with engine.begin() as connection:
+            connection.execute(TITLES.delete().where(TITLES.c.title_number.startswith(TITLE_PREFIX)))
+            connection.execute(TITLES.insert(), [make_title(0, args.entries)])
+        try:
+            benchmark('all sub-registers', None, args)
+            benchmark('sub-register A', ['A'], args)
+        finally:
+            with engine.begin() as connection:
+                connection.execute(TITLES.delete().where(TITLES.c.title_number.startswith(TITLE_PREFIX)))
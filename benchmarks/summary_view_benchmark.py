@@ -0,0 +1,53 @@
+#!/usr/bin/env python3
+"""
+Compares the titles of a search results page in the full view (register_data) and the summary view.
+
+Inserts temporary titles (numbers starting with 'BENCH-') into the database configured in the environment,
+reads a page of them through db_access, then deletes them. Run from the top-level directory, after sourcing
+environment.sh:
+
+    python benchmarks/summary_view_benchmark.py --entries 500 --requests 100
+"""
+import argparse
+import json
+import time
+
+from benchmarks.db_driver_benchmark import make_title, TITLE_PREFIX, TITLES
+from service import app, db, db_access
+
+
+def benchmark(name, get_titles, get_data, title_numbers, args):
+    get_titles(title_numbers)  # warm up
+    db.session.remove()
+    wall_start, cpu_start = time.time(), time.process_time()
+    for _ in range(args.requests):
+        titles = get_titles(title_numbers)
+        db.session.remove()
+    wall, cpu = time.time() - wall_start, time.process_time() - cpu_start
+
+    size = len(json.dumps([get_data(title) for title in titles]))
+    print('{:<8} {:>10} bytes {:>8.2f} ms CPU/page {:>8.2f} ms wall/page'.format(
+        name, size, 1000 * cpu / args.requests, 1000 * wall / args.requests))
+
+
+def _parse_command_line_args():
+    parser = argparse.ArgumentParser(description='Compares full and summary search results pages')
+    parser.add_argument('-e', '--entries', type=int, default=500, help='Register entries per title')
+    parser.add_argument('-r', '--requests', type=int, default=50, help='Pages read in each view')
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    args = _parse_command_line_args()
+    with app.app_context():
+        title_numbers = ['{}{}'.format(TITLE_PREFIX, i) for i in range(app.config['SEARCH_RESULTS_PER_PAGE'])]
+        engine = db.get_engine(app)
+        with engine.begin() as connection:
+            connection.execute(TITLES.delete().where(TITLES.c.title_number.startswith(TITLE_PREFIX)))
+            connection.execute(TITLES.insert(), [make_title(i, args.entries) for i in range(len(title_numbers))])
+        try:
+            benchmark('full', db_access.get_title_registers, lambda title: title.register_data, title_numbers, args)
+            benchmark('summary', db_access.get_title_summaries, lambda title: title.title_summary, title_numbers, args)
+        finally:
+            with engine.begin() as connection:
+                connection.execute(TITLES.delete().where(TITLES.c.title_number.startswith(TITLE_PREFIX)))
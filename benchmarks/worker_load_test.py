@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""
+Compares requests per second of a single gunicorn worker of each class against the stub app,
+whose dependencies answer after an injected delay.
+
+Run from the top-level directory, after sourcing environment.sh:
+
+    python benchmarks/worker_load_test.py --latency-ms 20 --clients 50 --duration 20
+"""
+import argparse
+import os
+import subprocess
+import threading
+import time
+import urllib.request
+
+DEFAULT_PATH = '/title_search_postcode/SW112DR'
+
+
+def run_load(url, clients, duration):
+    """Keeps 'clients' requests in flight for 'duration' seconds; returns (completed, errors)"""
+    deadline = time.time() + duration
+    counts = {'completed': 0, 'errors': 0}
+    lock = threading.Lock()
+
+    def client():
+        while time.time() < deadline:
+            try:
+                with urllib.request.urlopen(url, timeout=60) as response:
+                    response.read()
+                outcome = 'completed'
+            except Exception:
+                outcome = 'errors'
+            # Requests still queued when time is up would otherwise be credited to the run
+            if time.time() <= deadline:
+                with lock:
+                    counts[outcome] += 1
+
+    threads = [threading.Thread(target=client) for _ in range(clients)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    return counts['completed'], counts['errors']
+
+
+def benchmark_worker_class(worker_class, args):
+    env = dict(
+        os.environ,
+        GUNICORN_WORKER_CLASS=worker_class,
+        STUB_DEPENDENCY_LATENCY_MS=str(args.latency_ms),
+        STUB_ADDRESSES_PER_PAGE=str(args.addresses),
+    )
+    bind = '127.0.0.1:{}'.format(args.port)
+    server = subprocess.Popen(
+        ['gunicorn', '-w', '1', '-k', worker_class, '-b', bind, '--timeout', '120', 'benchmarks.stub_app:app'],
+        env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+
+    try:
+        url = 'http://{}{}'.format(bind, args.path)
+        _wait_until_up(url)
+        completed, errors = run_load(url, args.clients, args.duration)
+    finally:
+        server.terminate()
+        server.wait()
+
+    return completed / args.duration, errors
+
+
+def _wait_until_up(url, timeout=30):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            urllib.request.urlopen(url, timeout=5).read()
+            return
+        except Exception:
+            time.sleep(0.2)
+    raise Exception('Server did not start in time')
+
+
+def _parse_command_line_args():
+    parser = argparse.ArgumentParser(description='Compares gunicorn worker classes under injected dependency latency')
+    parser.add_argument('-k', '--worker-classes', default='sync,gevent', help='Comma-separated worker classes')
+    parser.add_argument('-l', '--latency-ms', type=int, default=20, help='Delay of every dependency call')
+    parser.add_argument('-a', '--addresses', type=int, default=20, help='Addresses per postcode page')
+    parser.add_argument('-c', '--clients', type=int, default=50, help='Concurrent clients')
+    parser.add_argument('-d', '--duration', type=int, default=20, help='Seconds of load per worker class')
+    parser.add_argument('-p', '--port', type=int, default=8765, help='Port to run gunicorn on')
+    parser.add_argument('--path', default=DEFAULT_PATH, help='Path to request')
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    args = _parse_command_line_args()
+    print('latency={}ms addresses={} clients={} duration={}s path={}'.format(
+        args.latency_ms, args.addresses, args.clients, args.duration, args.path))
+
+    for worker_class in args.worker_classes.split(','):
+        rps, errors = benchmark_worker_class(worker_class, args)
+        print('{:<8} {:>8.1f} requests/s per worker, {} errors'.format(worker_class, rps, errors))
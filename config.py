@@ -1,5 +1,8 @@
 import os
-from typing import Dict, Union
+import tempfile
+from typing import Any, Dict
+
+SUPPORTED_DB_DRIVERS = ('pg8000', 'psycopg2')
 
 user = os.environ['POSTGRES_USER']
 password = os.environ['POSTGRES_PASSWORD']
@@ -8,8 +11,22 @@ port = os.environ['POSTGRES_PORT']
 database = os.environ['POSTGRES_DB']
 max_number = int(os.environ['MAX_NUMBER_SEARCH_RESULTS'])
 search_results = int(os.environ['SEARCH_RESULTS_PER_PAGE'])
-db_uri_template = 'postgresql+pg8000://{0}:{1}@{2}:{3}/{4}'
-sql_alchemy_uri = db_uri_template.format(user, password, host, port, database)
+db_driver = os.getenv('POSTGRES_DRIVER', 'pg8000')                    # 'pg8000' (pure Python) or 'psycopg2' (C).
+if db_driver not in SUPPORTED_DB_DRIVERS:
+    raise Exception('Unsupported POSTGRES_DRIVER: {}. Expected one of {}'.format(db_driver, SUPPORTED_DB_DRIVERS))
+db_uri_template = 'postgresql+{0}://{1}:{2}@{3}:{4}/{5}'
+sql_alchemy_uri = db_uri_template.format(db_driver, user, password, host, port, database)
+db_pool_size = int(os.getenv('POSTGRES_POOL_SIZE', '5'))              # Connections kept open per worker.
+db_max_overflow = int(os.getenv('POSTGRES_MAX_OVERFLOW', '10'))       # Extra connections opened under load.
+db_pool_timeout = int(os.getenv('POSTGRES_POOL_TIMEOUT', '30'))       # Seconds to wait for a free connection.
+db_pool_recycle = int(os.getenv('POSTGRES_POOL_RECYCLE', '3600'))     # Seconds before a connection is replaced.
+db_pool_pre_ping = os.getenv('POSTGRES_POOL_PRE_PING', 'true').lower() == 'true'
+db_pool_warm_up = int(os.getenv('POSTGRES_POOL_WARM_UP', '0'))        # Connections opened when a worker starts.
+# Read-only queries go to these replicas while they're healthy (see service/read_replicas.py). Comma-separated
+# URIs in the form of sql_alchemy_uri, with the same driver; none by default.
+db_replica_uris = [uri.strip() for uri in os.getenv('POSTGRES_REPLICA_URIS', '').split(',') if uri.strip()]
+db_replica_max_lag_seconds = float(os.getenv('POSTGRES_REPLICA_MAX_LAG_SECONDS', '5'))  # Replicas further behind...
+db_replica_check_seconds = float(os.getenv('POSTGRES_REPLICA_CHECK_SECONDS', '2'))      # ...checked this often.
 logging_config_file_path = os.environ['LOGGING_CONFIG_FILE_PATH']
 fault_log_file_path = os.environ['FAULT_LOG_FILE_PATH']
 elasticsearch_endpoint_uri = os.environ['ELASTICSEARCH_ENDPOINT_URI']
@@ -17,21 +34,80 @@ elasticsearch_index_name = os.environ['ELASTICSEARCH_INDEX_NAME']
 postcode_search_doc_type = os.environ['POSTCODE_SEARCH_DOC_TYPE']
 address_search_doc_type = os.environ['ADDRESS_SEARCH_DOC_TYPE']
 address_search_api_url = os.environ['ADDRESS_SEARCH_API']
+address_search_api_timeout = float(os.getenv('ADDRESS_SEARCH_API_TIMEOUT', '10'))  # Seconds.
+address_suggestion_index_name = os.getenv('ADDRESS_SUGGESTION_INDEX_NAME', 'address_suggestions')  # An alias.
+address_suggestion_timeout_ms = int(os.getenv('ADDRESS_SUGGESTION_TIMEOUT_MS', '40'))  # Gives up after this.
+max_address_suggestions = int(os.getenv('MAX_ADDRESS_SUGGESTIONS', '10'))
+max_batch_postcodes = int(os.getenv('MAX_BATCH_POSTCODES', '50'))  # Per POST /title_search_postcode/batch.
 nominal_price = os.getenv('NOMINAL_PRICE', '300')                     # Nominal price, in pence.
 view_window_time = os.getenv('VIEW_WINDOW_TIME', '60')                # Viewing access duration, in minutes.
 logger_level = os.getenv('LOGGING_LEVEL', 'WARN')
+log_requests = os.getenv('LOG_REQUESTS', 'false').lower() == 'true'   # A line per request, e.g. for replay_traffic.py.
+worker_class = os.getenv('GUNICORN_WORKER_CLASS', 'sync')            # 'sync' or 'gevent'.
+preload_app = os.getenv('GUNICORN_PRELOAD_APP', 'false').lower() == 'true'
+lookup_pool_size = int(os.getenv('LOOKUP_POOL_SIZE', '10'))           # Concurrent lookups per request.
+# Circuit breakers (see service/circuit_breaker.py), one per dependency
+circuit_breaker_window_size = int(os.getenv('CIRCUIT_BREAKER_WINDOW_SIZE', '20'))      # Recent calls considered.
+circuit_breaker_minimum_calls = int(os.getenv('CIRCUIT_BREAKER_MINIMUM_CALLS', '10'))  # Before it may open.
+circuit_breaker_failure_rate = float(os.getenv('CIRCUIT_BREAKER_FAILURE_RATE', '0.5'))  # Opens at this rate...
+circuit_breaker_slow_call_ms = int(os.getenv('CIRCUIT_BREAKER_SLOW_CALL_MS', '3000'))
+circuit_breaker_slow_call_rate = float(os.getenv('CIRCUIT_BREAKER_SLOW_CALL_RATE', '0.8'))  # ...or of slow calls.
+circuit_breaker_open_seconds = int(os.getenv('CIRCUIT_BREAKER_OPEN_SECONDS', '30'))    # Before probing again.
+circuit_breaker_half_open_calls = int(os.getenv('CIRCUIT_BREAKER_HALF_OPEN_CALLS', '3'))  # Probes to close.
+# Admission control (see service/admission.py). Limits are per route, e.g. 'get_titles_for_address:4'.
+admission_limits = {route: int(limit) for route, limit in (
+    item.split(':') for item in os.getenv(
+        'ADMISSION_LIMITS',
+        'get_properties_for_postcode:4,get_titles_for_address:4,get_properties_for_postcodes:2'
+    ).split(',') if item)}
+admission_max_queue_ms = int(os.getenv('ADMISSION_MAX_QUEUE_MS', '1000'))  # Shed after queueing this long.
+admission_lock_dir = os.getenv('ADMISSION_LOCK_DIR', os.path.join(tempfile.gettempdir(), 'digital-register-api-admission'))
+# Group commit of user search audit records (see service/audit_writer.py); helps gevent workers only
+audit_group_commit = os.getenv('AUDIT_GROUP_COMMIT', 'false').lower() == 'true'
+audit_group_commit_max_wait_ms = int(os.getenv('AUDIT_GROUP_COMMIT_MAX_WAIT_MS', '5'))  # Per batch.
+audit_group_commit_max_batch = int(os.getenv('AUDIT_GROUP_COMMIT_MAX_BATCH', '100'))     # Records per batch.
+# Monthly partitions of user_search_and_results (see service/audit_partitions.py)
+audit_partitions_ahead = int(os.getenv('AUDIT_PARTITIONS_AHEAD', '3'))          # Months created in advance.
+audit_retention_months = int(os.getenv('AUDIT_RETENTION_MONTHS', '24'))         # Older months are archived.
+audit_archive_dir = os.getenv('AUDIT_ARCHIVE_DIR', 'audit_archive')
+compressed_body_cache_size = int(os.getenv('COMPRESSED_BODY_CACHE_SIZE', '1000'))  # Compressed titles kept per worker.
+# The gunicorn master fills the cache of compressed titles with the most searched ones before forking the
+# workers (see service/cache_warmup.py). Needs GUNICORN_PRELOAD_APP. Off when 0.
+cache_warm_up_titles = int(os.getenv('CACHE_WARM_UP_TITLES', '0'))
+cache_warm_up_window_hours = int(os.getenv('CACHE_WARM_UP_WINDOW_HOURS', '24'))  # Searches counted.
+json_encoder = os.getenv('JSON_ENCODER', 'auto')  # 'auto', 'json' or 'orjson' (see service/json_encoding.py).
 
 QUEUE_DICT = {
     'OUTGOING_QUEUE': os.environ.get('OUTGOING_QUEUE', 'legacy_transmission_queue'),
     'OUTGOING_QUEUE_HOSTNAME': os.environ.get('OUTGOING_QUEUE_HOSTNAME', 'localhost'),
     'OUTGOING_QUEUE_USERID': os.environ.get('OUTGOING_QUEUE_USERID', "guest"),
     'OUTGOING_QUEUE_PASSWORD': os.environ.get('OUTGOING_QUEUE_PASSWORD', "guest"),
+    # Spools messages on local disk and publishes them in the background (see service/transmission_spool.py).
+    # Must be a directory that survives a restart; off when empty.
+    'LEGACY_SPOOL_DIR': os.environ.get('LEGACY_SPOOL_DIR', ''),
+    'LEGACY_SPOOL_BATCH_SIZE': int(os.environ.get('LEGACY_SPOOL_BATCH_SIZE', '100')),            # Messages per batch.
+    'LEGACY_SPOOL_CONFIRM_TIMEOUT': float(os.environ.get('LEGACY_SPOOL_CONFIRM_TIMEOUT', '10')),  # Seconds per batch.
+    'LEGACY_SPOOL_SEGMENT_BYTES': int(os.environ.get('LEGACY_SPOOL_SEGMENT_BYTES', str(64 * 1024 * 1024))),
+    # 'legacy', 'json' or 'msgpack' (see service/message_codec.py). Keep 'legacy' until the consumer reads the others.
+    'LEGACY_MESSAGE_CODEC': os.environ.get('LEGACY_MESSAGE_CODEC', 'legacy'),
+    'LEGACY_MESSAGE_COMPRESS_MIN_BYTES': int(os.environ.get('LEGACY_MESSAGE_COMPRESS_MIN_BYTES', '1024')),
 }
 
 CONFIG_DICT = {
     'DEBUG': False,
     'LOGGING': True,
     'SQLALCHEMY_DATABASE_URI': sql_alchemy_uri,
+    'DB_DRIVER': db_driver,
+    'SQLALCHEMY_POOL_SIZE': db_pool_size,
+    'SQLALCHEMY_MAX_OVERFLOW': db_max_overflow,
+    'SQLALCHEMY_POOL_TIMEOUT': db_pool_timeout,
+    'SQLALCHEMY_POOL_RECYCLE': db_pool_recycle,
+    'DB_POOL_PRE_PING': db_pool_pre_ping,
+    'DB_POOL_WARM_UP': db_pool_warm_up,
+    # Each replica is a Flask-SQLAlchemy bind with no tables of its own
+    'SQLALCHEMY_BINDS': {'replica{}'.format(number): uri for number, uri in enumerate(db_replica_uris, 1)},
+    'DB_REPLICA_MAX_LAG_SECONDS': db_replica_max_lag_seconds,
+    'DB_REPLICA_CHECK_SECONDS': db_replica_check_seconds,
     'LOGGING_CONFIG_FILE_PATH': logging_config_file_path,
     'FAULT_LOG_FILE_PATH': fault_log_file_path,
     'ELASTICSEARCH_ENDPOINT_URI': elasticsearch_endpoint_uri,
@@ -41,10 +117,40 @@ CONFIG_DICT = {
     'POSTCODE_SEARCH_DOC_TYPE': postcode_search_doc_type,
     'ADDRESS_SEARCH_DOC_TYPE': address_search_doc_type,
     'ADDRESS_SEARCH_API': address_search_api_url,
+    'ADDRESS_SEARCH_API_TIMEOUT': address_search_api_timeout,
+    'ADDRESS_SUGGESTION_INDEX_NAME': address_suggestion_index_name,
+    'ADDRESS_SUGGESTION_TIMEOUT_MS': address_suggestion_timeout_ms,
+    'MAX_ADDRESS_SUGGESTIONS': max_address_suggestions,
+    'MAX_BATCH_POSTCODES': max_batch_postcodes,
     'NOMINAL_PRICE': nominal_price,
     'VIEW_WINDOW_TIME': view_window_time,
     'LOGGING_LEVEL': logger_level,
-}  # type: Dict[str, Union[bool, str, int]]
+    'LOG_REQUESTS': log_requests,
+    'WORKER_CLASS': worker_class,
+    'GUNICORN_PRELOAD_APP': preload_app,
+    'LOOKUP_POOL_SIZE': lookup_pool_size,
+    'COMPRESSED_BODY_CACHE_SIZE': compressed_body_cache_size,
+    'CACHE_WARM_UP_TITLES': cache_warm_up_titles,
+    'CACHE_WARM_UP_WINDOW_HOURS': cache_warm_up_window_hours,
+    'JSON_ENCODER': json_encoder,
+    'AUDIT_GROUP_COMMIT': audit_group_commit,
+    'AUDIT_GROUP_COMMIT_MAX_WAIT_MS': audit_group_commit_max_wait_ms,
+    'AUDIT_GROUP_COMMIT_MAX_BATCH': audit_group_commit_max_batch,
+    'AUDIT_PARTITIONS_AHEAD': audit_partitions_ahead,
+    'AUDIT_RETENTION_MONTHS': audit_retention_months,
+    'AUDIT_ARCHIVE_DIR': audit_archive_dir,
+    'ADMISSION_LIMITS': admission_limits,
+    'ADMISSION_MAX_QUEUE_MS': admission_max_queue_ms,
+    'ADMISSION_LOCK_DIR': admission_lock_dir,
+    'ADMISSION_EXEMPT_ROUTES': ('health_check', 'get_metrics'),
+    'CIRCUIT_BREAKER_WINDOW_SIZE': circuit_breaker_window_size,
+    'CIRCUIT_BREAKER_MINIMUM_CALLS': circuit_breaker_minimum_calls,
+    'CIRCUIT_BREAKER_FAILURE_RATE': circuit_breaker_failure_rate,
+    'CIRCUIT_BREAKER_SLOW_CALL_MS': circuit_breaker_slow_call_ms,
+    'CIRCUIT_BREAKER_SLOW_CALL_RATE': circuit_breaker_slow_call_rate,
+    'CIRCUIT_BREAKER_OPEN_SECONDS': circuit_breaker_open_seconds,
+    'CIRCUIT_BREAKER_HALF_OPEN_CALLS': circuit_breaker_half_open_calls,
+}  # type: Dict[str, Any]
 
 settings = os.environ.get('SETTINGS')
 
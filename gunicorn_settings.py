@@ -1,4 +1,22 @@
 import logging
+import os
+from config import CONFIG_DICT, QUEUE_DICT
+
+# With 'gevent', blocking calls to Postgres, Elasticsearch, the address-search-api and RabbitMQ
+# yield to other requests instead of holding the worker (requires gevent to be installed).
+worker_class = CONFIG_DICT['WORKER_CLASS']
+
+# Loads the application once in the master, so that workers share its memory and start faster.
+# Anything a worker must not share with the master is re-created in post_fork.
+preload_app = CONFIG_DICT['GUNICORN_PRELOAD_APP']
+
+if worker_class == 'gevent':
+    worker_connections = int(os.getenv('GUNICORN_WORKER_CONNECTIONS', '100'))
+    if preload_app:
+        # The app is imported before the workers patch themselves, so it has to be patched in the master
+        from gevent import monkey  # type: ignore
+        monkey.patch_all()
+
 from service import logging_config
 
 logging_config.setup_logging()
@@ -16,8 +34,40 @@ def on_reload(server):
 
 
 def when_ready(server):
+    if CONFIG_DICT['CACHE_WARM_UP_TITLES']:
+        _warm_up_cache()
     LOGGER.info("Server is ready")
 
 
+def post_fork(server, worker):
+    import service
+    service.reinitialise_after_fork()
+
+
+def post_worker_init(worker):
+    # Runs after gevent has patched the worker (which happens after post_fork), so the new connections cooperate
+    from service import app, db, db_pool
+    db_pool.warm_up(db.get_engine(app), CONFIG_DICT['DB_POOL_WARM_UP'])
+    if QUEUE_DICT['LEGACY_SPOOL_DIR']:
+        # Publishes what was spooled before a restart without waiting for the next message
+        from service import legacy_transmission_queue
+        legacy_transmission_queue.start_spool_publisher()
+    worker.log.info('Worker ready (pid: {})'.format(worker.pid))
+
+
+def _warm_up_cache():
+    # Done once, in the master before it forks the workers, which are each given a copy of the warmed cache.
+    # Without preloading, the workers load the application (and its cache) afresh.
+    if not preload_app:
+        LOGGER.warning('Cache warm-up needs GUNICORN_PRELOAD_APP=true, so it has been skipped')
+        return
+    from service import app, cache_warmup
+    try:
+        cache_warmup.warm_up(app, CONFIG_DICT['CACHE_WARM_UP_TITLES'], CONFIG_DICT['CACHE_WARM_UP_WINDOW_HOURS'])
+    except Exception as e:
+        # A cold cache only makes the first requests slower, so it mustn't stop the server
+        LOGGER.warning('Cache warm-up failed: {}'.format(e))
+
+
 def on_exit(server):
     LOGGER.info("Stopping the server")
@@ -0,0 +1,134 @@
+import csv
+import gzip
+import os
+import tempfile
+import threading
+from datetime import date, datetime, timedelta
+from sqlalchemy import event, text
+from service import app, audit_partitions, db, db_access
+
+INSERT_SEARCH_QUERY = text(
+    "INSERT INTO user_search_and_results (search_datetime, user_id, title_number, search_type, purchase_type, "
+    "amount, cart_id, lro_trans_ref, viewed_datetime, valid) "
+    "VALUES (:search_datetime, :user_id, :title_number, 'D', 'drvSummary', '300', 'cart', NULL, :viewed_datetime, true)"
+)
+TEST_MONTHS = [date(2020, 1, 1)] + [date(2031, month, 1) for month in range(1, 5)]
+
+
+class TestAuditPartitions:
+
+    def setup_method(self, method):
+        self.app_context = app.app_context()
+        self.app_context.push()
+        self.engine = db.get_engine(app)
+        self._drop_test_partitions()
+
+    def teardown_method(self, method):
+        self._drop_test_partitions()
+        with self.engine.begin() as connection:
+            connection.execute("DELETE FROM user_search_and_results WHERE user_id = 'partition-test'")
+        self.app_context.pop()
+
+    def test_create_partitions_creates_the_coming_months_and_moves_their_rows_out_of_the_default(self):
+        self._insert_search(datetime(2031, 2, 14, 9, 30))
+
+        created = audit_partitions.create_partitions(self.engine, months_ahead=3, today=date(2031, 1, 20))
+
+        assert created == ['user_search_and_results_y2031m01', 'user_search_and_results_y2031m02',
+                           'user_search_and_results_y2031m03', 'user_search_and_results_y2031m04']
+        assert self._get_partition_of_search(datetime(2031, 2, 14, 9, 30)) == 'user_search_and_results_y2031m02'
+        assert audit_partitions.create_partitions(self.engine, months_ahead=3, today=date(2031, 1, 20)) == []
+
+    def test_create_partitions_keeps_the_current_months_rows_inserted_while_it_runs(self):
+        self._insert_search(datetime(2031, 1, 20, 8, 0))
+        inserts = []
+
+        def insert_after_the_move(connection, statement, *args):
+            # A search saved once the month's rows have been moved out of the default partition
+            if str(statement).startswith('DELETE FROM {}'.format(audit_partitions.DEFAULT_PARTITION)) and not inserts:
+                inserts.append(threading.Thread(target=self._insert_search, args=(datetime(2031, 1, 20, 9, 0),)))
+                inserts[0].start()
+                inserts[0].join(timeout=1)
+
+        event.listen(self.engine, 'after_execute', insert_after_the_move)
+        try:
+            created = audit_partitions.create_partitions(self.engine, months_ahead=0, today=date(2031, 1, 20))
+        finally:
+            event.remove(self.engine, 'after_execute', insert_after_the_move)
+        inserts[0].join(timeout=5)
+
+        assert created == ['user_search_and_results_y2031m01']
+        assert self._get_partition_of_search(datetime(2031, 1, 20, 8, 0)) == 'user_search_and_results_y2031m01'
+        assert self._get_partition_of_search(datetime(2031, 1, 20, 9, 0)) == 'user_search_and_results_y2031m01'
+
+    def test_archive_partitions_archives_and_drops_months_older_than_the_retention_period(self):
+        audit_partitions.create_partitions(self.engine, months_ahead=0, today=date(2020, 1, 1))
+        for day in range(1, 4):
+            self._insert_search(datetime(2020, 1, day, 12, 0))
+        archive_dir = tempfile.mkdtemp()
+
+        paths = audit_partitions.archive_partitions(self.engine, keep_months=1, archive_dir=archive_dir,
+                                                    batch_size=2, today=date(2020, 3, 1))
+
+        assert paths == [os.path.join(archive_dir, 'user_search_and_results_y2020m01.csv.gz')]
+        with gzip.open(paths[0], 'rt', newline='') as archive:
+            rows = list(csv.reader(archive))
+        assert rows[0] == list(audit_partitions.COLUMNS)
+        assert [row[0] for row in rows[1:]] == ['2020-01-01 12:00:00', '2020-01-02 12:00:00', '2020-01-03 12:00:00']
+        assert 'user_search_and_results_y2020m01' not in self._get_tables()
+
+    def test_user_can_view_returns_true_for_a_recent_search_viewed_within_the_window(self):
+        now = datetime.now()
+        self._insert_search(now - timedelta(minutes=5), viewed_datetime=now - timedelta(minutes=1))
+        assert db_access.user_can_view('partition-test', 'TITLE1') is True
+
+    def test_user_can_view_returns_true_for_an_old_search_first_viewed_within_the_window(self):
+        now = datetime.now()
+        self._insert_search(now - timedelta(days=60), viewed_datetime=now - timedelta(minutes=1))
+        assert db_access.user_can_view('partition-test', 'TITLE1') is True
+
+    def test_get_most_searched_title_numbers_ranks_the_titles_searched_since_the_given_time(self):
+        self._insert_search(datetime(2030, 12, 31, 9, 0), title_number='TITLE3')
+        for minute, title_number in enumerate(['TITLE1', 'TITLE2', 'TITLE1', 'TITLE3', 'TITLE1', 'TITLE2']):
+            self._insert_search(datetime(2031, 1, 1, 9, minute), title_number=title_number)
+
+        searches, ranked = db_access.get_most_searched_title_numbers(datetime(2031, 1, 1), 2)
+
+        assert searches == 6
+        assert ranked == [('TITLE1', 3), ('TITLE2', 2)]
+
+    def test_searches_bounded_by_search_datetime_only_read_the_partitions_of_those_months(self):
+        audit_partitions.create_partitions(self.engine, months_ahead=0, today=date(2020, 1, 1))
+        query = "EXPLAIN SELECT * FROM user_search_and_results WHERE user_id = 'partition-test' {}"
+
+        with self.engine.connect() as connection:
+            unbounded_plan = self._get_plan(connection, query.format(''))
+            bounded_plan = self._get_plan(connection, query.format('AND search_datetime >= :earliest'),
+                                          earliest=datetime.now() - timedelta(days=7))
+
+        assert 'user_search_and_results_y2020m01' in unbounded_plan
+        assert 'user_search_and_results_y2020m01' not in bounded_plan
+
+    def _get_plan(self, connection, query, **params):
+        return '\n'.join(row[0] for row in connection.execute(text(query), **params))
+
+    def _insert_search(self, search_datetime, viewed_datetime=None, title_number='TITLE1'):
+        with self.engine.begin() as connection:
+            connection.execute(INSERT_SEARCH_QUERY, search_datetime=search_datetime, user_id='partition-test',
+                               title_number=title_number, viewed_datetime=viewed_datetime)
+
+    def _get_partition_of_search(self, search_datetime):
+        with self.engine.connect() as connection:
+            return connection.execute(
+                text('SELECT tableoid::regclass::text FROM user_search_and_results WHERE search_datetime = :value'),
+                value=search_datetime,
+            ).scalar()
+
+    def _get_tables(self):
+        with self.engine.connect() as connection:
+            return {row[0] for row in connection.execute("SELECT tablename FROM pg_tables")}
+
+    def _drop_test_partitions(self):
+        with self.engine.begin() as connection:
+            for month in TEST_MONTHS:
+                connection.execute('DROP TABLE IF EXISTS {}'.format(audit_partitions.get_partition_name(month)))
@@ -0,0 +1,76 @@
+import threading
+from datetime import datetime, timedelta
+from sqlalchemy.exc import DBAPIError
+from service import app, audit_writer, db, metrics
+from service.models import UserSearchAndResults
+
+TABLE = UserSearchAndResults.__table__
+SEARCH_DATETIME = datetime(2016, 4, 1, 12, 0, 0)
+
+
+class TestAuditWriter:
+
+    def setup_method(self, method):
+        self.app_context = app.app_context()
+        self.app_context.push()
+        self.engine = db.get_engine(app)
+        self._delete_test_records()
+        metrics.reset()
+
+    def teardown_method(self, method):
+        self._delete_test_records()
+        self.app_context.pop()
+
+    def test_concurrent_records_are_committed_together(self):
+        writer = audit_writer.GroupCommitWriter(self.engine, TABLE, max_batch_size=10, max_wait_ms=200)
+
+        threads = [threading.Thread(target=writer.write, args=(self._make_record(number),)) for number in range(5)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert self._count_test_records() == 5
+        batch_sizes = metrics.snapshot()['timings']['audit_writer.batch_size']
+        assert batch_sizes['max'] > 1
+
+    def test_write_raises_for_a_bad_record_without_failing_the_rest_of_its_batch(self):
+        writer = audit_writer.GroupCommitWriter(self.engine, TABLE, max_batch_size=10, max_wait_ms=200)
+        writer.write(self._make_record(0))
+        errors = []
+
+        def write(record):
+            try:
+                writer.write(record)
+            except DBAPIError as e:
+                errors.append(e)
+
+        # The first record has the same key as the one already written
+        threads = [threading.Thread(target=write, args=(self._make_record(number),)) for number in range(3)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert len(errors) == 1
+        assert self._count_test_records() == 3
+
+    def test_write_returns_once_the_record_is_committed(self):
+        writer = audit_writer.GroupCommitWriter(self.engine, TABLE, max_batch_size=10, max_wait_ms=1)
+        writer.write(self._make_record(0))
+        assert self._count_test_records() == 1
+
+    def _make_record(self, number):
+        return dict(
+            search_datetime=SEARCH_DATETIME + timedelta(seconds=number), user_id='audit-test', title_number='TITLE1',
+            search_type='D', purchase_type='drvSummary', amount=300, cart_id='cart', viewed_datetime=None,
+            lro_trans_ref=None, valid=False,
+        )
+
+    def _count_test_records(self):
+        with self.engine.connect() as connection:
+            return connection.execute(TABLE.count().where(TABLE.c.user_id == 'audit-test')).scalar()
+
+    def _delete_test_records(self):
+        with self.engine.begin() as connection:
+            connection.execute(TABLE.delete().where(TABLE.c.user_id == 'audit-test'))
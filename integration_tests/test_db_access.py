@@ -3,7 +3,7 @@ import json
 import pg8000
 import re
 from config import CONFIG_DICT
-from service import db_access
+from service import app, db, db_access
 
 INSERT_TITLE_QUERY_FORMAT = (
     'insert into title_register_data('
@@ -15,6 +15,8 @@ INSERT_TITLE_QUERY_FORMAT = (
 )
 
 DELETE_ALL_TITLES_QUERY = 'delete from title_register_data;'
+INSERT_UPRN_MAPPING_QUERY = 'insert into uprn_mapping(uprn, lr_uprn) values(%s, %s)'
+DELETE_TEST_UPRN_MAPPINGS_QUERY = "delete from uprn_mapping where uprn like 'TEST%%'"
 
 
 def _get_db_connection_params():
@@ -40,10 +42,13 @@ DB_CONNECTION_PARAMS = _get_db_connection_params()
 class TestDbAccess:
 
     def setup_method(self, method):
+        self.app_context = app.app_context()
+        self.app_context.push()
         self.connection = self._connect_to_db()
         self._delete_all_titles()
 
     def teardown_method(self, method):
+        self.app_context.pop()
         try:
             self.connection.close()
         except (pg8000.InterfaceError):
@@ -75,10 +80,41 @@ class TestDbAccess:
         assert title.title_number == title_number
         assert title.register_data == register_data
         assert title.geometry_data == geometry_data
-        assert title.is_deleted == is_deleted
         assert title.last_modified.timestamp() == last_modified.timestamp()
-        assert title.official_copy_data == official_copy_data
-        assert title.lr_uprns == lr_uprns
+
+    def test_get_price_returns_none_for_an_unknown_product(self):
+        assert db_access.get_price('no-such-product') is None
+
+    def test_get_title_version_returns_the_title_number_and_last_modified_only(self):
+        last_modified = datetime(2015, 9, 10, 12, 34, 56, 123)
+        self._create_title('title123', {'register': 'data1'}, last_modified=last_modified)
+
+        title = db_access.get_title_version('title123')
+        assert title._fields == ('title_number', 'last_modified')
+        assert title.title_number == 'title123'
+        assert title.last_modified.timestamp() == last_modified.timestamp()
+
+    def test_get_title_version_returns_none_when_title_marked_as_deleted(self):
+        self._create_title('title123', is_deleted=True)
+        assert db_access.get_title_version('title123') is None
+
+    def test_get_official_copy_data_returns_only_the_requested_sub_registers_in_order(self):
+        sub_registers = [{'A': ['property']}, {'B': ['proprietorship']}, {'C': ['charges']}]
+        self._create_title('title123', official_copy_data={'sub_registers': sub_registers})
+
+        title = db_access.get_official_copy_data('title123', ['C', 'A'])
+        assert title.title_number == 'title123'
+        assert title.official_copy_data == {'sub_registers': [{'A': ['property']}, {'C': ['charges']}]}
+
+    def test_get_official_copy_data_returns_no_sub_registers_when_none_match(self):
+        self._create_title('title123', official_copy_data={'sub_registers': [{'A': ['property']}]})
+
+        title = db_access.get_official_copy_data('title123', ['X'])
+        assert title.official_copy_data == {'sub_registers': []}
+
+    def test_get_official_copy_data_does_not_return_deleted_titles_when_sub_registers_requested(self):
+        self._create_title('title123', is_deleted=True, official_copy_data={'sub_registers': [{'A': []}]})
+        assert db_access.get_official_copy_data('title123', ['A']) is None
 
     def test_get_title_registers_returns_titles_with_right_content(self):
         title_number = 'title123'
@@ -100,10 +136,16 @@ class TestDbAccess:
         assert title.title_number == title_number
         assert title.register_data == register_data
         assert title.geometry_data == geometry_data
-        assert title.is_deleted == is_deleted
         assert title.last_modified.timestamp() == last_modified.timestamp()
-        assert title.official_copy_data == official_copy_data
-        assert title.lr_uprns == lr_uprns
+
+    def test_get_title_registers_returns_records_without_adding_them_to_the_session(self):
+        self._create_title('title1')
+        self._create_title('title2')
+
+        titles = db_access.get_title_registers(['title1', 'title2'])
+
+        assert all(isinstance(title, db_access.TitleRecord) for title in titles)
+        assert len(db.session.identity_map) == 0
 
     def test_get_title_registers_returns_list_with_all_existing_titles(self):
         existing_title_numbers = {'title1', 'title2', 'title3'}
@@ -164,12 +206,91 @@ class TestDbAccess:
         title = db_access.get_official_copy_data(title_number)
         assert title is not None
         assert title.title_number == title_number
-        assert title.register_data == register_data
-        assert title.geometry_data == geometry_data
-        assert title.is_deleted == is_deleted
-        assert title.last_modified.timestamp() == last_modified.timestamp()
         assert title.official_copy_data == official_copy_data
-        assert title.lr_uprns == lr_uprns
+        assert title.last_modified.timestamp() == last_modified.timestamp()
+
+    def test_get_title_number_and_register_data_returns_title_containing_the_lr_uprn(self):
+        register_data = {'tenure': 'Freehold'}
+        self._create_title('title123', register_data=register_data, lr_uprns=['123', '456'])
+        self._create_title('title456', lr_uprns=['789'])
+
+        title = db_access.get_title_number_and_register_data('456')
+        assert title is not None
+        assert title.title_number == 'title123'
+        assert title.register_data == register_data
+
+    def test_get_title_number_and_register_data_returns_none_when_no_title_contains_the_lr_uprn(self):
+        self._create_title('title123', lr_uprns=['1234'])
+        assert db_access.get_title_number_and_register_data('123') is None
+
+    def test_get_title_number_and_register_data_does_not_return_deleted_titles(self):
+        self._create_title('title123', is_deleted=True, lr_uprns=['123'])
+        assert db_access.get_title_number_and_register_data('123') is None
+
+    def test_title_summary_is_set_when_a_title_is_written(self):
+        self._create_title('title123', register_data={'tenure': 'Freehold', 'class': 'Absolute', 'other': 'data'})
+
+        titles = db_access.get_title_summaries(['title123'])
+        assert len(titles) == 1
+        assert titles[0].title_summary == {'tenure': 'Freehold', 'class': 'Absolute'}
+
+        self.connection.cursor().execute(
+            "update title_register_data set register_data = %s where title_number = 'title123'",
+            (json.dumps({'tenure': 'Leasehold'}),)
+        )
+        self.connection.commit()
+        db.session.expire_all()
+        assert db_access.get_title_summaries(['title123'])[0].title_summary == {'tenure': 'Leasehold'}
+
+    def test_get_title_summaries_does_not_return_deleted_titles(self):
+        self._create_title('title123', is_deleted=True, register_data={'tenure': 'Freehold'})
+        assert db_access.get_title_summaries(['title123']) == []
+
+    def test_get_title_number_and_summary_returns_summary_of_title_containing_the_lr_uprn(self):
+        self._create_title('title123', register_data={'tenure': 'Freehold', 'other': 'data'}, lr_uprns=['123'])
+
+        title = db_access.get_title_number_and_summary('123')
+        assert title.title_number == 'title123'
+        assert title.title_summary == {'tenure': 'Freehold'}
+
+    def test_title_lr_uprn_table_follows_changes_to_the_lr_uprns_of_a_title(self):
+        self._create_title('title123', lr_uprns=['123', '456'])
+        assert db_access.get_title_number_and_register_data('456').title_number == 'title123'
+
+        self.connection.cursor().execute("update title_register_data set lr_uprns = '{\"789\"}' where title_number = 'title123'")
+        self.connection.commit()
+        assert db_access.get_title_number_and_register_data('456') is None
+        assert db_access.get_title_number_and_register_data('789').title_number == 'title123'
+
+        self._delete_all_titles()
+        assert db_access.get_title_number_and_register_data('789') is None
+
+    def test_get_titles_and_register_data_returns_the_title_for_each_lr_uprn_found(self):
+        self._create_title('title123', register_data={'tenure': 'Freehold'}, lr_uprns=['123', '456'])
+        self._create_title('title789', lr_uprns=['789'])
+        self._create_title('deleted', is_deleted=True, lr_uprns=['999'])
+
+        titles = db_access.get_titles_and_register_data(['123', '456', '789', '999', '000'])
+
+        assert sorted(titles.keys()) == ['123', '456', '789']
+        assert titles['456'].title_number == 'title123'
+        assert titles['456'].register_data == {'tenure': 'Freehold'}
+        assert titles['789'].title_number == 'title789'
+
+    def test_get_titles_and_summaries_returns_empty_dict_when_no_lr_uprns_given(self):
+        assert db_access.get_titles_and_summaries([]) == {}
+
+    def test_get_titles_and_register_data_by_uprn_returns_the_title_of_each_mapped_uprn_found(self):
+        self._create_title('title123', register_data={'tenure': 'Freehold'}, lr_uprns=['123', '456'])
+        self._create_title('deleted', is_deleted=True, lr_uprns=['999'])
+        for uprn, lr_uprn in (('TEST1', '123'), ('TEST2', '456'), ('TEST3', '999'), ('TEST4', '000')):
+            self._create_uprn_mapping(uprn, lr_uprn)
+
+        titles = db_access.get_titles_and_register_data_by_uprn(['TEST1', 'TEST2', 'TEST3', 'TEST4', 'TEST5'])
+
+        assert sorted(titles.keys()) == ['TEST1', 'TEST2']
+        assert titles['TEST2'] == db_access.RegisterDataRecord('title123', {'tenure': 'Freehold'})
+        assert db_access.get_titles_and_summaries_by_uprn(['TEST1'])['TEST1'].title_summary == {'tenure': 'Freehold'}
 
     def _get_title_numbers(self, titles):
         return set(map(lambda title: title.title_number, titles))
@@ -200,11 +321,16 @@ class TestDbAccess:
 
         return self.connection.commit()
 
+    def _create_uprn_mapping(self, uprn, lr_uprn):
+        self.connection.cursor().execute(INSERT_UPRN_MAPPING_QUERY, (uprn, lr_uprn))
+        self.connection.commit()
+
     def _get_string_list_for_pg(self, strings):
         return ','.join(['"{}"'.format(s) for s in strings])
 
     def _delete_all_titles(self):
         self.connection.cursor().execute(DELETE_ALL_TITLES_QUERY)
+        self.connection.cursor().execute(DELETE_TEST_UPRN_MAPPINGS_QUERY)
         self.connection.commit()
 
     def _connect_to_db(self):
@@ -4,7 +4,7 @@ import pytest
 import requests
 from time import sleep
 from config import CONFIG_DICT
-from service import es_access
+from service import app, es_access
 
 PROPERTY_BY_POSTCODE_DOC_TYPE = 'property_by_postcode_3'
 PROPERTY_BY_ADDRESS_DOC_TYPE = 'property_by_address'
@@ -13,10 +13,15 @@ PROPERTY_BY_ADDRESS_DOC_TYPE = 'property_by_address'
 class TestEsAccess:
 
     def setup_method(self, method):
+        self.app_context = app.app_context()
+        self.app_context.push()
         self._ensure_empty_index()
 
+    def teardown_method(self, method):
+        self.app_context.pop()
+
     def test_get_properties_for_postcode_throws_exception_on_unsuccessful_attempt_to_talk_to_es(self):
-        with mock.patch.dict(es_access.app.config, {'ELASTICSEARCH_ENDPOINT_URI': 'http://non-existing2342345.co.uk'}):
+        with mock.patch.dict(app.config, {'ELASTICSEARCH_ENDPOINT_URI': 'http://non-existing2342345.co.uk'}):
             with pytest.raises(Exception) as e:
                 es_access.get_properties_for_postcode('XX000XX', 10, 0)
 
@@ -94,7 +99,7 @@ class TestEsAccess:
         assert self._get_title_numbers(third_page) == ['TITLE5']
 
     def test_get_properties_for_address_throws_exception_on_unsuccessful_attempt_to_talk_to_es(self):
-        with mock.patch.dict(es_access.app.config, {'ELASTICSEARCH_ENDPOINT_URI': 'http://non-existing2342345.co.uk'}):
+        with mock.patch.dict(app.config, {'ELASTICSEARCH_ENDPOINT_URI': 'http://non-existing2342345.co.uk'}):
             with pytest.raises(Exception) as e:
                 es_access.get_properties_for_address('XX000XX', 10, 0)
 
@@ -154,8 +159,44 @@ class TestEsAccess:
         second_page = es_access.get_properties_for_address(search_phrase, page_size=2, page_number=1)
         assert self._get_title_numbers(second_page) == ['WEAKEST']
 
+    def test_get_address_suggestions_returns_addresses_starting_with_the_text(self):
+        self._create_property_for_address('TITLE1', '12 High Street, Plymouth')
+        self._create_property_for_address('TITLE2', '14 High Street, Plymouth')
+        self._create_property_for_address('TITLE3', '12 Low Road, Plymouth')
+        self._wait_for_elasticsearch()
+
+        assert es_access.reindex_address_suggestions() == 3
+
+        suggestions = es_access.get_address_suggestions('12 Hi', 10)
+        assert suggestions == [{'title_number': 'TITLE1', 'address': '12 High Street, Plymouth'}]
+
+        suggestions = es_access.get_address_suggestions('high st', 10)
+        assert sorted(suggestion['title_number'] for suggestion in suggestions) == ['TITLE1', 'TITLE2']
+
+    def test_reindex_address_suggestions_replaces_the_previous_index(self):
+        self._create_property_for_address('TITLE1', '12 High Street, Plymouth')
+        self._wait_for_elasticsearch()
+        es_access.reindex_address_suggestions()
+        sleep(1)  # The new index gets a different name, which has a one second resolution
+
+        self._create_property_for_address('TITLE2', '14 High Street, Plymouth')
+        self._wait_for_elasticsearch()
+        es_access.reindex_address_suggestions()
+
+        aliases = requests.get(self._get_elasticsearch_uri() + '/_alias/' + self._get_suggestion_index_name()).json()
+        assert len(aliases) == 1
+        assert len(es_access.get_address_suggestions('high', 10)) == 2
+
+    def test_get_address_suggestions_returns_no_suggestions_when_elasticsearch_times_out(self):
+        self._create_property_for_address('TITLE1', '12 High Street, Plymouth')
+        self._wait_for_elasticsearch()
+        es_access.reindex_address_suggestions()
+
+        with mock.patch.dict(app.config, {'ADDRESS_SUGGESTION_TIMEOUT_MS': 0.001}):
+            assert es_access.get_address_suggestions('12 high', 10) == []
+
     def test_get_info_throws_exception_on_unsuccessful_attempt_to_talk_to_es(self):
-        with mock.patch.dict(es_access.app.config, {'ELASTICSEARCH_ENDPOINT_URI': 'http://non-existing2342345.co.uk'}):
+        with mock.patch.dict(app.config, {'ELASTICSEARCH_ENDPOINT_URI': 'http://non-existing2342345.co.uk'}):
             with pytest.raises(Exception) as e:
                 es_access.get_info()
 
@@ -168,6 +209,7 @@ class TestEsAccess:
 
     def _drop_index(self):
         requests.delete(self._get_index_uri())
+        requests.delete('{}/{}_*'.format(self._get_elasticsearch_uri(), self._get_suggestion_index_name()))
 
     def _ensure_empty_index(self):
         self._drop_index()
@@ -234,6 +276,9 @@ class TestEsAccess:
     def _get_index_uri(self):
         return self._get_elasticsearch_uri() + '/' + CONFIG_DICT['ELASTICSEARCH_INDEX_NAME']
 
+    def _get_suggestion_index_name(self):
+        return CONFIG_DICT['ADDRESS_SUGGESTION_INDEX_NAME']
+
     def _get_elasticsearch_uri(self):
         return CONFIG_DICT['ELASTICSEARCH_ENDPOINT_URI']
 
@@ -0,0 +1,105 @@
+import json
+import pytest
+from sqlalchemy import text
+from service import app, db, db_access, jsonb_migration
+
+INSERT_TITLE_QUERY = text(
+    'INSERT INTO title_register_data (title_number, register_data, geometry_data, official_copy_data, is_deleted, '
+    'last_modified) VALUES (:title_number, :register_data, :geometry_data, :official_copy_data, false, now())'
+)
+
+
+class TestJsonbMigration:
+
+    def setup_method(self, method):
+        self.app_context = app.app_context()
+        self.app_context.push()
+        self.engine = db.get_engine(app)
+        with self.engine.begin() as connection:
+            connection.execute('DELETE FROM title_register_data')
+            # Back to the schema before the conversion
+            for column in jsonb_migration.JSON_COLUMNS:
+                connection.execute('ALTER TABLE title_register_data ALTER COLUMN {0} TYPE json USING {0}::json'.format(column))
+        for number in range(3):
+            self._create_title('title{}'.format(number), {'tenure': 'Freehold', 'number': number})
+
+    def teardown_method(self, method):
+        # Ends the transaction of any db_access read, which would otherwise hold up the cutover
+        db.session.remove()
+        with self.engine.connect() as connection:
+            in_progress = jsonb_migration.is_in_progress(connection)
+        if in_progress or not self._is_converted():
+            jsonb_migration.prepare(self.engine)
+            jsonb_migration.backfill(self.engine, pause_seconds=0)
+            jsonb_migration.cutover(self.engine)
+        with self.engine.begin() as connection:
+            connection.execute('DELETE FROM title_register_data')
+        self.app_context.pop()
+
+    def test_migration_converts_the_columns_and_keeps_their_data(self):
+        jsonb_migration.prepare(self.engine)
+        assert jsonb_migration.backfill(self.engine, batch_size=2, pause_seconds=0) is True
+        jsonb_migration.cutover(self.engine)
+
+        assert self._is_converted()
+        assert self._get_register_data('title1') == {'tenure': 'Freehold', 'number': 1}
+
+    def test_backfill_carries_on_from_the_recorded_progress(self):
+        jsonb_migration.prepare(self.engine)
+
+        assert jsonb_migration.backfill(self.engine, batch_size=2, pause_seconds=0, max_batches=1) is False
+        assert jsonb_migration.get_progress(self.engine)['rows_done'] == 2
+
+        assert jsonb_migration.backfill(self.engine, batch_size=2, pause_seconds=0) is True
+        progress = jsonb_migration.get_progress(self.engine)
+        assert progress['rows_done'] == 3
+        assert progress['completed'] is True
+
+    def test_rows_written_during_the_backfill_are_converted(self):
+        jsonb_migration.prepare(self.engine)
+        jsonb_migration.backfill(self.engine, batch_size=1, pause_seconds=0, max_batches=1)
+
+        self._create_title('new-title', {'tenure': 'Leasehold'})
+        with self.engine.begin() as connection:
+            connection.execute(text("UPDATE title_register_data SET register_data = :data WHERE title_number = 'title0'"),
+                               data=json.dumps({'tenure': 'Leasehold'}))
+
+        jsonb_migration.backfill(self.engine, pause_seconds=0)
+        jsonb_migration.cutover(self.engine)
+
+        assert self._get_register_data('new-title') == {'tenure': 'Leasehold'}
+        assert self._get_register_data('title0') == {'tenure': 'Leasehold'}
+
+    def test_cutover_is_refused_until_the_backfill_has_completed(self):
+        jsonb_migration.prepare(self.engine)
+
+        with pytest.raises(Exception) as e:
+            jsonb_migration.cutover(self.engine)
+
+        assert str(e.value) == 'The JSONB backfill has not completed'
+        assert not self._is_converted()
+
+    def test_sub_registers_are_read_before_the_cutover(self):
+        sub_registers = [{'A': ['property']}, {'B': ['proprietorship']}, {'C': ['charges']}]
+        self._create_title('title-json', {}, {'sub_registers': sub_registers})
+        jsonb_migration.prepare(self.engine)
+
+        title = db_access.get_official_copy_data('title-json', ['C', 'A'])
+        assert title.official_copy_data == {'sub_registers': [{'A': ['property']}, {'C': ['charges']}]}
+
+    def _create_title(self, title_number, register_data, official_copy_data={}):
+        with self.engine.begin() as connection:
+            connection.execute(INSERT_TITLE_QUERY, title_number=title_number, register_data=json.dumps(register_data),
+                               geometry_data=json.dumps({}), official_copy_data=json.dumps(official_copy_data))
+
+    def _get_register_data(self, title_number):
+        with self.engine.connect() as connection:
+            register_data = connection.execute(
+                text('SELECT register_data::text FROM title_register_data WHERE title_number = :title_number'),
+                title_number=title_number,
+            ).scalar()
+        return json.loads(register_data)
+
+    def _is_converted(self):
+        with self.engine.connect() as connection:
+            return jsonb_migration.is_converted(connection)
@@ -0,0 +1,53 @@
+from scripts import generate_synthetic_data
+from service import app, db, db_access
+
+
+class TestSyntheticData:
+
+    def setup_method(self, method):
+        self.app_context = app.app_context()
+        self.app_context.push()
+        self.engine = db.get_engine(app)
+        self._delete_all()
+
+    def teardown_method(self, method):
+        self._delete_all()
+        self.app_context.pop()
+
+    def test_loaded_titles_can_be_looked_up_by_their_addresses(self):
+        loaded = generate_synthetic_data.load_chunks(1, [(0, 50), (1, 50)], load_elasticsearch=False)
+        titles = generate_synthetic_data.generate_chunk(1, 0, 50) + generate_synthetic_data.generate_chunk(1, 1, 50)
+        title = next(title for title in titles if title['addresses'] and not title['is_deleted'])
+        address = title['addresses'][0]
+
+        mapping = db_access.get_mapped_lruprn(address['uprn'])
+        found = db_access.get_title_number_and_register_data(mapping.lr_uprn)
+
+        assert loaded == 100
+        assert found.title_number == title['title_number']
+        assert found.register_data == title['register_data']
+        assert self._count('title_lr_uprn') == sum(len(title['lr_uprns']) for title in titles)
+
+    def test_secondary_indexes_can_be_dropped_and_created_again(self):
+        definitions = generate_synthetic_data.drop_secondary_indexes(self.engine, 'title_register_data')
+        try:
+            assert 'idx_title_uprns' not in self._get_index_names()
+        finally:
+            generate_synthetic_data.create_indexes(self.engine, definitions)
+
+        assert any('idx_title_uprns' in definition for definition in definitions)
+        assert 'idx_title_uprns' in self._get_index_names()
+
+    def _get_index_names(self):
+        with self.engine.connect() as connection:
+            return {row[0] for row in connection.execute(
+                "SELECT indexname FROM pg_indexes WHERE tablename = 'title_register_data'")}
+
+    def _count(self, table):
+        with self.engine.connect() as connection:
+            return connection.execute('SELECT count(*) FROM {}'.format(table)).scalar()
+
+    def _delete_all(self):
+        with self.engine.begin() as connection:
+            connection.execute('DELETE FROM title_register_data')
+            connection.execute('DELETE FROM uprn_mapping')
@@ -3,7 +3,7 @@
 from flask_script import Manager                   # type: ignore
 from flask_migrate import Migrate, MigrateCommand  # type: ignore
 
-from service import app, db
+from service import app, audit_partitions, cache_warmup, db, es_access, jsonb_migration
 
 # db.create_all() needs all models to be imported explicitly (not *)
 from service.models import TitleRegisterData
@@ -14,6 +14,95 @@ migrate = Migrate(app, db)
 manager = Manager(app)
 manager.add_command('db', MigrateCommand)
 
+partitions_manager = Manager(usage='Maintain the monthly partitions of user_search_and_results')
+manager.add_command('audit_partitions', partitions_manager)
+
+jsonb_manager = Manager(usage='Convert the JSON columns of title_register_data to JSONB while the service runs')
+manager.add_command('jsonb', jsonb_manager)
+
+
+@jsonb_manager.command
+def prepare():
+    """Adds the JSONB columns, and the trigger that keeps them up to date"""
+    jsonb_migration.prepare(db.get_engine(app))
+
+
+@jsonb_manager.option('-b', '--batch-size', dest='batch_size', type=int, default=1000, help='Rows per transaction')
+@jsonb_manager.option('-p', '--pause', dest='pause', type=float, default=0.1, help='Seconds to wait between batches')
+@jsonb_manager.option('-m', '--max-batches', dest='max_batches', type=int, default=None, help='Stop after this many')
+def backfill(batch_size, pause, max_batches):
+    """Copies existing rows to the JSONB columns, carrying on from where a previous run stopped"""
+    if jsonb_migration.backfill(db.get_engine(app), batch_size, pause, max_batches):
+        print('Backfill complete. Run "jsonb cutover" next.')
+    else:
+        print('Backfill stopped after {} batches. Run "jsonb backfill" again to carry on.'.format(max_batches))
+
+
+@jsonb_manager.command
+def status():
+    """Shows how far the backfill has got"""
+    progress = jsonb_migration.get_progress(db.get_engine(app))
+    if progress is None:
+        print('Not prepared')
+    else:
+        print('{rows_done} rows done, up to title {last_key}. Started {started}, last batch {updated}. '
+              'Completed: {completed}'.format(**progress))
+
+
+@jsonb_manager.option('-t', '--lock-timeout', dest='lock_timeout', type=int, default=5000,
+                      help='Milliseconds to wait for the table lock before giving up')
+def cutover(lock_timeout):
+    """Replaces the JSON columns with the backfilled JSONB ones"""
+    jsonb_migration.cutover(db.get_engine(app), lock_timeout)
+
+
+@jsonb_manager.command
+def create_indexes():
+    """Creates the expression indexes on JSONB keys without blocking writes"""
+    jsonb_migration.create_indexes(db.get_engine(app))
+
+
+@partitions_manager.option('-a', '--months-ahead', dest='months_ahead', type=int,
+                           default=app.config['AUDIT_PARTITIONS_AHEAD'], help='Months after this one to create')
+def create(months_ahead):
+    """Creates the partitions for this month and the coming ones, if they don't exist yet"""
+    for name in audit_partitions.create_partitions(db.get_engine(app), months_ahead):
+        print('Created {}'.format(name))
+
+
+@partitions_manager.option('-k', '--keep-months', dest='keep_months', type=int,
+                           default=app.config['AUDIT_RETENTION_MONTHS'], help='Months of searches to keep')
+@partitions_manager.option('-d', '--archive-dir', dest='archive_dir', default=app.config['AUDIT_ARCHIVE_DIR'],
+                           help='Where to write the archived partitions')
+def archive(keep_months, archive_dir):
+    """Detaches the partitions older than the retention period, archives them to gzipped CSV files and drops them"""
+    for path in audit_partitions.archive_partitions(db.get_engine(app), keep_months, archive_dir):
+        print('Archived to {}'.format(path))
+
+
+@manager.option('-c', '--chunk-size', dest='chunk_size', type=int, default=500, help='Suggestions per bulk request')
+def reindex_address_suggestions(chunk_size):
+    """Rebuilds the Elasticsearch index behind /address_suggestions from the address search documents"""
+    indexed = es_access.reindex_address_suggestions(chunk_size)
+    print('Indexed {} address suggestions'.format(indexed))
+
+
+@manager.option('-t', '--titles', dest='titles', type=int, default=app.config['CACHE_WARM_UP_TITLES'] or 100,
+                help='Most searched titles to warm up')
+@manager.option('-w', '--window-hours', dest='window_hours', type=int,
+                default=app.config['CACHE_WARM_UP_WINDOW_HOURS'], help='Hours of searches to count')
+def warm_up_cache(titles, window_hours):
+    """
+    Runs the cache warm-up the gunicorn master does before forking its workers, and reports how long it took
+    and what it covered. The cache is only kept by this process.
+    """
+    report = cache_warmup.warm_up(app, titles, window_hours)
+    print('Warmed up {} of the {} most searched titles in {:.0f}ms'.format(
+        report.titles_warmed, report.titles, report.duration_ms))
+    print('They were searched {} times out of {} ({:.1%}) in the last {} hours'.format(
+        report.searches_covered, report.searches, report.searches_covered / report.searches if report.searches else 0,
+        window_hours))
+
 
 if __name__ == '__main__':
     manager.run()
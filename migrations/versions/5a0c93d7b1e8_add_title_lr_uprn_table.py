@@ -0,0 +1,55 @@
+"""Add title_lr_uprn table, kept in sync with title_register_data.lr_uprns by a trigger
+
+Revision ID: 5a0c93d7b1e8
+Revises: e81b4f6c2d57
+Create Date: 2016-04-11 14:52:37.180264
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '5a0c93d7b1e8'
+down_revision = 'e81b4f6c2d57'
+
+from alembic import op
+import sqlalchemy as sa
+
+
+def upgrade():
+    op.create_table(
+        'title_lr_uprn',
+        sa.Column('lr_uprn', sa.String(length=20), nullable=False),
+        sa.Column('title_number', sa.String(length=10), nullable=False),
+        sa.ForeignKeyConstraint(['title_number'], ['title_register_data.title_number'],
+                                onupdate='CASCADE', ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('lr_uprn', 'title_number')
+    )
+    op.create_index('idx_title_lr_uprn_title_number', 'title_lr_uprn', ['title_number'], unique=False)
+
+    op.execute(
+        "CREATE FUNCTION title_register_data_sync_lr_uprns() RETURNS trigger AS $$ "
+        "BEGIN "
+        "  IF TG_OP = 'UPDATE' THEN "
+        "    DELETE FROM title_lr_uprn WHERE title_number IN (OLD.title_number, NEW.title_number); "
+        "  END IF; "
+        "  INSERT INTO title_lr_uprn (lr_uprn, title_number) "
+        "    SELECT DISTINCT lr_uprn, NEW.title_number FROM unnest(NEW.lr_uprns) AS lr_uprn WHERE lr_uprn IS NOT NULL; "
+        "  RETURN NULL; "
+        "END; "
+        "$$ LANGUAGE plpgsql"
+    )
+    op.execute(
+        "CREATE TRIGGER title_register_data_sync_lr_uprns AFTER INSERT OR UPDATE OF lr_uprns, title_number "
+        "ON title_register_data FOR EACH ROW EXECUTE PROCEDURE title_register_data_sync_lr_uprns()"
+    )
+    op.execute(
+        "INSERT INTO title_lr_uprn (lr_uprn, title_number) "
+        "SELECT DISTINCT lr_uprn, title_number FROM title_register_data, unnest(lr_uprns) AS lr_uprn "
+        "WHERE lr_uprn IS NOT NULL"
+    )
+
+
+def downgrade():
+    op.execute("DROP TRIGGER title_register_data_sync_lr_uprns ON title_register_data")
+    op.execute("DROP FUNCTION title_register_data_sync_lr_uprns()")
+    op.drop_index('idx_title_lr_uprn_title_number', table_name='title_lr_uprn')
+    op.drop_table('title_lr_uprn')
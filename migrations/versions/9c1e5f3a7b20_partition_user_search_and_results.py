@@ -0,0 +1,78 @@
+"""Partition user_search_and_results by month of search_datetime
+
+Revision ID: 9c1e5f3a7b20
+Revises: 5a0c93d7b1e8
+Create Date: 2016-04-18 10:12:44.503917
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '9c1e5f3a7b20'
+down_revision = '5a0c93d7b1e8'
+
+from alembic import op
+from datetime import date
+
+# Partitions are created this many months beyond the current one; later ones by
+# 'python manage.py audit_partitions create' (see service/audit_partitions.py)
+MONTHS_AHEAD = 3
+
+COLUMNS = (
+    'search_datetime timestamp without time zone NOT NULL, '
+    'user_id varchar(20) NOT NULL, '
+    'title_number varchar(20) NOT NULL, '
+    'search_type varchar(20) NOT NULL, '
+    'purchase_type varchar(20) NOT NULL, '
+    'amount varchar(10) NOT NULL, '
+    'cart_id varchar(30), '
+    'lro_trans_ref varchar(30), '
+    'viewed_datetime timestamp without time zone, '
+    'valid boolean'
+)
+
+
+def upgrade():
+    op.execute('ALTER TABLE user_search_and_results RENAME TO user_search_and_results_unpartitioned')
+    op.execute('ALTER INDEX user_search_and_results_pkey RENAME TO user_search_and_results_unpartitioned_pkey')
+    op.execute('ALTER INDEX idx_title_number RENAME TO idx_title_number_unpartitioned')
+
+    op.execute(
+        'CREATE TABLE user_search_and_results ({}, PRIMARY KEY (search_datetime, user_id)) '
+        'PARTITION BY RANGE (search_datetime)'.format(COLUMNS)
+    )
+    op.execute('CREATE INDEX idx_title_number ON user_search_and_results (title_number)')
+    op.execute('CREATE INDEX idx_user_search_and_results_user_title ON user_search_and_results (user_id, title_number)')
+    # Catches rows for months that have no partition yet, so that inserts never fail for the lack of one
+    op.execute('CREATE TABLE user_search_and_results_default PARTITION OF user_search_and_results DEFAULT')
+
+    first_search = op.get_bind().execute('SELECT min(search_datetime) FROM user_search_and_results_unpartitioned').scalar()
+    today = date.today()
+    month = date(first_search.year, first_search.month, 1) if first_search else date(today.year, today.month, 1)
+    last_month = _add_months(date(today.year, today.month, 1), MONTHS_AHEAD)
+    while month <= last_month:
+        op.execute(
+            "CREATE TABLE user_search_and_results_y{:%Ym%m} PARTITION OF user_search_and_results "
+            "FOR VALUES FROM ('{:%Y-%m-%d}') TO ('{:%Y-%m-%d}')".format(month, month, _add_months(month, 1))
+        )
+        month = _add_months(month, 1)
+
+    op.execute('INSERT INTO user_search_and_results SELECT * FROM user_search_and_results_unpartitioned')
+    op.execute('DROP TABLE user_search_and_results_unpartitioned')
+
+
+def downgrade():
+    op.execute(
+        'CREATE TABLE user_search_and_results_unpartitioned ({}, '
+        'CONSTRAINT user_search_and_results_unpartitioned_pkey PRIMARY KEY (search_datetime, user_id))'.format(COLUMNS)
+    )
+    op.execute('INSERT INTO user_search_and_results_unpartitioned SELECT * FROM user_search_and_results')
+    # Dropping the partitioned table drops its partitions too
+    op.execute('DROP TABLE user_search_and_results')
+    op.execute('ALTER TABLE user_search_and_results_unpartitioned RENAME TO user_search_and_results')
+    op.execute('ALTER INDEX user_search_and_results_unpartitioned_pkey RENAME TO user_search_and_results_pkey')
+    op.execute('CREATE INDEX idx_title_number ON user_search_and_results (title_number)')
+
+
+def _add_months(month, months):
+    years, month_index = divmod(month.month - 1 + months, 12)
+    return date(month.year + years, month_index + 1, 1)
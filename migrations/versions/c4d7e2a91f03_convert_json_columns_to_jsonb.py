@@ -0,0 +1,39 @@
+"""Convert JSON columns of title_register_data to JSONB
+
+Revision ID: c4d7e2a91f03
+Revises: 9486941ad9cd
+Create Date: 2016-03-21 10:12:41.518820
+
+On a large live table, run 'python manage.py jsonb' (prepare, backfill, cutover) first, which
+converts the columns without locking the table for long. This migration then only adds the indexes.
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = 'c4d7e2a91f03'
+down_revision = '9486941ad9cd'
+
+from alembic import op
+
+from service import jsonb_migration
+
+
+def upgrade():
+    connection = op.get_bind()
+    if jsonb_migration.is_in_progress(connection):
+        raise Exception('An online conversion to JSONB is in progress. Finish it with "manage.py jsonb cutover" first.')
+
+    if not jsonb_migration.is_converted(connection):
+        for column in jsonb_migration.JSON_COLUMNS:
+            op.execute('ALTER TABLE title_register_data ALTER COLUMN {0} TYPE jsonb USING {0}::jsonb'.format(column))
+
+    for index_name, expression in sorted(jsonb_migration.EXPRESSION_INDEXES.items()):
+        op.execute('CREATE INDEX IF NOT EXISTS {} ON title_register_data ({})'.format(index_name, expression))
+
+
+def downgrade():
+    for index_name in sorted(jsonb_migration.EXPRESSION_INDEXES):
+        op.execute('DROP INDEX IF EXISTS {}'.format(index_name))
+
+    for column in jsonb_migration.JSON_COLUMNS:
+        op.execute('ALTER TABLE title_register_data ALTER COLUMN {0} TYPE json USING {0}::json'.format(column))
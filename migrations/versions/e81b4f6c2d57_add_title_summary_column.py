@@ -0,0 +1,47 @@
+"""Add title_summary column, maintained by a trigger
+
+Revision ID: e81b4f6c2d57
+Revises: c4d7e2a91f03
+Create Date: 2016-04-04 09:21:15.604317
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = 'e81b4f6c2d57'
+down_revision = 'c4d7e2a91f03'
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+# The register_data keys search results show. Titles written after a change to these
+# keep the new summary; existing ones need the UPDATE below running again.
+SUMMARY_KEYS = ('tenure', 'class', 'edition_date')
+
+
+def upgrade():
+    op.add_column('title_register_data', sa.Column('title_summary', postgresql.JSONB(), nullable=True))
+    op.execute(
+        "CREATE FUNCTION title_summary(register_data jsonb) RETURNS jsonb AS $$ "
+        "SELECT COALESCE(jsonb_object_agg(key, value), '{{}}'::jsonb) FROM jsonb_each(register_data) "
+        "WHERE key IN ({}) "
+        "$$ LANGUAGE sql IMMUTABLE".format(', '.join("'{}'".format(key) for key in SUMMARY_KEYS))
+    )
+    op.execute(
+        "CREATE FUNCTION title_register_data_set_summary() RETURNS trigger AS $$ "
+        "BEGIN NEW.title_summary := title_summary(NEW.register_data::jsonb); RETURN NEW; END; "
+        "$$ LANGUAGE plpgsql"
+    )
+    # Not limited to updates of register_data, so the trigger doesn't stop that column's type being changed
+    op.execute(
+        "CREATE TRIGGER title_register_data_set_summary BEFORE INSERT OR UPDATE "
+        "ON title_register_data FOR EACH ROW EXECUTE PROCEDURE title_register_data_set_summary()"
+    )
+    op.execute("UPDATE title_register_data SET title_summary = title_summary(register_data)")
+
+
+def downgrade():
+    op.execute("DROP TRIGGER title_register_data_set_summary ON title_register_data")
+    op.execute("DROP FUNCTION title_register_data_set_summary()")
+    op.execute("DROP FUNCTION title_summary(jsonb)")
+    op.drop_column('title_register_data', 'title_summary')
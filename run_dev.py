@@ -2,7 +2,7 @@ import logging
 import atexit
 import os
 
-from service.server import app
+from service import app
 
 
 LOGGER = logging.getLogger(__name__)
@@ -0,0 +1,327 @@
+#!/usr/bin/env python3
+"""
+Generates synthetic titles at up to national scale (around 25 million) and bulk loads them, for benchmarks
+of the queries and indexes at a realistic size on a single machine.
+
+For each title it generates:
+
+- a title_register_data row: a register of a few to a few hundred entries, a boundary of a few to a few thousand
+  points, an official copy split into sub-registers, and the lr_uprns of its addresses (usually one, sometimes
+  none, a few for a small development and up to a couple of hundred for a block of flats)
+- a uprn_mapping row for each lr_uprn, from a made-up AddressBase uprn
+- an Elasticsearch document for each address, of both the postcode and the address search doc types
+
+Titles are generated in chunks of CHUNK_SIZE, each from its own random generator seeded from the seed and the
+chunk's number, so the same seed always gives the same data, however it's split between processes. Rows are
+loaded with COPY and documents with the bulk API. Title numbers, lr_uprns and uprns are derived from each title's
+position, so they don't collide across chunks, but may with real data: load into a database of its own.
+
+Run from the top-level directory, after sourcing environment.sh:
+
+    python scripts/generate_synthetic_data.py --titles 25000000 --processes 8 --rebuild-indexes
+"""
+import argparse
+import csv
+import io
+import json
+import logging
+import math
+import multiprocessing
+import random
+import time
+from datetime import datetime, timedelta
+from sqlalchemy import create_engine, text  # type: ignore
+
+from config import CONFIG_DICT
+
+LOGGER = logging.getLogger(__name__)
+
+CHUNK_SIZE = 10000
+# Leaves room for the lr_uprns of the largest title, so each title's are numbered from its position
+MAX_LR_UPRNS_PER_TITLE = 256
+FIRST_UPRN = 10000000000
+TITLE_PREFIXES = ('AGL', 'BK', 'CYM', 'DN', 'EGL', 'GR', 'HP', 'K', 'LT', 'MS', 'NGL', 'SK', 'TGL', 'WYK')
+SUB_REGISTERS = ('A', 'B', 'C', 'D')
+STREET_NAMES = ('High', 'Church', 'Station', 'Victoria', 'Park', 'Mill', 'Green', 'Manor', 'Queens', 'Kings',
+                'London', 'Grange', 'School', 'North', 'Chapel', 'Albert', 'Orchard', 'Springfield', 'Windsor')
+STREET_TYPES = ('Street', 'Road', 'Lane', 'Avenue', 'Close', 'Drive', 'Way', 'Gardens', 'Crescent', 'Terrace')
+TOWNS = ('Plymouth', 'Exeter', 'Swansea', 'Leeds', 'Nottingham', 'Coventry', 'Durham', 'Gloucester', 'Croydon',
+         'Birkenhead', 'Kingston upon Hull', 'Weymouth', 'Peterborough', 'Wrexham', 'Telford')
+POSTCODE_AREAS = ('PL', 'EX', 'SA', 'LS', 'NG', 'CV', 'DH', 'GL', 'CR', 'CH', 'HU', 'DT', 'PE', 'LL', 'TF')
+WORDS = ('the', 'land', 'property', 'registered', 'proprietor', 'title', 'absolute', 'freehold', 'leasehold',
+         'dated', 'transfer', 'charge', 'covenants', 'easements', 'rights', 'reserved', 'conveyance', 'lease',
+         'term', 'years', 'from', 'subject', 'to', 'in', 'of', 'and', 'with', 'by', 'under', 'mortgage',
+         'restriction', 'no', 'disposition', 'estate', 'building', 'plan', 'edged', 'red', 'filed', 'bank', 'plc')
+# Addresses sharing a postcode, roughly as many as on a real postcode
+ADDRESSES_PER_POSTCODE = 15
+EPOCH = datetime(1990, 1, 1)
+ENTRY_TEXTS_PER_CHUNK = 1000
+
+TITLE_COLUMNS = ('title_number', 'register_data', 'geometry_data', 'official_copy_data', 'is_deleted',
+                 'last_modified', 'lr_uprns')
+MAPPING_COLUMNS = ('uprn', 'lr_uprn')
+SELECT_SECONDARY_INDEXES = text(
+    "SELECT indexname, indexdef FROM pg_indexes WHERE schemaname = current_schema() AND tablename = :table "
+    "AND indexname NOT IN (SELECT conname FROM pg_constraint WHERE contype IN ('p', 'u'))"
+)
+
+
+def generate_chunk(seed, chunk_number, count=CHUNK_SIZE):
+    """Returns the first count titles of the chunk, as dicts of their columns plus their 'addresses'"""
+    rng = random.Random('{}:{}'.format(seed, chunk_number))
+    # Entries are drawn from a pool of texts, as making up every one is what generation would spend most time on
+    texts = [' '.join(rng.choice(WORDS) for _ in range(_log_normal_int(rng, 25, 0.7, 3, 400))).capitalize()
+             for _ in range(ENTRY_TEXTS_PER_CHUNK)]
+    first_position = chunk_number * CHUNK_SIZE
+    return [_generate_title(rng, texts, position) for position in range(first_position, first_position + count)]
+
+
+def get_chunks(titles, first_chunk=0):
+    """Returns (chunk number, titles to generate from it) for the chunks holding the first 'titles' titles"""
+    return [(chunk_number, min(CHUNK_SIZE, titles - chunk_number * CHUNK_SIZE))
+            for chunk_number in range(first_chunk, (titles + CHUNK_SIZE - 1) // CHUNK_SIZE)]
+
+
+def get_title_number(position):
+    prefix = TITLE_PREFIXES[position % len(TITLE_PREFIXES)]
+    return '{}{}'.format(prefix, 100000 + position // len(TITLE_PREFIXES))
+
+
+def make_title_copy_data(titles):
+    return _to_csv(
+        (title['title_number'], json.dumps(title['register_data']), json.dumps(title['geometry_data']),
+         json.dumps(title['official_copy_data']), 't' if title['is_deleted'] else 'f',
+         title['last_modified'].isoformat(), '{' + ','.join(title['lr_uprns']) + '}')
+        for title in titles
+    )
+
+
+def make_mapping_copy_data(titles):
+    return _to_csv((address['uprn'], address['lr_uprn']) for title in titles for address in title['addresses'])
+
+
+def make_elasticsearch_actions(titles, index_name, postcode_doc_type, address_doc_type):
+    for title in titles:
+        for address in title['addresses']:
+            entry_datetime = title['last_modified'].strftime('%Y-%m-%dT%H:%M:%S.000+00')
+            yield {
+                '_index': index_name, '_type': postcode_doc_type,
+                '_source': {
+                    'title_number': title['title_number'], 'entry_datetime': entry_datetime,
+                    'postcode': address['postcode'].replace(' ', ''),
+                    'house_number_or_first_number': address['house_number'],
+                    'address_string': address['address_string'],
+                },
+            }
+            yield {
+                '_index': index_name, '_type': address_doc_type,
+                '_source': {
+                    'title_number': title['title_number'], 'entry_datetime': entry_datetime,
+                    'address_string': address['address_string'],
+                },
+            }
+
+
+def load_chunks(seed, chunks, load_elasticsearch=True):
+    """Generates and loads the given (chunk number, count) chunks. Returns the number of titles loaded"""
+    engine = create_engine(CONFIG_DICT['SQLALCHEMY_DATABASE_URI'])
+    elasticsearch = _create_elasticsearch_client() if load_elasticsearch else None
+    loaded = 0
+    try:
+        for chunk_number, count in chunks:
+            titles = generate_chunk(seed, chunk_number, count)
+            connection = engine.raw_connection()
+            try:
+                cursor = connection.cursor()
+                _copy(cursor, 'title_register_data', TITLE_COLUMNS, make_title_copy_data(titles))
+                _copy(cursor, 'uprn_mapping', MAPPING_COLUMNS, make_mapping_copy_data(titles))
+                connection.commit()
+            finally:
+                connection.close()
+            if elasticsearch:
+                _bulk_index(elasticsearch, titles)
+            loaded += len(titles)
+            LOGGER.info('Loaded chunk {} ({} titles)'.format(chunk_number, len(titles)))
+    finally:
+        engine.dispose()
+    return loaded
+
+
+def drop_secondary_indexes(engine, table):
+    """Drops the table's indexes other than its keys, returning the statements that create them again"""
+    with engine.begin() as connection:
+        indexes = connection.execute(SELECT_SECONDARY_INDEXES, table=table).fetchall()
+        for name, _ in indexes:
+            LOGGER.info('Dropping index {}'.format(name))
+            connection.execute('DROP INDEX {}'.format(name))
+    return [definition for _, definition in indexes]
+
+
+def create_indexes(engine, definitions):
+    for definition in definitions:
+        LOGGER.info('Creating index: {}'.format(definition))
+        with engine.begin() as connection:
+            connection.execute(definition)
+
+
+def _generate_title(rng, texts, position):
+    title_number = get_title_number(position)
+    leasehold = rng.random() < 0.3
+    entries = [_generate_entry(rng, texts, number) for number in range(_log_normal_int(rng, 10, 0.8, 1, 2000))]
+    register_data = {
+        'title_number': title_number,
+        'tenure': 'Leasehold' if leasehold else 'Freehold',
+        'class': rng.choice(('Absolute', 'Absolute', 'Absolute', 'Good', 'Possessory')),
+        'edition_date': (EPOCH + timedelta(days=rng.randrange(365 * 26))).strftime('%Y-%m-%d'),
+        'districts': [rng.choice(TOWNS).upper()],
+        'entries': entries,
+    }
+    addresses = [_generate_address(rng, position, number) for number in range(_get_address_count(rng))]
+    if addresses:
+        register_data['address'] = addresses[0]['address_string']
+
+    official_copy_data = {'sub_registers': [
+        {sub_register: [entry['text'] for entry in entries if entry['sub_register'] == sub_register]}
+        for sub_register in SUB_REGISTERS
+        if sub_register != 'D' or any(entry['sub_register'] == 'D' for entry in entries)
+    ]}
+    return {
+        'title_number': title_number,
+        'register_data': register_data,
+        'geometry_data': _generate_geometry(rng),
+        'official_copy_data': official_copy_data,
+        'is_deleted': rng.random() < 0.01,
+        'last_modified': EPOCH + timedelta(seconds=rng.randrange(26 * 365 * 86400)),
+        'lr_uprns': [address['lr_uprn'] for address in addresses],
+        'addresses': addresses,
+    }
+
+
+def _get_address_count(rng):
+    draw = rng.random()
+    if draw < 0.03:
+        return 0                              # land without an address
+    if draw < 0.88:
+        return 1
+    if draw < 0.98:
+        return rng.randint(2, 4)              # e.g. a small development
+    return rng.randint(10, 200)               # e.g. the freehold of a block of flats
+
+
+def _generate_address(rng, position, number):
+    lr_uprn = position * MAX_LR_UPRNS_PER_TITLE + number
+    # Consecutive titles share postcodes, as neighbouring properties do
+    postcode_number = position // ADDRESSES_PER_POSTCODE
+    area = POSTCODE_AREAS[postcode_number % len(POSTCODE_AREAS)]
+    district = postcode_number // len(POSTCODE_AREAS)
+    postcode = '{}{} {}{}{}'.format(area, district // 6760 % 99 + 1, district // 676 % 10,
+                                    chr(65 + district // 26 % 26), chr(65 + district % 26))
+    house_number = rng.randint(1, 250)
+    street = '{} {}'.format(rng.choice(STREET_NAMES), rng.choice(STREET_TYPES))
+    flat = 'Flat {}, '.format(number + 1) if number else ''
+    return {
+        'lr_uprn': str(lr_uprn),
+        'uprn': str(FIRST_UPRN + lr_uprn),
+        'postcode': postcode,
+        'house_number': house_number,
+        'address_string': '{}{} {}, {}, {}'.format(flat, house_number, street, rng.choice(TOWNS), postcode).upper(),
+    }
+
+
+def _generate_entry(rng, texts, number):
+    return {
+        'position': number + 1,
+        'sub_register': rng.choice(('A', 'B', 'B', 'C', 'C', 'D')),
+        'role_code': rng.choice(('RDES', 'RPRO', 'CCHA', 'RPRI', 'SCOV')),
+        'text': rng.choice(texts),
+    }
+
+
+def _generate_geometry(rng):
+    points = _log_normal_int(rng, 8, 1.0, 4, 5000)
+    x, y = rng.uniform(150000, 650000), rng.uniform(10000, 650000)
+    radius = rng.uniform(5, 200)
+    angles = [2 * math.pi * i / points for i in range(points)]
+    ring = [[round(x + radius * rng.uniform(0.7, 1.3) * math.cos(angle), 2),
+             round(y + radius * rng.uniform(0.7, 1.3) * math.sin(angle), 2)] for angle in angles]
+    ring.append(ring[0])
+    return {'index': {'type': 'FeatureCollection', 'features': [{
+        'type': 'Feature', 'geometry': {'type': 'Polygon', 'coordinates': [ring]},
+        'properties': {'title_number': None},
+    }]}, 'extent': {'type': 'Point', 'coordinates': [round(x, 2), round(y, 2)]}}
+
+
+def _log_normal_int(rng, median, sigma, minimum, maximum):
+    return max(minimum, min(maximum, int(rng.lognormvariate(math.log(median), sigma))))
+
+
+def _to_csv(rows):
+    buffer = io.StringIO()
+    csv.writer(buffer, lineterminator='\n').writerows(rows)
+    return io.BytesIO(buffer.getvalue().encode('utf-8'))
+
+
+def _copy(cursor, table, columns, data):
+    sql = 'COPY {} ({}) FROM STDIN WITH (FORMAT csv)'.format(table, ', '.join(columns))
+    if hasattr(cursor, 'copy_expert'):
+        cursor.copy_expert(sql, data)  # psycopg2
+    else:
+        cursor.execute(sql, stream=data)  # pg8000
+
+
+def _create_elasticsearch_client():
+    from elasticsearch import Elasticsearch  # type: ignore
+    return Elasticsearch([CONFIG_DICT['ELASTICSEARCH_ENDPOINT_URI']])
+
+
+def _bulk_index(client, titles):
+    from elasticsearch.helpers import bulk  # type: ignore
+    actions = make_elasticsearch_actions(titles, CONFIG_DICT['ELASTICSEARCH_INDEX_NAME'],
+                                         CONFIG_DICT['POSTCODE_SEARCH_DOC_TYPE'],
+                                         CONFIG_DICT['ADDRESS_SEARCH_DOC_TYPE'])
+    bulk(client, actions, chunk_size=2000)
+
+
+def _load_chunk_range(args):
+    return load_chunks(*args)
+
+
+def _setup_logging():
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s level=[%(levelname)s] message=[%(message)s]')
+
+
+def _parse_command_line_args():
+    parser = argparse.ArgumentParser(description='Generates synthetic titles and bulk loads them')
+    parser.add_argument('-t', '--titles', type=int, default=100000, help='Titles to generate')
+    parser.add_argument('-s', '--seed', type=int, default=1, help='Seed; the same seed gives the same data')
+    parser.add_argument('-f', '--first-chunk', type=int, default=0,
+                        help='Chunk to start from, e.g. to carry on after an interrupted load')
+    parser.add_argument('-p', '--processes', type=int, default=1, help='Processes generating and loading chunks')
+    parser.add_argument('--no-elasticsearch', action='store_true', help='Load Postgres only')
+    parser.add_argument('--rebuild-indexes', action='store_true',
+                        help='Drop the secondary indexes of title_register_data during the load, then build them')
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    args = _parse_command_line_args()
+    _setup_logging()
+    chunks = get_chunks(args.titles, args.first_chunk)
+    main_engine = create_engine(CONFIG_DICT['SQLALCHEMY_DATABASE_URI'])
+    index_definitions = drop_secondary_indexes(main_engine, 'title_register_data') if args.rebuild_indexes else []
+
+    start = time.time()
+    # Each process takes every n-th chunk, so they all finish at about the same time
+    work = [(args.seed, chunks[number::args.processes], not args.no_elasticsearch)
+            for number in range(args.processes)]
+    with multiprocessing.Pool(args.processes) as pool:
+        total = sum(pool.map(_load_chunk_range, work))
+    elapsed = time.time() - start
+
+    create_indexes(main_engine, index_definitions)
+    with main_engine.begin() as main_connection:
+        main_connection.execute('ANALYZE title_register_data')
+        main_connection.execute('ANALYZE title_lr_uprn')
+        main_connection.execute('ANALYZE uprn_mapping')
+    LOGGER.info('Loaded {} titles in {:.0f}s ({:.0f} titles/s), indexes built in {:.0f}s'.format(
+        total, elapsed, total / elapsed, time.time() - start - elapsed))
@@ -0,0 +1,280 @@
+#!/usr/bin/env python3
+"""
+Replays recorded traffic against a running instance of the API, to find how much of it a deployment can take.
+Replay against an instance whose dependencies are local stand-ins, e.g. 'gunicorn benchmarks.stub_app:app',
+as replayed searches are saved like any other.
+
+Requests are read from any mix of:
+
+- gunicorn access logs, in gunicorn's default format
+- application logs in the format of logging_config.json, written with LOG_REQUESTS=true
+- captured request lists: a JSON object per line, with 'time' (seconds since the epoch), 'method', 'path'
+  and, for a POST, 'form'
+
+Each request is sent at its original time from the start of the recording, divided by the speed, so requests
+overlap as they originally did. At 'max' speed they are sent back to back by as many clients as there were
+requests in flight at the busiest moment of the recording. Latency is timed from when a request was due to be
+sent, so a client that falls behind shows up in it. For each speed, prints the throughput and the latency
+percentiles and error rate per route, then the speed at which the instance stopped keeping up.
+
+Run from the top-level directory, after sourcing environment.sh:
+
+    python scripts/replay_traffic.py --base-url http://localhost:8000 --speeds 1,2,4,8,max logs/*.log
+"""
+import argparse
+import collections
+import json
+import math
+import re
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from werkzeug.exceptions import HTTPException  # type: ignore
+
+RecordedRequest = collections.namedtuple('RecordedRequest', ['time', 'method', 'path', 'form', 'duration_ms'])
+Result = collections.namedtuple('Result', ['route', 'status', 'latency_ms', 'finished'])
+
+ACCESS_LOG_PATTERN = re.compile(
+    r'^\S+ \S+ \S+ \[(?P<time>[^\]]+)\] "(?P<method>[A-Z]+) (?P<path>\S+) [^"]*" (?P<status>\d{3}) ')
+APP_LOG_PATTERN = re.compile(
+    r'^(?P<time>\d{4}-\d\d-\d\d \d\d:\d\d:\d\d,\d{3}) .*message=\[Served method=\[(?P<method>[A-Z]+)\] '
+    r'path=\[(?P<path>.*?)\] status=\[(?P<status>\d{3})\] duration_ms=\[(?P<duration_ms>[\d.]+)\]\]')
+
+# Logs don't record the form of a POST, so searches are saved with these made-up details
+PLACEHOLDER_FORM = {
+    'MC_titleNumber': 'REPLAY1', 'MC_userId': 'replay-user', 'MC_searchType': 'D',
+    'MC_purchaseType': 'drvSummaryView', 'amount': '2', 'last_changed_datestring': '01 Jan 2016',
+    'last_changed_timestring': '00:00:00',
+}
+
+# A speed at which the instance achieves less than this share of the offered rate hasn't kept up
+MIN_ACHIEVED_SHARE = 0.9
+MAX_ERROR_RATE = 0.01
+
+
+def read_requests(paths):
+    """Returns the requests recorded in the files, oldest first"""
+    requests = []
+    for path in paths:
+        with open(path, encoding='utf-8', errors='replace') as recording:
+            requests.extend(_spread_within_seconds([parse_line(line) for line in recording]))
+    return sorted((request for request in requests if request), key=lambda request: request.time)
+
+
+def parse_line(line):
+    """Returns the RecordedRequest on the line, or None if it doesn't record one"""
+    line = line.strip()
+    if line.startswith('{'):
+        captured = json.loads(line)
+        return RecordedRequest(float(captured['time']), captured['method'].upper(), captured['path'],
+                               captured.get('form'), None)
+
+    match = APP_LOG_PATTERN.match(line)
+    if match:
+        duration_ms = float(match.group('duration_ms'))
+        # Logged when the request ended
+        ended = datetime.strptime(match.group('time'), '%Y-%m-%d %H:%M:%S,%f').timestamp()
+        return RecordedRequest(ended - duration_ms / 1000, match.group('method'), match.group('path'), None,
+                               duration_ms)
+
+    match = ACCESS_LOG_PATTERN.match(line)
+    if match:
+        started = datetime.strptime(match.group('time'), '%d/%b/%Y:%H:%M:%S %z').timestamp()
+        return RecordedRequest(started, match.group('method'), match.group('path'), None, None)
+    return None
+
+
+def get_peak_concurrency(requests, default):
+    """The most requests that were in flight at once, where the recording has their durations"""
+    events = [(request.time, 1) for request in requests if request.duration_ms is not None]
+    events += [(request.time + request.duration_ms / 1000, -1) for request in requests
+               if request.duration_ms is not None]
+    if not events:
+        return default
+    in_flight = peak = 0
+    for _, change in sorted(events):
+        in_flight += change
+        peak = max(peak, in_flight)
+    return peak
+
+
+def replay(requests, base_url, speed, clients, timeout, get_route):
+    """Sends the requests at the given speed (None for as fast as possible) and returns their Results"""
+    first = requests[0].time
+    results = []
+    results_lock = threading.Lock()
+
+    def send(request, due):
+        status = _send(base_url, request, timeout)
+        finished = time.time()
+        with results_lock:
+            results.append(Result(get_route(request), status, (finished - due) * 1000, finished))
+
+    start = time.time()
+    with ThreadPoolExecutor(max_workers=clients) as executor:
+        for request in requests:
+            if speed is None:
+                due = time.time()
+            else:
+                due = start + (request.time - first) / speed
+                time.sleep(max(due - time.time(), 0))
+            executor.submit(send, request, due)
+    return start, results
+
+
+def summarise(requests, speed, start, results):
+    """Returns the rates and error rate of a replay and the latency percentiles and error rate of each route"""
+    elapsed = max(result.finished for result in results) - start
+    recorded_seconds = requests[-1].time - requests[0].time
+    summary = {
+        'speed': 'max' if speed is None else '{:g}x'.format(speed),
+        'offered_rate': len(requests) * speed / recorded_seconds if speed and recorded_seconds else None,
+        'achieved_rate': len(results) / elapsed if elapsed else 0,
+        'error_rate': _error_rate(results),
+        'routes': {},
+    }
+    by_route = collections.defaultdict(list)
+    for result in results:
+        by_route[result.route].append(result)
+    for route, route_results in sorted(by_route.items()):
+        latencies = sorted(result.latency_ms for result in route_results)
+        summary['routes'][route] = {
+            'count': len(route_results),
+            'p50_ms': percentile(latencies, 50),
+            'p95_ms': percentile(latencies, 95),
+            'p99_ms': percentile(latencies, 99),
+            'error_rate': _error_rate(route_results),
+        }
+    return summary
+
+
+def find_saturation(summaries):
+    """Returns (the last summary that kept up, the first that didn't), either None if there's none"""
+    kept_up = None
+    for summary in summaries:
+        if summary['offered_rate'] is None:
+            continue
+        if (summary['achieved_rate'] < summary['offered_rate'] * MIN_ACHIEVED_SHARE or
+                summary['error_rate'] > MAX_ERROR_RATE):
+            return kept_up, summary
+        kept_up = summary
+    return kept_up, None
+
+
+def percentile(sorted_values, percent):
+    """Nearest-rank percentile of a sorted list"""
+    if not sorted_values:
+        return None
+    return sorted_values[max(int(math.ceil(percent / 100 * len(sorted_values))) - 1, 0)]
+
+
+def make_route_getter():
+    """Names each request after the API route that serves it, as the metrics and ADMISSION_LIMITS do"""
+    from service import app
+    adapter = app.url_map.bind('localhost')
+
+    def get_route(request):
+        try:
+            endpoint, _ = adapter.match(urllib.parse.urlsplit(request.path).path, request.method)
+        except HTTPException:
+            return 'unknown'
+        return endpoint.split('.')[-1]
+    return get_route
+
+
+def print_summary(summary):
+    offered = summary['offered_rate']
+    print('speed {}: offered {} req/s, achieved {:.1f} req/s, errors {:.1%}'.format(
+        summary['speed'], '{:.1f}'.format(offered) if offered is not None else 'max', summary['achieved_rate'],
+        summary['error_rate']))
+    print('  {:<32} {:>7} {:>9} {:>9} {:>9} {:>7}'.format('route', 'count', 'p50 ms', 'p95 ms', 'p99 ms', 'errors'))
+    for route, stats in summary['routes'].items():
+        print('  {:<32} {:>7} {:>9.1f} {:>9.1f} {:>9.1f} {:>7.1%}'.format(
+            route, stats['count'], stats['p50_ms'], stats['p95_ms'], stats['p99_ms'], stats['error_rate']))
+
+
+def print_saturation(summaries):
+    kept_up, fell_behind = find_saturation(summaries)
+    if fell_behind is None:
+        print('Saturation: not reached; kept up at every timed speed')
+        return
+    print('Saturation: fell behind at {} (offered {:.1f} req/s, achieved {:.1f} req/s, errors {:.1%})'.format(
+        fell_behind['speed'], fell_behind['offered_rate'], fell_behind['achieved_rate'], fell_behind['error_rate']))
+    if kept_up:
+        print('            last kept up at {} ({:.1f} req/s)'.format(kept_up['speed'], kept_up['achieved_rate']))
+
+
+def _send(base_url, request, timeout):
+    """Returns the status of the response, or None if there was none"""
+    data = None
+    if request.method == 'POST':
+        form = request.form or dict(PLACEHOLDER_FORM, MC_timestamp=datetime.now().isoformat())
+        data = urllib.parse.urlencode(form).encode('utf-8')
+    try:
+        with urllib.request.urlopen(urllib.request.Request(base_url + request.path, data=data,
+                                                           method=request.method), timeout=timeout) as response:
+            response.read()
+            return response.status
+    except urllib.error.HTTPError as e:
+        return e.code
+    except Exception:
+        return None
+
+
+def _error_rate(results):
+    errors = sum(1 for result in results if result.status is None or result.status >= 500)
+    return errors / len(results) if results else 0
+
+
+def _spread_within_seconds(requests):
+    # Access logs only have whole seconds, so requests logged in the same second are spread across it
+    # rather than all sent at its start
+    by_second = collections.defaultdict(list)
+    for request in requests:
+        if request and request.time == int(request.time):
+            by_second[request.time].append(request)
+    spread = {}
+    for second, same_second in by_second.items():
+        for number, request in enumerate(same_second):
+            spread[id(request)] = request._replace(time=second + number / len(same_second))
+    return [spread.get(id(request), request) for request in requests]
+
+
+def _parse_speeds(speeds):
+    return [None if speed == 'max' else float(speed) for speed in speeds.split(',')]
+
+
+def _parse_command_line_args():
+    parser = argparse.ArgumentParser(description='Replays recorded traffic against a running instance of the API')
+    parser.add_argument('recordings', nargs='+', help='Access logs, application logs or captured request lists')
+    parser.add_argument('-u', '--base-url', default='http://localhost:8000', help='Instance to replay against')
+    parser.add_argument('-s', '--speeds', default='1', help="Comma-separated multiples of the original rate, or 'max'")
+    parser.add_argument('-c', '--clients', type=int, default=50,
+                        help='Requests in flight at most; at max speed, used when the recording has no durations')
+    parser.add_argument('-t', '--timeout', type=float, default=30, help='Seconds to wait for each response')
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    args = _parse_command_line_args()
+    recorded = read_requests(args.recordings)
+    if not recorded:
+        raise SystemExit('No requests found in {}'.format(', '.join(args.recordings)))
+    peak_concurrency = get_peak_concurrency(recorded, None)
+    print('{} requests over {:.1f}s, {}'.format(
+        len(recorded), recorded[-1].time - recorded[0].time,
+        'at most {} in flight'.format(peak_concurrency) if peak_concurrency else 'no durations recorded'))
+
+    route_getter = make_route_getter()
+    summaries = []
+    for replay_speed in _parse_speeds(args.speeds):
+        clients = (peak_concurrency or args.clients) if replay_speed is None else args.clients
+        replay_start, replay_results = replay(recorded, args.base_url.rstrip('/'), replay_speed, clients,
+                                              args.timeout, route_getter)
+        summaries.append(summarise(recorded, replay_speed, replay_start, replay_results))
+        print_summary(summaries[-1])
+    print_saturation(summaries)
@@ -2,15 +2,80 @@ import faulthandler                          # type: ignore
 from flask import Flask                      # type: ignore
 from flask.ext.sqlalchemy import SQLAlchemy  # type: ignore
 
-from config import CONFIG_DICT
-from service import logging_config
+from config import CONFIG_DICT, QUEUE_DICT
+from service import db_pool, logging_config, metrics, read_replicas
 
-# This causes the traceback to be written to the fault log file in case of serious faults
-fault_log_file = open(CONFIG_DICT['FAULT_LOG_FILE_PATH'], 'a')
-faulthandler.enable(file=fault_log_file)
 
-app = Flask(__name__)
-app.config.update(CONFIG_DICT)
+class _SQLAlchemy(SQLAlchemy):  # type: ignore
 
-db = SQLAlchemy(app)
-logging_config.setup_logging()
+    def apply_driver_hacks(self, app, info, options):
+        super(_SQLAlchemy, self).apply_driver_hacks(app, info, options)
+        db_pool.configure_engine_options(app.config, options)
+
+    def create_session(self, options):
+        return read_replicas.RoutingSession(self, **options)
+
+
+fault_log_file = None
+
+# Bound to each application by create_app(). The engine (and its pool) is created on first use.
+db = _SQLAlchemy()
+
+
+def create_app(config_dict=None):
+    """
+    Creates the Flask application, with the API's routes registered.
+
+    Dependencies only some routes need (Elasticsearch, RabbitMQ) are imported when first used,
+    so creating the application doesn't load them.
+    """
+    enable_fault_log()
+    logging_config.setup_logging()
+
+    app = Flask(__name__)
+    app.config.update(CONFIG_DICT if config_dict is None else config_dict)
+    db.init_app(app)
+    db_pool.register_gauges(lambda: db.get_engine(app))
+    if app.config['SQLALCHEMY_BINDS']:
+        read_replicas.register_gauges(app)
+    if QUEUE_DICT['LEGACY_SPOOL_DIR']:
+        from service import legacy_transmission_queue
+        legacy_transmission_queue.register_spool_gauges()
+
+    from service import concurrency
+    from service.server import api
+    app.register_blueprint(api)
+
+    if app.config['DB_DRIVER'] == 'psycopg2' and app.config['WORKER_CLASS'] in concurrency.COOPERATIVE_WORKER_CLASSES:
+        concurrency.make_psycopg2_cooperative()
+
+    return app
+
+
+def enable_fault_log():
+    """This causes the traceback to be written to the fault log file in case of serious faults"""
+    global fault_log_file
+
+    previous_file = fault_log_file
+    fault_log_file = open(CONFIG_DICT['FAULT_LOG_FILE_PATH'], 'a')
+    faulthandler.enable(file=fault_log_file)
+    if previous_file:
+        previous_file.close()
+
+
+def reinitialise_after_fork():
+    """
+    Re-creates the resources a forked process must not share with its parent.
+
+    The Elasticsearch client, AMQP producer and address-search-api session are re-created
+    on first use in each process (see ProcessLocal), so only the rest is handled here.
+    """
+    enable_fault_log()
+    metrics.reset()
+    db_pool.reset_after_fork(db.get_engine(app))
+    for engine in read_replicas.get_replica_engines(app).values():
+        db_pool.reset_after_fork(engine)
+
+
+# The application gunicorn serves ('service:app'), and the one the tests and manage.py use
+app = create_app()
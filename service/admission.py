@@ -0,0 +1,148 @@
+"""
+Admission control: limits how many requests to a route the workers serve at once, and sheds requests
+that have already waited too long, answering them with a 503 straight away.
+
+The limit on a route is shared by all the workers on the host. Each route has as many slots as its limit,
+each a lock file in ADMISSION_LOCK_DIR, and a request holds an flock on one of them while it's served.
+The kernel drops the lock if a worker dies, so a killed worker never keeps a slot.
+"""
+import fcntl
+import logging
+import os
+import threading
+import time
+from flask import current_app, g, request  # type: ignore
+
+from service import metrics
+from service.process_local import ProcessLocal
+
+logger = logging.getLogger(__name__)
+
+RETRY_AFTER_SECONDS = 1
+POLL_INTERVAL_SECONDS = 0.01
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+
+class RouteLimiter:
+
+    def __init__(self, name, limit, lock_dir):
+        self.name = name
+        self.limit = limit
+        self._lock_dir = lock_dir
+        # Lock files are opened in each process, as a lock taken through a descriptor inherited from the
+        # master would be shared with every other worker
+        self._slots = ProcessLocal(self._open_slots)
+        self._lock = threading.Lock()
+
+    def try_acquire(self):
+        """Returns the number of a free slot, now held by this request, or None if there's none free"""
+        slots = self._slots.get()
+        with self._lock:
+            for number, slot in enumerate(slots['files']):
+                # A lock is held per open file, so slots in use in this process (by another greenlet) look free
+                if number in slots['in_use']:
+                    continue
+                try:
+                    fcntl.flock(slot, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    continue
+                slots['in_use'].add(number)
+                return number
+        return None
+
+    def acquire(self, timeout_seconds):
+        """Waits up to timeout_seconds for a free slot. Returns its number, or None if none came free"""
+        deadline = time.time() + timeout_seconds
+        while True:
+            number = self.try_acquire()
+            if number is not None or time.time() >= deadline:
+                return number
+            time.sleep(POLL_INTERVAL_SECONDS)
+
+    def release(self, number):
+        slots = self._slots.get()
+        with self._lock:
+            fcntl.flock(slots['files'][number], fcntl.LOCK_UN)
+            slots['in_use'].discard(number)
+
+    def _open_slots(self):
+        os.makedirs(self._lock_dir, exist_ok=True)
+        files = [os.open(os.path.join(self._lock_dir, '{}.{}.lock'.format(self.name, number)), os.O_CREAT | os.O_RDWR)
+                 for number in range(self.limit)]
+        return {'files': files, 'in_use': set()}
+
+
+def admit():
+    """
+    Decides whether the current request is served. Returns None if it is, or the seconds after which
+    the client should retry if it's shed.
+    """
+    name = request.endpoint.split('.')[-1]
+    if name in current_app.config['ADMISSION_EXEMPT_ROUTES']:
+        return None
+
+    max_queue_ms = current_app.config['ADMISSION_MAX_QUEUE_MS']
+    queued_ms = get_queued_ms(request.headers.get('X-Request-Start'))
+    if queued_ms is not None and queued_ms > max_queue_ms:
+        # The client (or the load balancer) has probably given up on it by now
+        return _shed(name, 'queued for {:.0f}ms'.format(queued_ms))
+
+    limit = current_app.config['ADMISSION_LIMITS'].get(name)
+    if not limit:
+        metrics.increment('admission.{}.admitted'.format(name))
+        return None
+
+    limiter = _get_limiter(name, limit)
+    start = time.time()
+    number = limiter.acquire(max(max_queue_ms - (queued_ms or 0), 0) / 1000)
+    metrics.observe('admission.{}.wait_ms'.format(name), (time.time() - start) * 1000)
+    if number is None:
+        return _shed(name, 'all {} slots busy'.format(limit))
+
+    g.admission_slot = (limiter, number)
+    metrics.increment('admission.{}.admitted'.format(name))
+    return None
+
+
+def release():
+    """Frees the slot held by the current request, if any"""
+    slot = getattr(g, 'admission_slot', None)
+    if slot:
+        g.admission_slot = None
+        limiter, number = slot
+        limiter.release(number)
+
+
+def get_queued_ms(request_start):
+    """
+    Milliseconds since the load balancer received the request, from its X-Request-Start header
+    ('t=<seconds>', 't=<milliseconds>' or 't=<microseconds>' since the epoch), or None without one.
+    """
+    if not request_start:
+        return None
+    try:
+        started = float(request_start.strip().replace('t=', '', 1))
+    except ValueError:
+        return None
+    # Tells the units apart by size: the seconds since the epoch have 10 digits before the point
+    if started > 1e14:
+        started /= 1e6
+    elif started > 1e11:
+        started /= 1e3
+    return max((time.time() - started) * 1000, 0)
+
+
+def _shed(name, reason):
+    logger.warning('Shedding request to {}: {}'.format(name, reason))
+    metrics.increment('admission.{}.shed'.format(name))
+    return RETRY_AFTER_SECONDS
+
+
+def _get_limiter(name, limit):
+    with _limiters_lock:
+        limiter = _limiters.get(name)
+        if limiter is None or limiter.limit != limit:
+            limiter = _limiters[name] = RouteLimiter(name, limit, current_app.config['ADMISSION_LOCK_DIR'])
+        return limiter
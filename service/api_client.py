@@ -1,20 +1,26 @@
 import requests  # type: ignore
 import logging
-from service import app
+from flask import current_app  # type: ignore
+from service import circuit_breaker
+from service.process_local import ProcessLocal
 
-ADDRESS_SEARCH_API_URL = app.config['ADDRESS_SEARCH_API']
 logger = logging.getLogger(__name__)
 
+# Keeps connections to the address-search-api open between requests
+_session = ProcessLocal(requests.Session)
 
+
+@circuit_breaker.protected(circuit_breaker.ADDRESS_SEARCH_API)
 def get_titles_by_postcode(postcode, page_number, page_size):
     logger.debug('Start get_titles_by_postcode. Postcode: {}'.format(postcode))
     logger.info('Sending to address-search-api')
-    response = requests.get(
-        '{}search'.format(ADDRESS_SEARCH_API_URL),
+    response = _session.get().get(
+        '{}search'.format(_get_address_search_api_url()),
         params={'page_number': page_number,
                 'postcode': postcode,
                 'page_size': page_size
-                }
+                },
+        timeout=current_app.config['ADDRESS_SEARCH_API_TIMEOUT']
     )
     logger.info('Returned from address-search-api')
     if response:
@@ -27,3 +33,7 @@ def _to_json(response):
         return response.json()
     except Exception as e:
         raise Exception('API response body is not JSON', e)
+
+
+def _get_address_search_api_url():
+    return current_app.config['ADDRESS_SEARCH_API']
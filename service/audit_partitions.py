@@ -0,0 +1,146 @@
+"""
+Maintains the monthly partitions of user_search_and_results, each run through manage.py (see
+'python manage.py audit_partitions --help'), e.g. daily from cron:
+
+- create: adds the partitions for the coming months
+- archive: detaches the partitions of months older than the retention period, writes each to a
+  gzipped CSV file and then drops it
+"""
+import csv
+import gzip
+import logging
+import os
+import re
+from datetime import date
+from sqlalchemy import text  # type: ignore
+
+logger = logging.getLogger(__name__)
+
+TABLE_NAME = 'user_search_and_results'
+DEFAULT_PARTITION = 'user_search_and_results_default'
+PARTITION_NAME_PATTERN = re.compile(r'^user_search_and_results_y(\d{4})m(\d{2})$')
+# In the order of the table's columns
+COLUMNS = ('search_datetime', 'user_id', 'title_number', 'search_type', 'purchase_type', 'amount', 'cart_id',
+           'lro_trans_ref', 'viewed_datetime', 'valid')
+
+SELECT_ATTACHED_PARTITIONS = text(
+    'SELECT child.relname FROM pg_inherits '
+    'JOIN pg_class parent ON parent.oid = pg_inherits.inhparent '
+    'JOIN pg_class child ON child.oid = pg_inherits.inhrelid '
+    'WHERE parent.relname = :table'
+)
+SELECT_TABLES = text("SELECT tablename FROM pg_tables WHERE schemaname = current_schema() AND tablename LIKE :prefix")
+
+
+def create_partitions(engine, months_ahead=3, today=None):
+    """Creates any missing partitions from the current month to months_ahead months after it"""
+    first_month = _month_of(today or date.today())
+    created = []
+    with engine.begin() as connection:
+        existing = _get_attached_partitions(connection)
+        for offset in range(months_ahead + 1):
+            month = _add_months(first_month, offset)
+            if get_partition_name(month) not in existing:
+                _create_partition(connection, month)
+                created.append(get_partition_name(month))
+    return created
+
+
+def archive_partitions(engine, keep_months, archive_dir, batch_size=10000, today=None):
+    """
+    Detaches the partitions of months that ended more than keep_months ago, archives each to
+    <archive_dir>/<partition>.csv.gz and drops it. Returns the paths of the files written.
+
+    Partitions left detached by an earlier run that stopped part way are archived too.
+    """
+    cutoff = _add_months(_month_of(today or date.today()), -keep_months)
+    with engine.begin() as connection:
+        for name in sorted(_get_attached_partitions(connection)):
+            month = get_partition_month(name)
+            if month and month < cutoff:
+                logger.info('Detaching partition {}'.format(name))
+                connection.execute('ALTER TABLE {} DETACH PARTITION {}'.format(TABLE_NAME, name))
+
+    os.makedirs(archive_dir, exist_ok=True)
+    paths = []
+    for name in _get_detached_partitions(engine):
+        paths.append(_archive_partition(engine, name, archive_dir, batch_size))
+    return paths
+
+
+def get_partition_name(month):
+    return '{}_y{:%Ym%m}'.format(TABLE_NAME, month)
+
+
+def get_partition_month(name):
+    match = PARTITION_NAME_PATTERN.match(name)
+    return date(int(match.group(1)), int(match.group(2)), 1) if match else None
+
+
+def _create_partition(connection, month):
+    name = get_partition_name(month)
+    bounds = {'start': month, 'end': _add_months(month, 1)}
+    logger.info('Creating partition {}'.format(name))
+    connection.execute('CREATE TABLE {} (LIKE {} INCLUDING DEFAULTS)'.format(name, TABLE_NAME))
+    # A partition can't be attached over rows for its month in the default partition, so they're moved into it.
+    # Rows inserted into the default partition meanwhile would make the attach fail, so inserts wait until the
+    # partition is attached (and then go to it). Reads carry on. The lock is taken on the table rather than only on
+    # the default partition, as inserts are routed to a partition before they wait for the partition's lock.
+    connection.execute('LOCK TABLE {} IN SHARE ROW EXCLUSIVE MODE'.format(TABLE_NAME))
+    in_month = 'search_datetime >= :start AND search_datetime < :end'
+    connection.execute(text('INSERT INTO {} SELECT * FROM {} WHERE {}'.format(name, DEFAULT_PARTITION, in_month)), **bounds)
+    connection.execute(text('DELETE FROM {} WHERE {}'.format(DEFAULT_PARTITION, in_month)), **bounds)
+    connection.execute("ALTER TABLE {} ATTACH PARTITION {} FOR VALUES FROM ('{:%Y-%m-%d}') TO ('{:%Y-%m-%d}')".format(
+        TABLE_NAME, name, bounds['start'], bounds['end']))
+
+
+def _archive_partition(engine, name, archive_dir, batch_size):
+    path = os.path.join(archive_dir, '{}.csv.gz'.format(name))
+    temporary_path = path + '.tmp'
+    select_batch = text(
+        'SELECT {0} FROM {1} WHERE (search_datetime, user_id) > (:last_datetime, :last_user_id) '
+        'ORDER BY search_datetime, user_id LIMIT :batch_size'.format(', '.join(COLUMNS), name)
+    )
+    rows_written = 0
+    with engine.connect() as connection, gzip.open(temporary_path, 'wt', newline='') as archive:
+        writer = csv.writer(archive)
+        writer.writerow(COLUMNS)
+        # Keyset batches, so the whole month is never held in memory
+        last_key = (date.min, '')
+        while True:
+            rows = connection.execute(select_batch, last_datetime=last_key[0], last_user_id=last_key[1],
+                                      batch_size=batch_size).fetchall()
+            if not rows:
+                break
+            writer.writerows(rows)
+            rows_written += len(rows)
+            last_key = (rows[-1]['search_datetime'], rows[-1]['user_id'])
+
+    with engine.begin() as connection:
+        row_count = connection.execute('SELECT count(*) FROM {}'.format(name)).scalar()
+        if row_count != rows_written:
+            raise Exception('Archived {} of the {} rows of {}; keeping it'.format(rows_written, row_count, name))
+        os.replace(temporary_path, path)
+        connection.execute('DROP TABLE {}'.format(name))
+    logger.info('Archived {} rows of {} to {}'.format(rows_written, name, path))
+    return path
+
+
+def _get_attached_partitions(connection):
+    return {row[0] for row in connection.execute(SELECT_ATTACHED_PARTITIONS, table=TABLE_NAME)}
+
+
+def _get_detached_partitions(engine):
+    with engine.connect() as connection:
+        attached = _get_attached_partitions(connection)
+        tables = [row[0] for row in connection.execute(SELECT_TABLES, prefix=TABLE_NAME + '_y%')]
+    return sorted(name for name in tables if get_partition_month(name) and name not in attached)
+
+
+def _month_of(day):
+    return date(day.year, day.month, 1)
+
+
+def _add_months(month, months):
+    years, month_index = divmod(month.month - 1 + months, 12)
+    return date(month.year + years, month_index + 1, 1)
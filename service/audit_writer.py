@@ -0,0 +1,97 @@
+"""
+Group commit for the user search audit records (see AUDIT_GROUP_COMMIT in config.py).
+
+Instead of a transaction per record, requests hand their records to a background writer, which inserts
+everything that arrives within AUDIT_GROUP_COMMIT_MAX_WAIT_MS in one multi-row transaction. Each request
+waits until the transaction holding its record has committed, so it's only acknowledged once the record
+is durable. Only workers that serve several requests at once (gevent) have records to group.
+"""
+import collections
+import logging
+import threading
+import time
+
+from service import metrics
+from service.process_local import ProcessLocal
+
+logger = logging.getLogger(__name__)
+
+# One writer (and thread) per process, as threads don't survive gunicorn's fork
+_writer = ProcessLocal(lambda engine, table, max_batch_size, max_wait_ms: GroupCommitWriter(
+    engine, table, max_batch_size, max_wait_ms))
+
+PendingRecord = collections.namedtuple('PendingRecord', ['values', 'done', 'errors'])
+
+
+class GroupCommitWriter:
+
+    def __init__(self, engine, table, max_batch_size=100, max_wait_ms=5):
+        self._engine = engine
+        self._table = table
+        self._max_batch_size = max_batch_size
+        self._max_wait_seconds = max_wait_ms / 1000
+        self._pending = collections.deque()
+        self._condition = threading.Condition()
+        self._thread = threading.Thread(target=self._run, name='audit-writer')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def write(self, values):
+        """Inserts a row with the given values, returning once it's committed. Raises if the insert fails"""
+        record = PendingRecord(values, threading.Event(), [])
+        start = time.time()
+        with self._condition:
+            self._pending.append(record)
+            self._condition.notify()
+        record.done.wait()
+        metrics.observe('audit_writer.wait_ms', (time.time() - start) * 1000)
+        if record.errors:
+            raise record.errors[0]
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            try:
+                self._insert(batch)
+            except Exception:
+                logger.exception('Failed to insert a batch of {} audit records'.format(len(batch)))
+
+    def _next_batch(self):
+        with self._condition:
+            while not self._pending:
+                self._condition.wait()
+            # Gives other requests a moment to add their records to the same transaction
+            deadline = time.time() + self._max_wait_seconds
+            while len(self._pending) < self._max_batch_size and time.time() < deadline:
+                self._condition.wait(deadline - time.time())
+            return [self._pending.popleft() for _ in range(min(len(self._pending), self._max_batch_size))]
+
+    def _insert(self, batch):
+        start = time.time()
+        try:
+            self._insert_rows([record.values for record in batch])
+        except Exception as e:
+            if len(batch) == 1:
+                batch[0].errors.append(e)
+            else:
+                # One bad record (e.g. a duplicate key) mustn't fail the others, so they're retried one at a time
+                logger.warning('Batch of {} audit records failed ({}), inserting them one by one'.format(len(batch), e))
+                for record in batch:
+                    try:
+                        self._insert_rows([record.values])
+                    except Exception as record_error:
+                        record.errors.append(record_error)
+        finally:
+            metrics.observe('audit_writer.batch_size', len(batch))
+            metrics.observe('audit_writer.commit_ms', (time.time() - start) * 1000)
+            for record in batch:
+                record.done.set()
+
+    def _insert_rows(self, rows):
+        with self._engine.begin() as connection:
+            # A single multi-row INSERT, as executemany costs a round trip per row with pg8000
+            connection.execute(self._table.insert().values(rows))
+
+
+def write(engine, table, values, max_batch_size, max_wait_ms):
+    _writer.get(engine, table, max_batch_size, max_wait_ms).write(values)
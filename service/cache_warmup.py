@@ -0,0 +1,65 @@
+import logging
+import time
+from collections import namedtuple
+from datetime import datetime, timedelta
+
+from service import compression, db_access, server
+from service.json_encoding import json_response
+
+logger = logging.getLogger(__name__)
+
+# The title routes whose bodies are cached, with the variant of each that is warmed up
+# (the official copy with all its sub-registers)
+WARMED_ROUTES = (
+    ('titles', server.title_result, ()),
+    ('official-copy', server.official_copy_result, (None,)),
+)
+
+WarmUpReport = namedtuple('WarmUpReport', ['titles', 'titles_warmed', 'searches', 'searches_covered', 'duration_ms'])
+
+
+def warm_up(app, max_titles, window_hours, chunk_size=100):
+    """
+    Fills this process's cache of compressed titles with the titles searched for most over the last
+    window_hours, so that the first requests for them after a restart are served from it. The gunicorn
+    master does it once, before forking the workers that inherit the cache (see gunicorn_settings.py).
+
+    The titles are read from Postgres chunk_size at a time. Returns a WarmUpReport, with how many of the
+    window's searches were for the warmed titles.
+    """
+    start = time.time()
+    encodings = compression.available_encodings()
+    # Each title takes an entry per route and encoding, so more than fit would only evict each other
+    max_titles = min(max_titles, app.config['COMPRESSED_BODY_CACHE_SIZE'] // (len(WARMED_ROUTES) * len(encodings)))
+    with app.app_context():
+        searches, ranked = db_access.get_most_searched_title_numbers(
+            datetime.now() - timedelta(hours=window_hours), max_titles)
+        searches_by_title = dict(ranked)
+        # Least searched first, as the cache evicts what was put in it first
+        title_numbers = [title_number for title_number, _ in reversed(ranked)]
+        warmed = []
+        for chunk_start in range(0, len(title_numbers), chunk_size):
+            titles = db_access.get_title_registers_with_official_copies(
+                title_numbers[chunk_start:chunk_start + chunk_size])
+            for title in sorted(titles, key=lambda title: searches_by_title[title.title_number]):
+                if _cache_title(app, title, encodings):
+                    warmed.append(title.title_number)
+
+    duration_ms = (time.time() - start) * 1000
+    report = WarmUpReport(len(ranked), len(warmed), searches,
+                          sum(searches_by_title[title_number] for title_number in warmed), duration_ms)
+    logger.info('Warmed up {} of the {} most searched titles in {:.0f}ms, covering {} of {} searches'.format(
+        report.titles_warmed, report.titles, duration_ms, report.searches_covered, report.searches))
+    return report
+
+
+def _cache_title(app, title, encodings):
+    """Caches the title's bodies as its routes would. Returns False if they can't be cached."""
+    if not title.last_modified:
+        return False
+    for route, make_result, variant in WARMED_ROUTES:
+        for encoding in encodings:
+            with app.test_request_context(headers={'Accept-Encoding': encoding}):
+                compression.compressed(lambda: json_response(make_result(title)), server.TITLE_COMPRESSION,
+                                       server.title_cache_key(route, title, *variant))
+    return True
@@ -0,0 +1,262 @@
+"""
+Circuit breakers around the service's dependencies.
+
+Calls to a dependency go through its breaker (see protected). While enough of the recent calls fail
+or are slow, the breaker opens and calls fail straight away with CircuitOpenError, answered with a 503,
+instead of tying up a worker until they time out. After CIRCUIT_BREAKER_OPEN_SECONDS it lets a few
+probe calls through (half-open), and closes again if they succeed.
+
+Only errors of the dependency itself count as failures (see FAILURE_CHECKS): an error the call brings on
+itself (e.g. a bad statement, or a bug in the code around the call) is passed on without one, so it can't
+open the breaker for every route that uses the dependency.
+
+Breakers are kept per process, so each gunicorn worker decides for itself.
+"""
+import collections
+import logging
+import math
+import threading
+import time
+from contextlib import contextmanager
+from flask import current_app                 # type: ignore
+import requests                               # type: ignore
+from sqlalchemy import exc as sqlalchemy_exc  # type: ignore
+
+from service import metrics
+
+logger = logging.getLogger(__name__)
+
+POSTGRES = 'postgres'
+ELASTICSEARCH = 'elasticsearch'
+ADDRESS_SEARCH_API = 'address_search_api'
+AMQP = 'amqp'
+DEPENDENCIES = (POSTGRES, ELASTICSEARCH, ADDRESS_SEARCH_API, AMQP)
+
+# Classes of the SQLSTATE codes Postgres reports when it is in trouble, rather than the statement: connection
+# exceptions, insufficient resources, operator intervention (e.g. a statement timeout) and system errors
+POSTGRES_FAILURE_SQLSTATE_CLASSES = ('08', '53', '57', '58')
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+
+class CircuitOpenError(Exception):
+
+    def __init__(self, name, retry_after):
+        super(CircuitOpenError, self).__init__('The {} circuit breaker is open'.format(name))
+        self.name = name
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+
+    def __init__(self, name, window_size=20, minimum_calls=10, failure_rate=0.5, slow_call_ms=3000,
+                 slow_call_rate=0.8, open_seconds=30, half_open_calls=3, clock=time.time, is_failure=None):
+        self.name = name
+        # Whether an exception raised by a call is a failure of the dependency. By default, any is.
+        self.is_failure = is_failure or (lambda error: True)
+        self.minimum_calls = minimum_calls
+        self.failure_rate = failure_rate
+        self.slow_call_ms = slow_call_ms
+        self.slow_call_rate = slow_call_rate
+        self.open_seconds = open_seconds
+        self.half_open_calls = half_open_calls
+        self._clock = clock
+        self._lock = threading.Lock()
+        # (failed, slow) for each of the most recent calls
+        self._outcomes = collections.deque(maxlen=window_size)
+        self._state = CLOSED
+        self._opened_at = None
+        self._probes_in_flight = 0
+        self._probe_successes = 0
+
+    @property
+    def state(self):
+        with self._lock:
+            self._update_state()
+            return self._state
+
+    def before_call(self):
+        """Raises CircuitOpenError if the call must not be made"""
+        with self._lock:
+            self._update_state()
+            if self._state == OPEN:
+                metrics.increment('circuit_breaker.{}.rejected'.format(self.name))
+                raise CircuitOpenError(self.name, self._seconds_until_half_open())
+            if self._state == HALF_OPEN:
+                if self._probes_in_flight + self._probe_successes >= self.half_open_calls:
+                    metrics.increment('circuit_breaker.{}.rejected'.format(self.name))
+                    raise CircuitOpenError(self.name, 1)
+                self._probes_in_flight += 1
+
+    def after_call(self, duration_ms, failed):
+        slow = duration_ms > self.slow_call_ms
+        with self._lock:
+            if self._state == HALF_OPEN:
+                self._probes_in_flight = max(self._probes_in_flight - 1, 0)
+                if failed or slow:
+                    self._open()
+                else:
+                    self._probe_successes += 1
+                    if self._probe_successes >= self.half_open_calls:
+                        self._close()
+            elif self._state == CLOSED:
+                self._outcomes.append((failed, slow))
+                if self._is_unhealthy():
+                    self._open()
+
+    def release(self):
+        """Ends a call that was abandoned without an outcome, e.g. because another breaker was open"""
+        with self._lock:
+            if self._state == HALF_OPEN:
+                self._probes_in_flight = max(self._probes_in_flight - 1, 0)
+
+    def status(self):
+        with self._lock:
+            self._update_state()
+            calls = len(self._outcomes)
+            status = {
+                'state': self._state,
+                'calls': calls,
+                'failure_rate': self._rate(0),
+                'slow_call_rate': self._rate(1),
+            }
+            if self._state == OPEN:
+                status['retry_after'] = self._seconds_until_half_open()
+            return status
+
+    def _is_unhealthy(self):
+        return len(self._outcomes) >= self.minimum_calls and (
+            self._rate(0) >= self.failure_rate or self._rate(1) >= self.slow_call_rate)
+
+    def _rate(self, index):
+        if not self._outcomes:
+            return 0.0
+        return sum(1 for outcome in self._outcomes if outcome[index]) / len(self._outcomes)
+
+    def _update_state(self):
+        if self._state == OPEN and self._clock() - self._opened_at >= self.open_seconds:
+            logger.info('{} circuit breaker half-open: letting probe calls through'.format(self.name))
+            self._state = HALF_OPEN
+            self._probes_in_flight = self._probe_successes = 0
+
+    def _open(self):
+        logger.warning('{} circuit breaker open for {}s (failure rate {:.2f}, slow call rate {:.2f})'.format(
+            self.name, self.open_seconds, self._rate(0), self._rate(1)))
+        metrics.increment('circuit_breaker.{}.opened'.format(self.name))
+        self._state = OPEN
+        self._opened_at = self._clock()
+
+    def _close(self):
+        logger.info('{} circuit breaker closed'.format(self.name))
+        self._state = CLOSED
+        self._outcomes.clear()
+
+    def _seconds_until_half_open(self):
+        return max(int(math.ceil(self._opened_at + self.open_seconds - self._clock())), 1)
+
+
+@contextmanager
+def protected(name):
+    """
+    Makes the call(s) in the block, or the decorated function, through the named breaker.
+
+    An exception counts as a failure if the breaker's check says it's an error of the dependency. Others
+    count as a call that the dependency answered, except CircuitOpenError from another breaker, which is
+    passed on without counting.
+    """
+    breaker = get_breaker(name)
+    breaker.before_call()
+    start = time.time()
+    try:
+        yield
+    except CircuitOpenError:
+        breaker.release()
+        raise
+    except Exception as e:
+        breaker.after_call((time.time() - start) * 1000, failed=breaker.is_failure(e))
+        raise
+    breaker.after_call((time.time() - start) * 1000, failed=False)
+
+
+def get_breaker(name):
+    with _breakers_lock:
+        if name not in _breakers:
+            _breakers[name] = CircuitBreaker(name, is_failure=FAILURE_CHECKS.get(name), **_get_settings())
+        return _breakers[name]
+
+
+def get_statuses():
+    return {name: get_breaker(name).status() for name in DEPENDENCIES}
+
+
+def reset():
+    """Forgets all breakers, so they're created afresh (closed) on next use"""
+    with _breakers_lock:
+        _breakers.clear()
+
+
+def is_postgres_failure(error):
+    if isinstance(error, (sqlalchemy_exc.OperationalError, sqlalchemy_exc.InterfaceError,
+                          sqlalchemy_exc.TimeoutError)):
+        # Can't connect, connection lost, or no connection free in the pool in time
+        return True
+    if isinstance(error, sqlalchemy_exc.DBAPIError):
+        return error.connection_invalidated or _get_sqlstate(error.orig)[:2] in POSTGRES_FAILURE_SQLSTATE_CLASSES
+    return False
+
+
+def is_elasticsearch_failure(error):
+    # Elasticsearch is only imported once it's used, which it has been if it raised the error
+    from elasticsearch.exceptions import TransportError  # type: ignore
+    # Connection errors and timeouts have no status code ('N/A'); a 4xx is the request's fault
+    return isinstance(error, TransportError) and not (
+        isinstance(error.status_code, int) and error.status_code < 500)
+
+
+def is_address_search_api_failure(error):
+    # Connection errors and timeouts. A response that isn't JSON is answered, so isn't counted.
+    return isinstance(error, requests.RequestException)
+
+
+def is_amqp_failure(error):
+    # kombu is only imported once it's used, which it has been if it raised the error
+    from amqp.exceptions import AMQPError  # type: ignore
+    from kombu.exceptions import ChannelError, ConnectionError  # type: ignore
+    # Socket errors (OSError) are raised as they are; messages that can't be encoded aren't counted
+    return isinstance(error, (OSError, AMQPError, ChannelError, ConnectionError))
+
+
+FAILURE_CHECKS = {
+    POSTGRES: is_postgres_failure,
+    ELASTICSEARCH: is_elasticsearch_failure,
+    ADDRESS_SEARCH_API: is_address_search_api_failure,
+    AMQP: is_amqp_failure,
+}
+
+
+def _get_sqlstate(error):
+    # psycopg2 has it as pgcode. pg8000 gives it as the second argument, e.g. (b'ERROR', b'57014', b'...').
+    sqlstate = getattr(error, 'pgcode', None)
+    if sqlstate is None and len(getattr(error, 'args', ())) > 1:
+        sqlstate = error.args[1]
+    if isinstance(sqlstate, bytes):
+        sqlstate = sqlstate.decode('ascii', 'replace')
+    return sqlstate if isinstance(sqlstate, str) else ''
+
+
+def _get_settings():
+    config = current_app.config
+    return {
+        'window_size': config['CIRCUIT_BREAKER_WINDOW_SIZE'],
+        'minimum_calls': config['CIRCUIT_BREAKER_MINIMUM_CALLS'],
+        'failure_rate': config['CIRCUIT_BREAKER_FAILURE_RATE'],
+        'slow_call_ms': config['CIRCUIT_BREAKER_SLOW_CALL_MS'],
+        'slow_call_rate': config['CIRCUIT_BREAKER_SLOW_CALL_RATE'],
+        'open_seconds': config['CIRCUIT_BREAKER_OPEN_SECONDS'],
+        'half_open_calls': config['CIRCUIT_BREAKER_HALF_OPEN_CALLS'],
+    }
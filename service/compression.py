@@ -0,0 +1,114 @@
+import gzip
+import logging
+import threading
+import time
+from collections import namedtuple, OrderedDict
+from flask import current_app, request, Response  # type: ignore
+
+from service import metrics
+
+try:
+    import brotli  # type: ignore
+except ImportError:
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+# Bodies smaller than min_size bytes are sent uncompressed, as compressing them saves little.
+# gzip levels range from 1 to 9 and brotli qualities from 0 to 11: higher is smaller but slower.
+CompressionSettings = namedtuple('CompressionSettings', ['min_size', 'gzip_level', 'brotli_quality'])
+
+# Compressed bodies by cache key and encoding, least recently used first. Kept per process.
+_cache = OrderedDict()  # type: OrderedDict
+_cache_lock = threading.Lock()
+
+
+def compressed(make_response, settings, cache_key=None):
+    """
+    Returns the response made by make_response, compressed with the best encoding the client accepts.
+
+    If a cache_key is given (which must change whenever the body does), the compressed body is kept
+    and later requests for it are served from the cache without calling make_response.
+    """
+    encoding = choose_encoding()
+    cached = cached_response(cache_key, encoding)
+    if cached:
+        return cached
+
+    response = make_response()
+    response.vary.add('Accept-Encoding')
+    body = response.get_data()
+    if not encoding or response.status_code != 200 or len(body) < settings.min_size:
+        return response
+
+    compressed_body = _compress(body, encoding, settings)
+    response.set_data(compressed_body)
+    if cache_key is not None:
+        metrics.increment('compression.cache_misses')
+        _put_cached((cache_key, encoding), (compressed_body, response.status_code, response.mimetype))
+    return _encoded_response(response, encoding)
+
+
+def cached_response(cache_key, encoding):
+    """Returns the response cached by compressed() for the key and encoding, or None if there's none"""
+    if not encoding or cache_key is None:
+        return None
+    cached = _get_cached((cache_key, encoding))
+    if not cached:
+        return None
+    metrics.increment('compression.cache_hits')
+    body, status, mimetype = cached
+    return _encoded_response(Response(body, status=status, mimetype=mimetype), encoding)
+
+
+def available_encodings():
+    """The encodings this process can produce, most preferred first"""
+    return ('br', 'gzip') if brotli else ('gzip',)
+
+
+def clear_cache():
+    with _cache_lock:
+        _cache.clear()
+
+
+def choose_encoding():
+    """The encoding of the request's response: the one the client accepts best, or None if it accepts none"""
+    qualities = [(request.accept_encodings[encoding], encoding) for encoding in available_encodings()]
+    # max() keeps the first of equal qualities, so the preferred encoding wins ties
+    quality, encoding = max(qualities, key=lambda quality_and_encoding: quality_and_encoding[0])
+    return encoding if quality > 0 else None
+
+
+def _compress(body, encoding, settings):
+    start = time.time()
+    if encoding == 'br':
+        compressed_body = brotli.compress(body, quality=settings.brotli_quality)
+    else:
+        compressed_body = gzip.compress(body, compresslevel=settings.gzip_level)
+    metrics.observe('compression.compress_ms', (time.time() - start) * 1000)
+    metrics.increment('compression.bytes_in', len(body))
+    metrics.increment('compression.bytes_out', len(compressed_body))
+    return compressed_body
+
+
+def _encoded_response(response, encoding):
+    response.headers['Content-Encoding'] = encoding
+    response.vary.add('Accept-Encoding')
+    return response
+
+
+def _get_cached(key):
+    with _cache_lock:
+        value = _cache.get(key)
+        if value is not None:
+            _cache.move_to_end(key)
+        return value
+
+
+def _put_cached(key, value):
+    max_entries = current_app.config['COMPRESSED_BODY_CACHE_SIZE']
+    with _cache_lock:
+        _cache[key] = value
+        _cache.move_to_end(key)
+        while len(_cache) > max_entries:
+            _cache.popitem(last=False)
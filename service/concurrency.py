@@ -0,0 +1,78 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from flask import current_app  # type: ignore
+
+logger = logging.getLogger(__name__)
+
+# Gunicorn worker classes under which blocking socket calls yield to other greenlets
+COOPERATIVE_WORKER_CLASSES = ('gevent',)
+
+
+def map_concurrently(func, items, threads=False):
+    """
+    Applies func to every item and returns the results in the order of the items.
+
+    Under a cooperative worker the calls are overlapped in a bounded pool of greenlets. Otherwise they are
+    made one after another, unless threads is True, in which case they are overlapped in a bounded pool of
+    threads. That suits calls that wait on the network without using the database (e.g. HTTP requests), as
+    each thread would take a connection of its own from the worker's pool.
+    """
+    items = list(items)
+    if len(items) < 2:
+        return [func(item) for item in items]
+
+    run = _with_app_context(current_app._get_current_object(), func)
+    pool_size = current_app.config['LOOKUP_POOL_SIZE']
+    if is_cooperative():
+        from gevent.pool import Pool  # type: ignore
+        logger.debug('Running {} lookups concurrently'.format(len(items)))
+        return Pool(pool_size).map(run, items)
+    if threads:
+        logger.debug('Running {} lookups in threads'.format(len(items)))
+        with ThreadPoolExecutor(max_workers=min(pool_size, len(items))) as executor:
+            return list(executor.map(run, items))
+    return [func(item) for item in items]
+
+
+def is_cooperative():
+    if current_app.config['WORKER_CLASS'] not in COOPERATIVE_WORKER_CLASSES:
+        return False
+
+    try:
+        from gevent import monkey  # type: ignore
+    except ImportError:
+        return False
+
+    return monkey.is_module_patched('socket')
+
+
+def make_psycopg2_cooperative():
+    """Makes psycopg2, whose socket I/O happens in C and so can't be monkey-patched, yield to other greenlets"""
+    from psycopg2 import extensions  # type: ignore
+    extensions.set_wait_callback(_gevent_wait_callback)
+
+
+def _gevent_wait_callback(connection, timeout=None):
+    from gevent.socket import wait_read, wait_write  # type: ignore
+    from psycopg2 import extensions, OperationalError  # type: ignore
+
+    while True:
+        state = connection.poll()
+        if state == extensions.POLL_OK:
+            break
+        elif state == extensions.POLL_READ:
+            wait_read(connection.fileno(), timeout=timeout)
+        elif state == extensions.POLL_WRITE:
+            wait_write(connection.fileno(), timeout=timeout)
+        else:
+            raise OperationalError('Bad result from poll: {}'.format(state))
+
+
+def _with_app_context(app, func):
+    # Each greenlet (or thread) gets its own application context, so it works on its own scoped DB session,
+    # which is removed (and its connection returned to the pool) when the context is torn down.
+    def run(item):
+        with app.app_context():
+            return func(item)
+
+    return run
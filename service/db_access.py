@@ -1,14 +1,118 @@
 import hashlib
 import config
 import logging
-from sqlalchemy import false                                 # type: ignore
-from sqlalchemy.orm.strategy_options import Load             # type: ignore
-from service import db, legacy_transmission_queue
-from service.models import TitleRegisterData, UprnMapping, UserSearchAndResults, Validation
+from flask import current_app                                 # type: ignore
+from collections import namedtuple
+from sqlalchemy import and_, bindparam, cast, false, func, select, String, text  # type: ignore
+from sqlalchemy.dialects.postgresql import ARRAY, JSON                         # type: ignore
+from sqlalchemy.util import LRUCache                                           # type: ignore
+from service import audit_writer, circuit_breaker, db, legacy_transmission_queue, read_replicas
+from service.models import TitleLrUprn, TitleRegisterData, UprnMapping, UserSearchAndResults, Validation
 from datetime import datetime, timedelta
 
 logger = logging.getLogger(__name__)
 
+# The read paths return these records (namedtuples) rather than ORM instances, so reading a title builds no
+# identity map entries, instrumented attributes or session state. Each has the columns its statement selects.
+TitleRecord = namedtuple('TitleRecord', ['title_number', 'register_data', 'geometry_data', 'last_modified'])
+TitleWithOfficialCopyRecord = namedtuple(
+    'TitleWithOfficialCopyRecord',
+    ['title_number', 'register_data', 'geometry_data', 'official_copy_data', 'last_modified']
+)
+OfficialCopyRecord = namedtuple('OfficialCopyRecord', ['title_number', 'official_copy_data', 'last_modified'])
+TitleVersionRecord = namedtuple('TitleVersionRecord', ['title_number', 'last_modified'])
+RegisterDataRecord = namedtuple('RegisterDataRecord', ['title_number', 'register_data'])
+TitleSummaryRecord = namedtuple('TitleSummaryRecord', ['title_number', 'title_summary'])
+UprnMappingRecord = namedtuple('UprnMappingRecord', ['uprn', 'lr_uprn'])
+
+# The statements are built once, and their SQL is compiled once per database and kept in _compiled_cache, rather
+# than both being done again for every call. Lists are passed as arrays, so the SQL doesn't depend on their length.
+_titles = TitleRegisterData.__table__
+_title_lr_uprns = TitleLrUprn.__table__
+_uprn_mappings = UprnMapping.__table__
+_searches = UserSearchAndResults.__table__
+_compiled_cache = LRUCache(100)
+
+
+def _columns(table, record):
+    return [table.c[field] for field in record._fields]
+
+
+_title_is_current = _titles.c.is_deleted == false()
+_title_number_matches = _titles.c.title_number == bindparam('title_number')
+_title_number_is_any = cast(bindparam('title_numbers'), ARRAY(String)).any(_titles.c.title_number)
+
+SELECT_TITLE_VERSION = select(_columns(_titles, TitleVersionRecord)).where(
+    and_(_title_number_matches, _title_is_current)
+)
+SELECT_TITLE_REGISTER = select(_columns(_titles, TitleRecord)).where(and_(_title_number_matches, _title_is_current))
+SELECT_TITLE_REGISTERS = select(_columns(_titles, TitleRecord)).where(and_(_title_number_is_any, _title_is_current))
+SELECT_TITLES_WITH_OFFICIAL_COPIES = select(_columns(_titles, TitleWithOfficialCopyRecord)).where(
+    and_(_title_number_is_any, _title_is_current)
+)
+SELECT_TITLE_SUMMARIES = select(_columns(_titles, TitleSummaryRecord)).where(
+    and_(_title_number_is_any, _title_is_current)
+)
+SELECT_OFFICIAL_COPY = select(_columns(_titles, OfficialCopyRecord)).where(
+    and_(_title_number_matches, _title_is_current)
+)
+
+# Each sub-register is an object keyed by its name, e.g. {"A": [...]}. The requested ones are
+# kept in their original order. The sub-registers are cast to JSONB, so that this works both before and after
+# the cutover of 'manage.py jsonb' (see service/jsonb_migration.py), while official_copy_data may still be JSON.
+SELECT_OFFICIAL_COPY_SUB_REGISTERS = text(
+    "SELECT title_number, "
+    "json_build_object('sub_registers', COALESCE(("
+    "  SELECT json_agg(sub_register ORDER BY position) "
+    "  FROM jsonb_array_elements(CAST(official_copy_data -> 'sub_registers' AS jsonb)) "
+    "    WITH ORDINALITY AS sub_registers(sub_register, position) "
+    "  WHERE sub_register ?| CAST(:sub_register_names AS text[])"
+    "), '[]'::json)) AS official_copy_data, last_modified "
+    "FROM title_register_data "
+    "WHERE title_number = :title_number AND NOT is_deleted"
+).columns(official_copy_data=JSON)
+
+SELECT_MAPPED_LR_UPRN = select(_columns(_uprn_mappings, UprnMappingRecord)).where(
+    _uprn_mappings.c.uprn == bindparam('uprn')
+).limit(1)
+
+# By record. Looked up through the B-tree indexed title_lr_uprn table rather than the GIN index on lr_uprns.
+# Rows come in title number order, so an lr_uprn on several titles gets the same one from a single or a batch
+# lookup. The batch statements select each key (an lr_uprn, or an AddressBase uprn mapped to one) ahead of
+# the title containing it.
+_titles_by_lr_uprn = _titles.join(_title_lr_uprns, _title_lr_uprns.c.title_number == _titles.c.title_number)
+_title_lr_uprn_order = (_title_lr_uprns.c.lr_uprn, _titles.c.title_number)
+
+SELECT_TITLE_CONTAINING_LR_UPRN = {
+    record: select(_columns(_titles, record)).select_from(_titles_by_lr_uprn).where(
+        and_(_title_lr_uprns.c.lr_uprn == bindparam('lr_uprn'), _title_is_current)
+    ).order_by(*_title_lr_uprn_order).limit(1)
+    for record in (RegisterDataRecord, TitleSummaryRecord)
+}
+SELECT_TITLES_CONTAINING_LR_UPRNS = {
+    record: select([_title_lr_uprns.c.lr_uprn] + _columns(_titles, record)).select_from(_titles_by_lr_uprn).where(
+        and_(cast(bindparam('keys'), ARRAY(String)).any(_title_lr_uprns.c.lr_uprn), _title_is_current)
+    ).order_by(*_title_lr_uprn_order)
+    for record in (RegisterDataRecord, TitleSummaryRecord)
+}
+SELECT_TITLES_BY_UPRNS = {
+    record: select([_uprn_mappings.c.uprn] + _columns(_titles, record)).select_from(
+        _titles_by_lr_uprn.join(_uprn_mappings, _uprn_mappings.c.lr_uprn == _title_lr_uprns.c.lr_uprn)
+    ).where(
+        and_(cast(bindparam('keys'), ARRAY(String)).any(_uprn_mappings.c.uprn), _title_is_current)
+    ).order_by(_uprn_mappings.c.uprn, _titles.c.title_number)
+    for record in (RegisterDataRecord, TitleSummaryRecord)
+}
+
+SELECT_PRICE = select([Validation.__table__.c.price]).where(
+    Validation.__table__.c.product == bindparam('product')
+).limit(1)
+
+SELECT_LATEST_VIEW = select([_searches.c.viewed_datetime, _searches.c.valid]).where(and_(
+    _searches.c.user_id == bindparam('user_id'),
+    _searches.c.title_number == bindparam('title_number'),
+)).order_by(_searches.c.viewed_datetime.desc().nullslast()).limit(1)
+
 
 def save_user_search_details(params):
     """
@@ -29,7 +133,7 @@ def save_user_search_details(params):
     # Max. length of corresponding LRO_SESSION_ID is 64 for DB2 but we don't care much about that at present ;-)
     cart_id = hash.hexdigest()[:30]
 
-    user_search_request = UserSearchAndResults(
+    audit_values = dict(
         search_datetime=params['MC_timestamp'],
         user_id=params['MC_userId'],
         title_number=params['MC_titleNumber'],
@@ -43,9 +147,16 @@ def save_user_search_details(params):
         valid=False,
     )
     logger.info('Sending to PostGres')
-    # Insert to DB.
-    db.session.add(user_search_request)
-    db.session.commit()
+    # Insert to DB. The queue has a breaker of its own, so only this part is made through Postgres's.
+    with circuit_breaker.protected(circuit_breaker.POSTGRES):
+        if current_app.config['AUDIT_GROUP_COMMIT']:
+            # Committed along with the records of concurrent requests; returns once durable
+            audit_writer.write(db.engine, UserSearchAndResults.__table__, audit_values,
+                               current_app.config['AUDIT_GROUP_COMMIT_MAX_BATCH'],
+                               current_app.config['AUDIT_GROUP_COMMIT_MAX_WAIT_MS'])
+        else:
+            db.session.add(UserSearchAndResults(**audit_values))
+            db.session.commit()
     logger.info('Finished sending to PostGres')
 
     # Put message on queue.
@@ -58,6 +169,8 @@ def save_user_search_details(params):
     return cart_id
 
 
+# Always read from the primary: it's asked right after the search is saved, which replicas may not have yet
+@circuit_breaker.protected(circuit_breaker.POSTGRES)
 def user_can_view(user_id, title_number):
     """
     Get user's view details, after payment.
@@ -70,9 +183,9 @@ def user_can_view(user_id, title_number):
     status = False
 
     # Get relevant record (only one assumed).
-    kwargs = {"user_id": user_id, "title_number": title_number}
+    # Not bounded by search_datetime: a search bought long ago may be viewed for the first time today
     logger.info('retreiving date and time of viewing')
-    view = UserSearchAndResults.query.filter_by(**kwargs).order_by(UserSearchAndResults.viewed_datetime.desc().nullslast()).first()
+    view = _execute(SELECT_LATEST_VIEW, user_id=user_id, title_number=title_number).first()
 
     # 'viewed_datetime' denotes initial "access time" usage; name reflects different, earlier usage.
     if view and view.viewed_datetime and view.valid:
@@ -86,25 +199,21 @@ def user_can_view(user_id, title_number):
     return status
 
 
+@circuit_breaker.protected(circuit_breaker.POSTGRES)
+@read_replicas.read_from_replica
 def get_price(product):
-    result = Validation.query.filter_by(product=product).first()
-    return result.price
+    """Get the product's price, or None if there's no such product"""
+    result = _execute(SELECT_PRICE, product=product).first()
+    return result.price if result else None
 
 
+@circuit_breaker.protected(circuit_breaker.POSTGRES)
+@read_replicas.read_from_replica
 def get_title_register(title_number):
     if title_number:
         logger.debug('Start get_title_register using {}'.format(title_number))
         # Will retrieve the first matching title that is not marked as deleted
-        result = TitleRegisterData.query.options(
-            Load(TitleRegisterData).load_only(
-                TitleRegisterData.title_number.name,
-                TitleRegisterData.register_data.name,
-                TitleRegisterData.geometry_data.name
-            )
-        ).filter(
-            TitleRegisterData.title_number == title_number,
-            TitleRegisterData.is_deleted == false()
-        ).first()
+        result = _read_first(TitleRecord, SELECT_TITLE_REGISTER, title_number=title_number)
         logger.debug('Returning result: {}'.format(result))
         logger.debug('End get_title_register')
         return result
@@ -113,71 +222,193 @@ def get_title_register(title_number):
         raise TypeError('Title number must not be None.')
 
 
+@circuit_breaker.protected(circuit_breaker.POSTGRES)
+@read_replicas.read_from_replica
+def get_title_version(title_number):
+    """
+    Get the title's number and last_modified only, which key its cached bodies (see server.title_cache_key),
+    without reading any of its data.
+    """
+    logger.debug('Start get_title_version using {}'.format(title_number))
+    result = _read_first(TitleVersionRecord, SELECT_TITLE_VERSION, title_number=title_number)
+    logger.debug('End get_title_version')
+    return result
+
+
+@circuit_breaker.protected(circuit_breaker.POSTGRES)
+@read_replicas.read_from_replica
 def get_title_registers(title_numbers):
     logger.debug('Start get_title_registers using {}'.format(title_numbers))
     # Will retrieve matching titles that are not marked as deleted
-    fields = [TitleRegisterData.title_number.name, TitleRegisterData.register_data.name,
-              TitleRegisterData.geometry_data.name]
-    query = TitleRegisterData.query.options(Load(TitleRegisterData).load_only(*fields))
-    results = query.filter(TitleRegisterData.title_number.in_(title_numbers),
-                           TitleRegisterData.is_deleted == false()).all()
+    results = _read(TitleRecord, SELECT_TITLE_REGISTERS, title_numbers=list(title_numbers))
     logger.debug('Returning results: {}'.format(results))
     logger.debug('End get_title_registers ')
     return results
 
 
-def get_official_copy_data(title_number):
+@circuit_breaker.protected(circuit_breaker.POSTGRES)
+@read_replicas.read_from_replica
+def get_title_registers_with_official_copies(title_numbers):
+    """Get the titles' register and official copy data, for all the title routes at once."""
+    logger.debug('Start get_title_registers_with_official_copies using {}'.format(title_numbers))
+    results = _read(TitleWithOfficialCopyRecord, SELECT_TITLES_WITH_OFFICIAL_COPIES, title_numbers=list(title_numbers))
+    logger.debug('End get_title_registers_with_official_copies')
+    return results
+
+
+@circuit_breaker.protected(circuit_breaker.POSTGRES)
+@read_replicas.read_from_replica
+def get_most_searched_title_numbers(since, limit):
+    """
+    Get the number of searches made since the given time, and the (title_number, searches) of the
+    most searched titles among them, most searched first.
+    """
+    logger.debug('Start get_most_searched_title_numbers since {}'.format(since))
+    # Bounded by search_datetime, so that only the latest partitions are read
+    searches = func.count(UserSearchAndResults.title_number)
+    recent = UserSearchAndResults.search_datetime >= since
+    total = db.session.query(searches).filter(recent).scalar()
+    ranked = db.session.query(UserSearchAndResults.title_number, searches).filter(recent).group_by(
+        UserSearchAndResults.title_number
+    ).order_by(searches.desc(), UserSearchAndResults.title_number).limit(limit).all()
+    logger.debug('End get_most_searched_title_numbers')
+    return total, [(title_number, count) for title_number, count in ranked]
+
+
+@circuit_breaker.protected(circuit_breaker.POSTGRES)
+@read_replicas.read_from_replica
+def get_official_copy_data(title_number, sub_register_names=None):
+    """
+    Get the title's official copy data.
+
+    If sub_register_names is given, only the sub-registers with those names are returned. They are
+    selected by Postgres, so the others are never sent to (or decoded by) the service.
+    """
     logger.debug('Start get_official_copy_data using: {}'.format(title_number))
-    result = TitleRegisterData.query.options(
-        Load(TitleRegisterData).load_only(
-            TitleRegisterData.title_number.name,
-            TitleRegisterData.official_copy_data.name
-        )
-    ).filter(
-        TitleRegisterData.title_number == title_number,
-        TitleRegisterData.is_deleted == false()
-    ).first()
+    if sub_register_names is not None:
+        result = _read_first(OfficialCopyRecord, SELECT_OFFICIAL_COPY_SUB_REGISTERS, title_number=title_number,
+                             sub_register_names=list(sub_register_names))
+        logger.debug('End get_official_copy_data')
+        return result
+
+    result = _read_first(OfficialCopyRecord, SELECT_OFFICIAL_COPY, title_number=title_number)
     logger.debug('Returning result: {}'.format(result))
     logger.debug('End get_official_copy_data')
     return result
 
 
+@circuit_breaker.protected(circuit_breaker.POSTGRES)
+@read_replicas.read_from_replica
 def get_title_number_and_register_data(lr_uprn):
     logger.debug('Start get_title_number_and_register_data using: {}'.format(lr_uprn))
-    amended_lr_uprn = '{' + lr_uprn + '}'
-    result = TitleRegisterData.query.options(
-        Load(TitleRegisterData).load_only(
-            TitleRegisterData.lr_uprns,
-            TitleRegisterData.title_number,
-            TitleRegisterData.register_data
-        )
-    ).filter(
-        TitleRegisterData.lr_uprns.contains(amended_lr_uprn),
-        TitleRegisterData.is_deleted == false()
-    ).all()
-    logger.debug('Returning result: {}'.format(result))
+    result = _read_first(RegisterDataRecord, SELECT_TITLE_CONTAINING_LR_UPRN[RegisterDataRecord], lr_uprn=lr_uprn)
     logger.debug('End get_title_number_and_register_data')
-    if result:
-        return result[0]
-    else:
-        return None
+    return result
+
+
+@circuit_breaker.protected(circuit_breaker.POSTGRES)
+@read_replicas.read_from_replica
+def get_title_number_and_summary(lr_uprn):
+    logger.debug('Start get_title_number_and_summary using: {}'.format(lr_uprn))
+    result = _read_first(TitleSummaryRecord, SELECT_TITLE_CONTAINING_LR_UPRN[TitleSummaryRecord], lr_uprn=lr_uprn)
+    logger.debug('End get_title_number_and_summary')
+    return result
+
+
+@circuit_breaker.protected(circuit_breaker.POSTGRES)
+@read_replicas.read_from_replica
+def get_titles_and_register_data(lr_uprns):
+    """Returns a dict of the title (with register data) containing each of the given lr_uprns that has one"""
+    logger.debug('Start get_titles_and_register_data using: {}'.format(lr_uprns))
+    result = _get_titles_containing_lr_uprns(lr_uprns, RegisterDataRecord)
+    logger.debug('End get_titles_and_register_data')
+    return result
+
+
+@circuit_breaker.protected(circuit_breaker.POSTGRES)
+@read_replicas.read_from_replica
+def get_titles_and_summaries(lr_uprns):
+    """Returns a dict of the title (with its summary) containing each of the given lr_uprns that has one"""
+    logger.debug('Start get_titles_and_summaries using: {}'.format(lr_uprns))
+    result = _get_titles_containing_lr_uprns(lr_uprns, TitleSummaryRecord)
+    logger.debug('End get_titles_and_summaries')
+    return result
+
+
+@circuit_breaker.protected(circuit_breaker.POSTGRES)
+@read_replicas.read_from_replica
+def get_titles_and_register_data_by_uprn(uprns):
+    """
+    Returns a dict of the title (with register data) for each of the given AddressBase uprns that has one,
+    found through its lr_uprn as get_mapped_lruprn and get_title_number_and_register_data would
+    """
+    logger.debug('Start get_titles_and_register_data_by_uprn using: {}'.format(uprns))
+    result = _get_titles_by_key(SELECT_TITLES_BY_UPRNS[RegisterDataRecord], RegisterDataRecord, uprns)
+    logger.debug('End get_titles_and_register_data_by_uprn')
+    return result
+
+
+@circuit_breaker.protected(circuit_breaker.POSTGRES)
+@read_replicas.read_from_replica
+def get_titles_and_summaries_by_uprn(uprns):
+    """Returns a dict of the title (with its summary) for each of the given AddressBase uprns that has one"""
+    logger.debug('Start get_titles_and_summaries_by_uprn using: {}'.format(uprns))
+    result = _get_titles_by_key(SELECT_TITLES_BY_UPRNS[TitleSummaryRecord], TitleSummaryRecord, uprns)
+    logger.debug('End get_titles_and_summaries_by_uprn')
+    return result
+
+
+@circuit_breaker.protected(circuit_breaker.POSTGRES)
+@read_replicas.read_from_replica
+def get_title_summaries(title_numbers):
+    logger.debug('Start get_title_summaries using {}'.format(title_numbers))
+    # Will retrieve matching titles that are not marked as deleted
+    results = _read(TitleSummaryRecord, SELECT_TITLE_SUMMARIES, title_numbers=list(title_numbers))
+    logger.debug('End get_title_summaries')
+    return results
 
 
+@circuit_breaker.protected(circuit_breaker.POSTGRES)
+@read_replicas.read_from_replica
 def get_mapped_lruprn(address_base_uprn):
     logger.debug('Start get_mapped_lruprn using {}'.format(address_base_uprn))
-    result = UprnMapping.query.options(
-        Load(UprnMapping).load_only(
-            UprnMapping.lr_uprn.name,
-            UprnMapping.uprn.name
-        )
-    ).filter(
-        UprnMapping.uprn == address_base_uprn
-    ).first()
+    result = _read_first(UprnMappingRecord, SELECT_MAPPED_LR_UPRN, uprn=address_base_uprn)
     logger.debug('Returning result: {}'.format(result))
     logger.debug('End get_mapped_lruprn')
     return result
 
 
+def _get_titles_containing_lr_uprns(lr_uprns, record):
+    return _get_titles_by_key(SELECT_TITLES_CONTAINING_LR_UPRNS[record], record, lr_uprns)
+
+
+def _get_titles_by_key(statement, record, keys):
+    # The statement's rows are each key followed by a title, so the first title of each key is kept
+    if not keys:
+        return {}
+    titles = {}
+    for row in _execute(statement, keys=list(set(keys))):
+        titles.setdefault(row[0], record._make(row[1:]))
+    logger.debug('Returning {} titles for {} keys'.format(len(titles), len(keys)))
+    return titles
+
+
+def _read(record, statement, **params):
+    """Returns the rows of the statement as records"""
+    return [record._make(row) for row in _execute(statement, **params)]
+
+
+def _read_first(record, statement, **params):
+    row = _execute(statement, **params).first()
+    return record._make(row) if row else None
+
+
+def _execute(statement, **params):
+    # Through the session, so that replica routing applies, but with none of the ORM
+    connection = db.session.connection(clause=statement).execution_options(compiled_cache=_compiled_cache)
+    return connection.execute(statement, **params)
+
+
 def _get_time():
     # Postgres datetime format is YYYY-MM-DD MM:HH:SS.mm
     _now = datetime.now()
@@ -0,0 +1,99 @@
+import logging
+import os
+import time
+from sqlalchemy import event, exc                # type: ignore
+from sqlalchemy.pool import QueuePool            # type: ignore
+
+from service import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class InstrumentedQueuePool(QueuePool):
+    """A QueuePool that records how long each checkout waits for a connection"""
+
+    def _do_get(self):
+        start = time.time()
+        try:
+            return super(InstrumentedQueuePool, self)._do_get()
+        finally:
+            metrics.observe('db_pool.checkout_wait_ms', (time.time() - start) * 1000)
+
+
+class PrePingQueuePool(InstrumentedQueuePool):
+    """An InstrumentedQueuePool that tests every connection before handing it out"""
+
+
+def configure_engine_options(config, options):
+    """Adds the pool class to the options Flask-SQLAlchemy creates its engine with"""
+    options['poolclass'] = PrePingQueuePool if config['DB_POOL_PRE_PING'] else InstrumentedQueuePool
+
+
+def register_gauges(get_engine):
+    metrics.register_gauge('db_pool.size', lambda: get_engine().pool.size())
+    metrics.register_gauge('db_pool.checked_out', lambda: get_engine().pool.checkedout())
+    # The pool counts overflow from -pool_size, so anything below zero means none
+    metrics.register_gauge('db_pool.overflow', lambda: max(0, get_engine().pool.overflow()))
+
+
+def reset_after_fork(engine):
+    """
+    Replaces the pool inherited from the parent process with an empty one.
+
+    The inherited connections are dropped rather than closed, as closing them would
+    end the sessions the parent is still using.
+    """
+    engine.pool = engine.pool.recreate()
+
+
+def warm_up(engine, number_of_connections):
+    """Opens the given number of connections, so that the first requests don't have to"""
+    if number_of_connections <= 0:
+        return
+
+    start = time.time()
+    connections = []
+    try:
+        for _ in range(number_of_connections):
+            connections.append(engine.connect())
+    finally:
+        for connection in connections:
+            connection.close()
+
+    logger.info('Opened {} DB connections in {:.0f}ms'.format(len(connections), (time.time() - start) * 1000))
+
+
+def _ping_connection(dbapi_connection, connection_record, connection_proxy):
+    cursor = dbapi_connection.cursor()
+    try:
+        cursor.execute('SELECT 1')
+    except Exception:
+        # The pool discards the connection and retries the checkout with a new one
+        raise exc.DisconnectionError()
+    finally:
+        cursor.close()
+
+
+def _count_connect(dbapi_connection, connection_record):
+    connection_record.info['pid'] = os.getpid()
+    metrics.increment('db_pool.connections_opened')
+
+
+def _check_owner_process(dbapi_connection, connection_record, connection_proxy):
+    # Guards against using a connection opened by the parent of a forked process
+    if connection_record.info['pid'] != os.getpid():
+        connection_record.connection = connection_proxy.connection = None
+        raise exc.DisconnectionError(
+            'Connection record belongs to pid {}, attempting to check out in pid {}'.format(
+                connection_record.info['pid'], os.getpid())
+        )
+
+
+def _count_invalidation(dbapi_connection, connection_record, exception):
+    metrics.increment('db_pool.invalidations')
+
+
+event.listen(InstrumentedQueuePool, 'checkout', _check_owner_process)
+event.listen(PrePingQueuePool, 'checkout', _ping_connection)
+event.listen(InstrumentedQueuePool, 'connect', _count_connect)
+event.listen(InstrumentedQueuePool, 'invalidate', _count_invalidation)
@@ -1,12 +1,50 @@
 import logging
-from elasticsearch import Elasticsearch  # type: ignore
-from elasticsearch_dsl import Search     # type: ignore
+import time
+from flask import current_app  # type: ignore
 
-from service import app
+from service import circuit_breaker, metrics
+from service.process_local import ProcessLocal
 
 logger = logging.getLogger(__name__)
 
-
+SUGGESTION_DOC_TYPE = 'address_suggestion'
+SUGGESTION_FIELD = 'suggest'
+# Suggestions are also indexed from the second and third words of an address, so that typing the street
+# name finds '12 High Street' as well as typing the house number
+SUGGESTION_INPUT_OFFSETS = 3
+
+# Settings and mapping of each address suggestion index. The index name in the config is an alias, moved
+# to a freshly built index by reindex_address_suggestions.
+SUGGESTION_INDEX_BODY = {
+    'settings': {
+        'analysis': {
+            'analyzer': {
+                # Unlike the 'simple' analyzer, keeps house numbers
+                'address_suggestion': {'type': 'custom', 'tokenizer': 'standard', 'filter': ['lowercase']},
+            },
+        },
+    },
+    'mappings': {
+        SUGGESTION_DOC_TYPE: {
+            '_all': {'enabled': False},
+            'properties': {
+                SUGGESTION_FIELD: {
+                    'type': 'completion',
+                    'index_analyzer': 'address_suggestion',
+                    'search_analyzer': 'address_suggestion',
+                    'payloads': True,
+                    'max_input_length': 100,
+                },
+            },
+        },
+    },
+}
+
+# One client (and so one connection pool) per process and endpoint
+_client = ProcessLocal(lambda endpoint_url: _create_client(endpoint_url))
+
+
+@circuit_breaker.protected(circuit_breaker.ELASTICSEARCH)
 def get_properties_for_postcode(postcode, page_size, page_number):
     logger.debug('Start get_properties_for_postcode using {}'.format(postcode))
     search = _create_search(_get_postcode_search_doc_type())
@@ -19,6 +57,7 @@ def get_properties_for_postcode(postcode, page_size, page_number):
     return query[start_index:end_index].execute().hits
 
 
+@circuit_breaker.protected(circuit_breaker.ELASTICSEARCH)
 def get_properties_for_address(address, page_size, page_number):
     logger.debug('Start get_properties_for_address using {}'.format(address))
     search = _create_search(_get_address_search_doc_type())
@@ -28,17 +67,105 @@ def get_properties_for_address(address, page_size, page_number):
     return query[start_index:end_index].execute().hits
 
 
+@circuit_breaker.protected(circuit_breaker.ELASTICSEARCH)
+def get_address_suggestions(text, size):
+    """
+    Returns up to size {'title_number', 'address'} dicts for the addresses that start with the text.
+
+    Gives up with no suggestions after ADDRESS_SUGGESTION_TIMEOUT_MS, as a late suggestion is of no use
+    to someone who has carried on typing. Titles sharing an address are suggested once.
+    """
+    from elasticsearch.exceptions import ConnectionTimeout  # type: ignore
+    logger.debug('Start get_address_suggestions using {}'.format(text))
+    body = {'addresses': {'text': text.lower(), 'completion': {'field': SUGGESTION_FIELD, 'size': size}}}
+    start = time.time()
+    try:
+        response = _get_client().suggest(
+            body=body, index=_get_suggestion_index_name(), request_timeout=_get_suggestion_timeout_ms() / 1000
+        )
+    except ConnectionTimeout:
+        logger.warning('Address suggestions for {} timed out'.format(text))
+        metrics.increment('address_suggestions.timeouts')
+        return []
+    finally:
+        metrics.observe('address_suggestions.elasticsearch_ms', (time.time() - start) * 1000)
+
+    options = response['addresses'][0]['options'] if response.get('addresses') else []
+    logger.debug('End get_address_suggestions')
+    return [{'title_number': option['payload']['title_number'], 'address': option['text']} for option in options]
+
+
+def reindex_address_suggestions(chunk_size=500):
+    """
+    Builds a new address suggestion index from the address search documents, then moves the alias to it.
+
+    Suggestions keep coming from the old index until the new one is complete. Returns the number of
+    suggestions indexed.
+    """
+    from elasticsearch import helpers  # type: ignore
+    client = _get_client()
+    alias = _get_suggestion_index_name()
+    new_index = '{}_{}'.format(alias, time.strftime('%Y%m%d%H%M%S'))
+
+    logger.info('Building address suggestion index {}'.format(new_index))
+    client.indices.create(index=new_index, body=SUGGESTION_INDEX_BODY)
+    addresses = helpers.scan(client, query={'query': {'match_all': {}}}, index=_get_index_name(),
+                             doc_type=_get_address_search_doc_type())
+    actions = (_make_suggestion_action(new_index, address['_source']) for address in addresses)
+    indexed, errors = helpers.bulk(client, actions, chunk_size=chunk_size)
+    if errors:
+        raise Exception('Failed to index {} address suggestions into {}'.format(len(errors), new_index))
+    client.indices.refresh(index=new_index)
+
+    old_indexes = list(client.indices.get_alias(name=alias).keys()) if client.indices.exists_alias(name=alias) else []
+    alias_actions = [{'remove': {'index': index, 'alias': alias}} for index in old_indexes]
+    alias_actions.append({'add': {'index': new_index, 'alias': alias}})
+    client.indices.update_aliases(body={'actions': alias_actions})
+    for index in old_indexes:
+        client.indices.delete(index=index)
+
+    logger.info('Indexed {} address suggestions into {}, now aliased as {}'.format(indexed, new_index, alias))
+    return indexed
+
+
+@circuit_breaker.protected(circuit_breaker.ELASTICSEARCH)
 def get_info():
-    return Elasticsearch([_get_elasticsearch_endpoint_url()]).info()
+    return _get_client().info()
 
 
 def _create_search(doc_type):
-    client = Elasticsearch([_get_elasticsearch_endpoint_url()])
-    search = Search(using=client, index=_get_index_name(), doc_type=doc_type)
+    # Only the address search routes need elasticsearch_dsl, so it's imported on first use
+    from elasticsearch_dsl import Search  # type: ignore
+    search = Search(using=_get_client(), index=_get_index_name(), doc_type=doc_type)
     search = search[0:_get_max_number_search_results()]
     return search
 
 
+def _get_client():
+    return _client.get(_get_elasticsearch_endpoint_url())
+
+
+def _create_client(endpoint_url):
+    from elasticsearch import Elasticsearch  # type: ignore
+    return Elasticsearch([endpoint_url])
+
+
+def _make_suggestion_action(index, address):
+    address_string = address['address_string']
+    words = address_string.lower().split()
+    return {
+        '_index': index,
+        '_type': SUGGESTION_DOC_TYPE,
+        '_source': {
+            SUGGESTION_FIELD: {
+                'input': [' '.join(words[offset:]) for offset in range(min(len(words), SUGGESTION_INPUT_OFFSETS))],
+                'output': address_string,
+                'payload': {'title_number': address['title_number']},
+            },
+        },
+    }
+
+
 def _get_start_and_end_indexes(page_number, page_size):
     start_index = page_number * page_size
     end_index = start_index + page_size
@@ -46,24 +173,32 @@ def _get_start_and_end_indexes(page_number, page_size):
 
 
 def _get_index_name():
-    return app.config['ELASTICSEARCH_INDEX_NAME']
+    return current_app.config['ELASTICSEARCH_INDEX_NAME']
+
+
+def _get_suggestion_index_name():
+    return current_app.config['ADDRESS_SUGGESTION_INDEX_NAME']
+
+
+def _get_suggestion_timeout_ms():
+    return current_app.config['ADDRESS_SUGGESTION_TIMEOUT_MS']
 
 
 def _get_max_number_search_results():
-    return app.config['MAX_NUMBER_SEARCH_RESULTS']
+    return current_app.config['MAX_NUMBER_SEARCH_RESULTS']
 
 
 def _get_page_size():
-    return app.config['SEARCH_RESULTS_PER_PAGE']
+    return current_app.config['SEARCH_RESULTS_PER_PAGE']
 
 
 def _get_elasticsearch_endpoint_url():
-    return app.config['ELASTICSEARCH_ENDPOINT_URI']
+    return current_app.config['ELASTICSEARCH_ENDPOINT_URI']
 
 
 def _get_postcode_search_doc_type():
-    return app.config['POSTCODE_SEARCH_DOC_TYPE']
+    return current_app.config['POSTCODE_SEARCH_DOC_TYPE']
 
 
 def _get_address_search_doc_type():
-    return app.config['ADDRESS_SEARCH_DOC_TYPE']
+    return current_app.config['ADDRESS_SEARCH_DOC_TYPE']
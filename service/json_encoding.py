@@ -0,0 +1,65 @@
+"""
+Encodes the JSON bodies of the API's responses, with the encoder named by JSON_ENCODER in config.py:
+
+- 'json': the standard library's json module
+- 'orjson': orjson, several times quicker on large register and geometry data (needs orjson to be installed)
+- 'auto': orjson if it's installed, otherwise json
+
+Whichever is used, bodies are compact (no indentation or spaces) and decode to the same values. Values JSON has
+no type for are encoded as Flask's jsonify did: datetimes as HTTP dates, UUIDs as strings.
+"""
+import json
+import uuid
+from datetime import datetime
+from flask import current_app      # type: ignore
+from werkzeug.http import http_date  # type: ignore
+
+try:
+    import orjson  # type: ignore
+except ImportError:
+    orjson = None
+
+JSON_CONTENT_TYPE = 'application/json'
+
+
+def _default(value):
+    if isinstance(value, datetime):
+        return http_date(value)
+    if isinstance(value, uuid.UUID):
+        return str(value)
+    if hasattr(value, '__html__'):
+        return str(value.__html__())
+    raise TypeError('{!r} is not JSON serializable'.format(value))
+
+
+def _encode_with_json(body):
+    return json.dumps(body, separators=(',', ':'), default=_default).encode('utf-8')
+
+
+def _encode_with_orjson(body):
+    # orjson would encode datetimes in ISO 8601 and refuse keys that aren't strings, which json converts
+    return orjson.dumps(body, default=_default, option=orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS)
+
+
+ENCODERS = {
+    'json': _encode_with_json,
+    'orjson': _encode_with_orjson,
+}
+
+
+def get_encoder(name):
+    """Returns the named encoder, a function of a body (e.g. a dict) to its UTF-8 encoded JSON"""
+    if name == 'auto':
+        name = 'orjson' if orjson else 'json'
+    if name not in ENCODERS:
+        raise ValueError('Unknown JSON encoder {}, expected auto or one of {}'.format(
+            name, ', '.join(sorted(ENCODERS))))
+    if name == 'orjson' and orjson is None:
+        raise ValueError('The orjson JSON encoder needs orjson to be installed')
+    return ENCODERS[name]
+
+
+def json_response(body, status=200):
+    """Returns a response of the body encoded as JSON, in place of Flask's jsonify"""
+    encode = get_encoder(current_app.config['JSON_ENCODER'])
+    return current_app.response_class(encode(body), status=status, mimetype=JSON_CONTENT_TYPE)
@@ -0,0 +1,217 @@
+"""
+Converts the JSON columns of title_register_data to JSONB while the table stays in use.
+
+The steps, each run through manage.py (see 'python manage.py jsonb --help'):
+
+1. prepare: adds a JSONB copy of each column, kept up to date by a trigger on every write
+2. backfill: copies the existing rows in throttled batches, recording progress so it can be resumed
+3. cutover: swaps the copies in for the JSON columns, in one short transaction
+4. create_indexes: builds the expression indexes without blocking writes
+"""
+import logging
+import time
+from sqlalchemy import create_engine, text  # type: ignore
+from sqlalchemy.pool import NullPool          # type: ignore
+
+logger = logging.getLogger(__name__)
+
+TABLE_NAME = 'title_register_data'
+JSON_COLUMNS = ('register_data', 'geometry_data', 'official_copy_data')
+MIGRATION_NAME = 'title_register_data_jsonb'
+TRIGGER_NAME = 'title_register_data_jsonb_sync'
+FUNCTION_NAME = 'title_register_data_jsonb_sync'
+
+# Keys that queries filter or sort on, by index name
+EXPRESSION_INDEXES = {
+    'idx_title_register_data_tenure': "(register_data ->> 'tenure')",
+}
+
+CREATE_PROGRESS_TABLE = (
+    'CREATE TABLE IF NOT EXISTS online_migration_progress ('
+    '  name varchar(100) PRIMARY KEY,'
+    '  last_key varchar(100),'
+    '  rows_done bigint NOT NULL DEFAULT 0,'
+    '  started timestamp NOT NULL DEFAULT now(),'
+    '  updated timestamp NOT NULL DEFAULT now(),'
+    '  completed boolean NOT NULL DEFAULT false'
+    ')'
+)
+
+
+def prepare(engine):
+    """Adds the JSONB columns and the trigger that fills them on every insert and update"""
+    with engine.begin() as connection:
+        connection.execute(CREATE_PROGRESS_TABLE)
+        if not is_in_progress(connection):
+            # Starting afresh, so any progress recorded is from an earlier conversion
+            connection.execute(text('DELETE FROM online_migration_progress WHERE name = :name'), name=MIGRATION_NAME)
+        for column in JSON_COLUMNS:
+            if not _column_exists(connection, _jsonb_column(column)):
+                connection.execute('ALTER TABLE {} ADD COLUMN {} jsonb'.format(TABLE_NAME, _jsonb_column(column)))
+
+        assignments = ' '.join('NEW.{} := NEW.{}::jsonb;'.format(_jsonb_column(column), column) for column in JSON_COLUMNS)
+        connection.execute(
+            'CREATE OR REPLACE FUNCTION {}() RETURNS trigger AS $$ BEGIN {} RETURN NEW; END; $$ LANGUAGE plpgsql'.format(
+                FUNCTION_NAME, assignments)
+        )
+        connection.execute('DROP TRIGGER IF EXISTS {} ON {}'.format(TRIGGER_NAME, TABLE_NAME))
+        # Only fires when the JSON columns are written, so the backfill's own updates don't trigger it
+        connection.execute('CREATE TRIGGER {} BEFORE INSERT OR UPDATE OF {} ON {} FOR EACH ROW EXECUTE PROCEDURE {}()'.format(
+            TRIGGER_NAME, ', '.join(JSON_COLUMNS), TABLE_NAME, FUNCTION_NAME))
+
+        connection.execute(
+            text('INSERT INTO online_migration_progress (name) SELECT :name WHERE NOT EXISTS '
+                 '(SELECT 1 FROM online_migration_progress WHERE name = :name)'),
+            name=MIGRATION_NAME,
+        )
+    logger.info('Prepared {} for conversion to JSONB'.format(TABLE_NAME))
+
+
+def backfill(engine, batch_size=1000, pause_seconds=0.1, max_batches=None):
+    """
+    Copies the JSON columns of existing rows, batch_size rows per transaction in title number order.
+
+    Pauses between batches to leave room for the live workload. Progress is committed with each batch,
+    so an interrupted backfill carries on from where it stopped. Returns True when all rows are done.
+    """
+    progress = get_progress(engine)
+    if progress is None:
+        raise Exception('The JSONB migration has not been prepared')
+
+    last_key, rows_done = progress['last_key'], progress['rows_done']
+    total_rows = _estimate_row_count(engine)
+    start = time.time()
+    batches = rows_this_run = 0
+    set_clause = ', '.join('{} = {}::jsonb'.format(_jsonb_column(column), column) for column in JSON_COLUMNS)
+    copy_batch = text(
+        'WITH batch AS ('
+        '  SELECT title_number FROM {0} WHERE title_number > :last_key ORDER BY title_number LIMIT :batch_size'
+        ') '
+        'UPDATE {0} SET {1} FROM batch WHERE {0}.title_number = batch.title_number '
+        'RETURNING {0}.title_number'.format(TABLE_NAME, set_clause)
+    )
+
+    while max_batches is None or batches < max_batches:
+        with engine.begin() as connection:
+            keys = [row[0] for row in connection.execute(copy_batch, last_key=last_key or '', batch_size=batch_size)]
+            if not keys:
+                _save_progress(connection, last_key, rows_done, completed=True)
+                logger.info('Backfill complete: {} rows'.format(rows_done))
+                return True
+
+            last_key, rows_done, rows_this_run = max(keys), rows_done + len(keys), rows_this_run + len(keys)
+            _save_progress(connection, last_key, rows_done, completed=False)
+
+        batches += 1
+        elapsed = time.time() - start
+        logger.info('Backfilled {} of about {} rows ({:.0f} rows/s), up to title {}'.format(
+            rows_done, total_rows, rows_this_run / elapsed if elapsed else 0, last_key))
+        time.sleep(pause_seconds)
+
+    return False
+
+
+def cutover(engine, lock_timeout_ms=5000):
+    """
+    Replaces the JSON columns with their JSONB copies.
+
+    Runs in one transaction holding an exclusive lock on the table, which is given up (and the
+    cutover can simply be retried) if it can't be taken within lock_timeout_ms.
+    """
+    progress = get_progress(engine)
+    if not progress or not progress['completed']:
+        raise Exception('The JSONB backfill has not completed')
+
+    with engine.begin() as connection:
+        connection.execute("SET LOCAL lock_timeout = '{:d}ms'".format(lock_timeout_ms))
+        connection.execute('LOCK TABLE {} IN ACCESS EXCLUSIVE MODE'.format(TABLE_NAME))
+
+        # Rows the backfill or the trigger have missed, if any, are copied while nothing else can write
+        missed = ' OR '.join('({} IS NOT NULL AND {} IS NULL)'.format(column, _jsonb_column(column)) for column in JSON_COLUMNS)
+        set_clause = ', '.join('{} = {}::jsonb'.format(_jsonb_column(column), column) for column in JSON_COLUMNS)
+        connection.execute('UPDATE {} SET {} WHERE {}'.format(TABLE_NAME, set_clause, missed))
+
+        connection.execute('DROP TRIGGER {} ON {}'.format(TRIGGER_NAME, TABLE_NAME))
+        connection.execute('DROP FUNCTION {}()'.format(FUNCTION_NAME))
+        for column in JSON_COLUMNS:
+            connection.execute('ALTER TABLE {} DROP COLUMN {}'.format(TABLE_NAME, column))
+            connection.execute('ALTER TABLE {} RENAME COLUMN {} TO {}'.format(TABLE_NAME, _jsonb_column(column), column))
+    logger.info('Cut over {} to JSONB'.format(TABLE_NAME))
+
+
+def create_indexes(engine):
+    """Creates the expression indexes concurrently, so that writes carry on while they're built"""
+    # A connection of its own, as the pool's connections may already be in a transaction (e.g. from the pre-ping)
+    autocommit_engine = create_engine(engine.url, isolation_level='AUTOCOMMIT', poolclass=NullPool)
+    with autocommit_engine.connect() as connection:
+        for index_name, expression in sorted(EXPRESSION_INDEXES.items()):
+            if _index_exists(connection, index_name):
+                continue
+            logger.info('Creating index {}'.format(index_name))
+            connection.execute('CREATE INDEX CONCURRENTLY {} ON {} ({})'.format(index_name, TABLE_NAME, expression))
+
+
+def get_progress(engine):
+    with engine.connect() as connection:
+        if not _table_exists(connection, 'online_migration_progress'):
+            return None
+        row = connection.execute(
+            text('SELECT last_key, rows_done, started, updated, completed FROM online_migration_progress '
+                 'WHERE name = :name'),
+            name=MIGRATION_NAME,
+        ).first()
+    return dict(row.items()) if row else None
+
+
+def is_in_progress(connection):
+    """Whether the migration has been prepared, but not cut over"""
+    return _column_exists(connection, _jsonb_column(JSON_COLUMNS[0]))
+
+
+def is_converted(connection):
+    """Whether all the JSON columns are already of type JSONB"""
+    types = connection.execute(
+        text('SELECT data_type FROM information_schema.columns '
+             'WHERE table_name = :table AND column_name = ANY(CAST(:columns AS text[]))'),
+        table=TABLE_NAME, columns=list(JSON_COLUMNS),
+    ).fetchall()
+    return bool(types) and all(data_type == 'jsonb' for data_type, in types)
+
+
+def _save_progress(connection, last_key, rows_done, completed):
+    connection.execute(
+        text('UPDATE online_migration_progress SET last_key = :last_key, rows_done = :rows_done, '
+             'updated = now(), completed = :completed WHERE name = :name'),
+        last_key=last_key, rows_done=rows_done, completed=completed, name=MIGRATION_NAME,
+    )
+
+
+def _estimate_row_count(engine):
+    # The planner's estimate, as counting the rows of a large table would take a while
+    with engine.connect() as connection:
+        return connection.execute(
+            text('SELECT reltuples::bigint FROM pg_class WHERE relname = :table'), table=TABLE_NAME
+        ).scalar()
+
+
+def _jsonb_column(column):
+    return '{}_jsonb'.format(column)
+
+
+def _column_exists(connection, column):
+    return connection.execute(
+        text('SELECT 1 FROM information_schema.columns WHERE table_name = :table AND column_name = :column'),
+        table=TABLE_NAME, column=column,
+    ).first() is not None
+
+
+def _table_exists(connection, table):
+    return connection.execute(
+        text('SELECT 1 FROM information_schema.tables WHERE table_name = :table'), table=table
+    ).first() is not None
+
+
+def _index_exists(connection, index_name):
+    return connection.execute(
+        text('SELECT 1 FROM pg_indexes WHERE indexname = :name'), name=index_name
+    ).first() is not None
@@ -1,17 +1,33 @@
 import logging                                                  # type: ignore
 import json                                                     # type: ignore
-from kombu import BrokerConnection, Exchange, Queue, Producer   # type: ignore
+import threading                                                # type: ignore
+import time                                                     # type: ignore
 from config import QUEUE_DICT                                   # type: ignore
 from typing import Dict                                         # type: ignore
+from service import circuit_breaker, message_codec, metrics     # type: ignore
+from service.transmission_spool import Spool, SpoolPublisher    # type: ignore
+from service.process_local import ProcessLocal                  # type: ignore
 
 logger = logging.getLogger(__name__)
 
 
 USER_SEARCH_INSERT = 2
 
+# The connection is opened (and the queue declared) once per process, rather than for every message.
+_producer = ProcessLocal(lambda: create_legacy_queue_connection())
+# A channel must not be used by two requests at once
+_publish_lock = threading.Lock()
+# With LEGACY_SPOOL_DIR set, messages are spooled and published by a background thread, on a channel of its own
+_spool = ProcessLocal(lambda directory, segment_bytes: Spool(directory, segment_bytes))
+_spool_publisher = ProcessLocal(lambda spool, batch_size: SpoolPublisher(spool, _publish_confirmed_batch, batch_size))
+_confirmed_publisher = ProcessLocal(lambda: ConfirmedPublisher(create_legacy_queue_connection()))
+
 
 # Loosely derived from kombu /examples/complete_send_manual.py
 def create_legacy_queue_connection():
+    # Only save_search_request sends messages, so kombu is imported on first use
+    from kombu import BrokerConnection, Exchange, Queue, Producer   # type: ignore
+
     logger.debug('Start create_legacy_queue_connection')
     OUTGOING_QUEUE = QUEUE_DICT['OUTGOING_QUEUE']                      # type: ignore
     OUTGOING_QUEUE_HOSTNAME = QUEUE_DICT['OUTGOING_QUEUE_HOSTNAME']    # type: ignore
@@ -39,11 +55,19 @@ def create_legacy_queue_connection():
 
 def send_legacy_transmission(user_search_result: Dict):
     logger.debug('Start send_legacy_transmission using {}'.format(user_search_result))
-    producer = create_legacy_queue_connection()
-    user_search_transmission = create_user_search_message(user_search_result)
+    user_search_transmission = build_user_search_message(user_search_result)
     if user_search_transmission:
+        if QUEUE_DICT['LEGACY_SPOOL_DIR']:
+            logger.info('Message created and spooling it')
+            # On disk once this returns; the publisher sends it when the broker can be reached
+            get_spool().append(json.dumps(user_search_transmission).encode('utf-8'))
+            start_spool_publisher()
+            logger.info('End send_legacy_transmission. Message spooled')
+            return True
         logger.info('Message created and sending to queue')
-        producer.publish(user_search_transmission, serializer="json", compression="zlib")
+        with circuit_breaker.protected(circuit_breaker.AMQP), _publish_lock:
+            # retry re-establishes the connection if the broker has dropped it since the last message
+            publish(_producer.get(), user_search_transmission, retry=True, retry_policy={'max_retries': 3})
         logger.info('End send_legacy_transmission. Message sent')
         return True
     else:
@@ -51,13 +75,110 @@ def send_legacy_transmission(user_search_result: Dict):
         return False
 
 
-def create_user_search_message(user_search_result: Dict):
-    logger.debug('Start create_user_search_message')
+def publish(producer, message: Dict, **kwargs):
+    """Publishes the message in the format set by LEGACY_MESSAGE_CODEC. Keyword arguments go to kombu's publish"""
+    encoded = message_codec.encode(message, QUEUE_DICT['LEGACY_MESSAGE_CODEC'],
+                                   QUEUE_DICT['LEGACY_MESSAGE_COMPRESS_MIN_BYTES'])
+    # With content_type given, kombu sends the body as it is rather than serialising it
+    producer.publish(encoded.body, content_type=encoded.content_type, content_encoding=encoded.content_encoding,
+                     compression=encoded.compression, headers=encoded.headers, **kwargs)
+
+
+def get_spool():
+    return _spool.get(QUEUE_DICT['LEGACY_SPOOL_DIR'], QUEUE_DICT['LEGACY_SPOOL_SEGMENT_BYTES'])
+
+
+def start_spool_publisher():
+    """Starts this process's spool publisher, if it isn't running (e.g. in a newly forked worker)"""
+    _spool_publisher.get(get_spool(), QUEUE_DICT['LEGACY_SPOOL_BATCH_SIZE']).start()
+
+
+def register_spool_gauges():
+    metrics.register_gauge('legacy_spool.depth', lambda: get_spool().get_stats()[0])
+    metrics.register_gauge('legacy_spool.oldest_age_seconds', _get_oldest_spooled_age)
+
+
+class ConfirmedPublisher:
+    """
+    Publishes batches of messages on a channel in confirm mode, waiting for the broker to confirm them all.
+
+    The batch is published without waiting for each confirm in turn, which would cost a round trip per message.
+    """
+
+    def __init__(self, producer):
+        self._producer = producer
+        channel = producer.channel
+        channel.confirm_select()
+        # The broker numbers the messages published on the channel from 1, and confirms them by number
+        self._published = 0
+        self._unconfirmed = set()
+        self._rejected = set()
+        channel.events['basic_ack'].add(self._on_ack)
+        channel.events['basic_nack'].add(self._on_nack)
+
+    def publish_batch(self, payloads, timeout_seconds):
+        """Publishes the spooled messages, raising unless the broker confirms every one within timeout_seconds"""
+        self._unconfirmed.clear()
+        self._rejected.clear()
+        for payload in payloads:
+            publish(self._producer, json.loads(payload.decode('utf-8')), retry=False)
+            self._published += 1
+            self._unconfirmed.add(self._published)
+
+        deadline = time.time() + timeout_seconds
+        while self._unconfirmed:
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                raise Exception('{} of {} messages not confirmed within {}s'.format(
+                    len(self._unconfirmed), len(payloads), timeout_seconds))
+            self._producer.connection.drain_events(timeout=remaining)
+        if self._rejected:
+            raise Exception('{} of {} messages rejected by the broker'.format(len(self._rejected), len(payloads)))
+
+    def close(self):
+        try:
+            self._producer.connection.release()
+        except Exception as e:
+            logger.warning('Failed to close the spool publisher connection: {}'.format(e))
+
+    def _on_ack(self, delivery_tag, multiple):
+        self._confirm(delivery_tag, multiple)
+
+    def _on_nack(self, delivery_tag, multiple, requeue):
+        self._rejected.update(self._confirm(delivery_tag, multiple))
+        # Handled here, so the channel doesn't raise
+        return True
+
+    def _confirm(self, delivery_tag, multiple):
+        confirmed = {tag for tag in self._unconfirmed if tag <= delivery_tag} if multiple else {delivery_tag}
+        self._unconfirmed.difference_update(confirmed)
+        return confirmed
+
+
+def _publish_confirmed_batch(payloads):
+    # Not through the AMQP circuit breaker: the spool publisher has a backoff of its own, outside any request
+    publisher = _confirmed_publisher.get()
+    try:
+        publisher.publish_batch(payloads, QUEUE_DICT['LEGACY_SPOOL_CONFIRM_TIMEOUT'])
+    except Exception:
+        # The whole batch is published again on a new connection, so some messages may be sent twice
+        _confirmed_publisher.reset()
+        publisher.close()
+        raise
+
+
+def _get_oldest_spooled_age():
+    oldest = get_spool().get_stats()[1]
+    return time.time() - oldest if oldest is not None else 0
+
+
+def build_user_search_message(user_search_result: Dict):
+    logger.debug('Start build_user_search_message')
     # Prepare for serialisation: values must be sent as strings.
     user_search_transmission = {k: str(v) for k, v in user_search_result.items()}
 
     # Add the relevant event id.
     if user_search_transmission:
         user_search_transmission['EVENT_ID'] = USER_SEARCH_INSERT        # type: ignore
-    logger.debug('End create_user_search_message. Returning: {}'.format(user_search_transmission))
-    return json.dumps(user_search_transmission)
+    logger.debug('End build_user_search_message. Returning: {}'.format(user_search_transmission))
+    return user_search_transmission
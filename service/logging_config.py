@@ -23,6 +23,9 @@ def setup_logging():
                 service_logger.setLevel(logging.WARN)
             else:
                 service_logger.setLevel(logging.INFO)
+            if CONFIG_DICT['LOG_REQUESTS']:
+                # Logged whatever the level of the rest of the service
+                logging.getLogger('service.requests').setLevel(logging.INFO)
             done_setup = True
         except IOError as e:
             raise(Exception('Failed to load logging configuration', e))
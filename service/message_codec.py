@@ -0,0 +1,77 @@
+"""
+Encodes the legacy transmission messages published to RabbitMQ (see LEGACY_MESSAGE_CODEC in config.py).
+
+Each message carries the version of its format in the 'message_format' header, so the legacy consumer can
+tell how to decode it:
+
+- 1, 'legacy': the message JSON-encoded twice (a JSON string holding its JSON), as it has always been sent
+- 2, 'json': the message JSON-encoded once
+- 3, 'msgpack': MessagePack, smaller and quicker to encode (needs msgpack to be installed)
+
+'legacy' messages are sent exactly as they were before the other formats existed, which the legacy consumer
+depends on: always zlib-compressed, with a content encoding of utf-8 and no 'message_format' header (a message
+without one is taken to be in the legacy format). Bodies of the other formats are zlib-compressed when they're
+at least LEGACY_MESSAGE_COMPRESS_MIN_BYTES. kombu adds the 'compression' header the consumer decompresses by.
+"""
+import json
+from collections import namedtuple
+
+try:
+    import msgpack  # type: ignore
+except ImportError:
+    msgpack = None
+
+FORMAT_HEADER = 'message_format'
+
+Codec = namedtuple('Codec', ['version', 'content_type', 'content_encoding', 'encode', 'decode'])
+EncodedMessage = namedtuple('EncodedMessage', ['body', 'content_type', 'content_encoding', 'compression', 'headers'])
+
+
+def _encode_json(message):
+    return json.dumps(message, separators=(',', ':')).encode('utf-8')
+
+
+def _decode_json(body):
+    return json.loads(body.decode('utf-8'))
+
+
+def _encode_legacy(message):
+    # The JSON of the message as serialised by kombu's json serializer, which is how it was always published
+    from kombu.serialization import dumps  # type: ignore
+    return dumps(json.dumps(message), serializer='json')[2].encode('utf-8')
+
+
+CODECS = {
+    'legacy': Codec(1, 'application/json', 'utf-8', _encode_legacy, lambda body: json.loads(_decode_json(body))),
+    'json': Codec(2, 'application/json', 'binary', _encode_json, _decode_json),
+    'msgpack': Codec(3, 'application/x-msgpack', 'binary', lambda message: msgpack.packb(message, use_bin_type=True),
+                     lambda body: msgpack.unpackb(body, raw=False)),
+}
+
+
+def get_codec(name):
+    if name not in CODECS:
+        raise ValueError('Unknown message codec {}, expected one of {}'.format(name, ', '.join(sorted(CODECS))))
+    if name == 'msgpack' and msgpack is None:
+        raise ValueError('The msgpack message codec needs msgpack to be installed')
+    return CODECS[name]
+
+
+def encode(message, codec_name, compress_min_bytes):
+    """Encodes the message (a dict) for publishing with the named codec"""
+    codec = get_codec(codec_name)
+    body = codec.encode(message)
+    if codec_name == 'legacy':
+        return EncodedMessage(body, codec.content_type, codec.content_encoding, 'zlib', {})
+    compression = 'zlib' if len(body) >= compress_min_bytes else None
+    return EncodedMessage(body, codec.content_type, codec.content_encoding, compression,
+                          {FORMAT_HEADER: codec.version})
+
+
+def decode(body, headers):
+    """Decodes a (decompressed) message body, by the format in its headers. Without one, it's the legacy format"""
+    version = (headers or {}).get(FORMAT_HEADER, CODECS['legacy'].version)
+    for codec_name, codec in CODECS.items():
+        if codec.version == version:
+            return get_codec(codec_name).decode(body)
+    raise ValueError('Unknown message format {}'.format(version))
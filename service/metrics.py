@@ -0,0 +1,58 @@
+import threading
+from typing import Callable, Dict  # type: ignore
+
+# In-process metrics, served by the /metrics endpoint. Each gunicorn worker keeps its own.
+_lock = threading.Lock()
+_counters = {}      # type: Dict[str, int]
+_timings = {}       # type: Dict[str, Dict[str, float]]
+_gauges = {}        # type: Dict[str, Callable[[], float]]
+
+
+def increment(name, amount=1):
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + amount
+
+
+def observe(name, value):
+    """Records one observation (e.g. a duration in ms) for the named summary"""
+    with _lock:
+        summary = _timings.setdefault(name, {'count': 0, 'total': 0.0, 'max': 0.0})
+        summary['count'] += 1
+        summary['total'] += value
+        summary['max'] = max(summary['max'], value)
+
+
+def register_gauge(name, get_value):
+    """Registers a function returning the current value of the named gauge when metrics are read"""
+    with _lock:
+        _gauges[name] = get_value
+
+
+def snapshot():
+    with _lock:
+        counters = dict(_counters)
+        timings = {name: dict(summary) for name, summary in _timings.items()}
+        gauges = dict(_gauges)
+
+    for summary in timings.values():
+        summary['mean'] = summary['total'] / summary['count']
+
+    return {
+        'counters': counters,
+        'timings': timings,
+        'gauges': {name: _read_gauge(get_value) for name, get_value in gauges.items()},
+    }
+
+
+def reset():
+    """Clears counters and timings, e.g. in a newly forked worker"""
+    with _lock:
+        _counters.clear()
+        _timings.clear()
+
+
+def _read_gauge(get_value):
+    try:
+        return get_value()
+    except Exception:
+        return None
@@ -1,4 +1,4 @@
-from sqlalchemy.dialects.postgresql import JSON, ARRAY  # type: ignore
+from sqlalchemy.dialects.postgresql import JSONB, ARRAY  # type: ignore
 from sqlalchemy import Index                     # type: ignore
 from service import db
 
@@ -8,12 +8,14 @@ from service import db
 
 class TitleRegisterData(db.Model):  # type: ignore
     title_number = db.Column(db.String(10), primary_key=True)
-    register_data = db.Column(JSON)
-    geometry_data = db.Column(JSON)
-    official_copy_data = db.Column(JSON)
+    register_data = db.Column(JSONB)
+    geometry_data = db.Column(JSONB)
+    official_copy_data = db.Column(JSONB)
     is_deleted = db.Column(db.Boolean, default=False, nullable=False)
     last_modified = db.Column(db.DateTime, default=db.func.now(), onupdate=db.func.now(), nullable=False)
     lr_uprns = db.Column(ARRAY(db.String), default=[], nullable=True)
+    # The register_data fields search results show, set by a trigger whenever a title is written
+    title_summary = db.Column(JSONB, nullable=True)
 
 
 Index('idx_last_modified_and_title_number', TitleRegisterData.last_modified,
@@ -21,6 +23,20 @@ Index('idx_last_modified_and_title_number', TitleRegisterData.last_modified,
 
 Index('idx_title_uprns', TitleRegisterData.lr_uprns, postgresql_using='gin')
 
+# Expression indexes on JSONB keys (e.g. tenure) are created by the migrations, see service/jsonb_migration.py.
+
+
+class TitleLrUprn(db.Model):  # type: ignore
+    """One row per lr_uprn of each title, kept in sync with TitleRegisterData.lr_uprns by a trigger"""
+
+    __tablename__ = 'title_lr_uprn'
+    lr_uprn = db.Column(db.String(20), primary_key=True)
+    title_number = db.Column(db.String(10), db.ForeignKey('title_register_data.title_number', onupdate='CASCADE',
+                                                          ondelete='CASCADE'), primary_key=True)
+
+
+Index('idx_title_lr_uprn_title_number', TitleLrUprn.title_number)
+
 
 class UprnMapping(db.Model):  # type: ignore
     uprn = db.Column(db.String(20), primary_key=True)
@@ -30,6 +46,8 @@ class UprnMapping(db.Model):  # type: ignore
 class UserSearchAndResults(db.Model):  # type: ignore
     """
     Store details of user view (for audit purposes) and update after payment (for reconciliation).
+
+    The table is partitioned by month of search_datetime (see service/audit_partitions.py).
     """
 
     # As several users may be searching at the same time, we need a compound primary key.
@@ -83,6 +101,7 @@ class UserSearchAndResults(db.Model):  # type: ignore
 
 
 Index('idx_title_number', UserSearchAndResults.title_number)
+Index('idx_user_search_and_results_user_title', UserSearchAndResults.user_id, UserSearchAndResults.title_number)
 
 
 class Validation(db.Model):  # type: ignore
@@ -0,0 +1,33 @@
+import os
+import threading
+
+
+class ProcessLocal:
+    """
+    Lazily creates a value (a client, a connection) and keeps it for the current process.
+
+    The value is created again when it is accessed from another process, e.g. a gunicorn worker
+    forked from a master that created it, or when called with different arguments (e.g. an
+    endpoint URL that has changed in the config).
+    """
+
+    def __init__(self, factory):
+        self._factory = factory
+        self._lock = threading.Lock()
+        self._pid = None
+        self._args = None
+        self._value = None
+
+    def get(self, *args):
+        with self._lock:
+            if self._pid != os.getpid() or self._args != args:
+                self._value = self._factory(*args)
+                self._pid = os.getpid()
+                self._args = args
+            return self._value
+
+    def reset(self):
+        """Discards the value, so the next get() creates a new one"""
+        with self._lock:
+            self._pid = None
+            self._value = None
@@ -0,0 +1,183 @@
+import functools
+import itertools
+import logging
+import threading
+import time
+from flask import current_app                                 # type: ignore
+from flask_sqlalchemy import SignallingSession               # type: ignore
+from sqlalchemy import event, exc, text                      # type: ignore
+
+from service import metrics
+from service.process_local import ProcessLocal
+
+logger = logging.getLogger(__name__)
+
+# A replica that has replayed everything it has received is as up to date as it can be, however long ago its
+# last transaction was. A database that isn't a replica (e.g. a local stand-in) is never behind.
+# Postgres 10 renamed the xlog functions to wal.
+LAG_QUERY_FORMAT = (
+    'SELECT CASE WHEN NOT pg_is_in_recovery() OR pg_last_{0}_receive_{1}() = pg_last_{0}_replay_{1}() THEN 0 '
+    'ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()) END'
+)
+LAG_QUERY = text(LAG_QUERY_FORMAT.format('wal', 'lsn'))
+LAG_QUERY_BEFORE_POSTGRES_10 = text(LAG_QUERY_FORMAT.format('xlog', 'location'))
+
+# Errors that mean the replica couldn't be reached (or went away), rather than anything wrong with the query
+UNAVAILABLE_ERRORS = (exc.OperationalError, exc.InterfaceError)
+
+# Keys of Session.info
+_REPLICA_ENGINE = 'replica_engine'
+_HAS_WRITTEN = 'has_written'
+
+
+class RoutingSession(SignallingSession):
+    """A session whose queries go to the replica given by read_from_replica, if any"""
+
+    def get_bind(self, mapper=None, clause=None):
+        replica_engine = self.info.get(_REPLICA_ENGINE)
+        # Writes, and any reads after them, go to the primary, which is the only one to have them
+        if replica_engine is not None and not self._flushing and not self.info.get(_HAS_WRITTEN):
+            return replica_engine
+        return super(RoutingSession, self).get_bind(mapper, clause)
+
+
+@event.listens_for(RoutingSession, 'after_flush')
+def _record_write(session, flush_context):
+    session.info[_HAS_WRITTEN] = True
+
+
+class Replica:
+
+    def __init__(self, name, engine):
+        self.name = name
+        self.engine = engine
+        # Not used until the first check has found it healthy
+        self.usable = False
+        self.lag_seconds = None
+
+
+class ReplicaSet:
+    """
+    The replicas of the database, checked every check_seconds once started. A replica is used while it
+    answers and is at most max_lag_seconds behind the primary.
+    """
+
+    def __init__(self, engines, max_lag_seconds, check_seconds):
+        self.replicas = [Replica(name, engine) for name, engine in sorted(engines.items())]
+        self.max_lag_seconds = max_lag_seconds
+        self.check_seconds = check_seconds
+        self._turns = itertools.count()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='replica-health-check')
+            self._thread.daemon = True
+            self._thread.start()
+
+    def choose(self):
+        """Returns the usable replica with the fewest connections in use, or None if there's none"""
+        usable = [replica for replica in self.replicas if replica.usable]
+        if not usable:
+            return None
+        # Rotated, so that equally busy replicas take turns
+        turn = next(self._turns) % len(usable)
+        usable = usable[turn:] + usable[:turn]
+        return min(usable, key=lambda replica: replica.engine.pool.checkedout())
+
+    def check(self):
+        for replica in self.replicas:
+            try:
+                lag_seconds = self._get_lag_seconds(replica.engine)
+            except Exception as e:
+                self.mark_unavailable(replica, e)
+                continue
+            replica.lag_seconds = lag_seconds
+            usable = lag_seconds is not None and lag_seconds <= self.max_lag_seconds
+            if usable != replica.usable:
+                logger.warning('Replica {} is {} (lag: {}s)'.format(
+                    replica.name, 'in use' if usable else 'too far behind', lag_seconds))
+            replica.usable = usable
+
+    def mark_unavailable(self, replica, error):
+        if replica.usable:
+            logger.warning('Replica {} is unavailable: {}'.format(replica.name, error))
+        metrics.increment('db_replicas.failures')
+        replica.usable = False
+        replica.lag_seconds = None
+
+    def _get_lag_seconds(self, engine):
+        with engine.connect() as connection:
+            query = LAG_QUERY if connection.dialect.server_version_info >= (10,) else LAG_QUERY_BEFORE_POSTGRES_10
+            lag_seconds = connection.execute(query).scalar()
+        # None if it has yet to replay anything, in which case it can't be trusted
+        return float(lag_seconds) if lag_seconds is not None else None
+
+    def _run(self):
+        while True:
+            self.check()
+            time.sleep(self.check_seconds)
+
+
+_replica_set = ProcessLocal(lambda app: _create_replica_set(app))
+
+
+def get_replica_set(app):
+    """Returns this process's ReplicaSet, checked in the background, or None if there are no replicas"""
+    if not app.config['SQLALCHEMY_BINDS']:
+        return None
+    return _replica_set.get(app)
+
+
+def get_replica_engines(app):
+    db = app.extensions['sqlalchemy'].db
+    return {name: db.get_engine(app, bind=name) for name in app.config['SQLALCHEMY_BINDS'] or ()}
+
+
+def register_gauges(app):
+    for name in app.config['SQLALCHEMY_BINDS'] or ():
+        metrics.register_gauge('db_replicas.{}.lag_seconds'.format(name), functools.partial(_get_lag, app, name))
+    metrics.register_gauge('db_replicas.usable', lambda: sum(
+        1 for replica in get_replica_set(app).replicas if replica.usable))
+
+
+def read_from_replica(func):
+    """
+    Runs func's queries on a replica when there's a usable one, unless the session has written something
+    (which only the primary is sure to have). If the replica turns out to be unavailable, func is run again
+    on the primary.
+    """
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        app = current_app._get_current_object()
+        session = app.extensions['sqlalchemy'].db.session()
+        replica_set = get_replica_set(app)
+        replica = replica_set.choose() if replica_set and not session.info.get(_HAS_WRITTEN) else None
+        if replica is None:
+            return func(*args, **kwargs)
+
+        previous_engine = session.info.get(_REPLICA_ENGINE)
+        session.info[_REPLICA_ENGINE] = replica.engine
+        try:
+            result = func(*args, **kwargs)
+            metrics.increment('db_replicas.reads')
+            return result
+        except UNAVAILABLE_ERRORS as e:
+            replica_set.mark_unavailable(replica, e)
+            # Nothing was written, so only the failed replica's transaction is lost
+            session.rollback()
+        finally:
+            session.info[_REPLICA_ENGINE] = previous_engine
+        return func(*args, **kwargs)
+    return wrapper
+
+
+def _create_replica_set(app):
+    replica_set = ReplicaSet(get_replica_engines(app), app.config['DB_REPLICA_MAX_LAG_SECONDS'],
+                             app.config['DB_REPLICA_CHECK_SECONDS'])
+    replica_set.start()
+    return replica_set
+
+
+def _get_lag(app, name):
+    return next(replica.lag_seconds for replica in get_replica_set(app).replicas if replica.name == name)
@@ -1,24 +1,74 @@
-from flask import jsonify, Response, request, make_response  # type: ignore
+from flask import Blueprint, current_app, g, Response, request, make_response  # type: ignore
 import json
 import logging
 import math
+import time
+from functools import partial
 
-from service import app, db_access, es_access, api_client
+from service import admission, circuit_breaker, compression, concurrency, db_access, es_access, api_client, metrics
+from service import json_encoding
+from service.json_encoding import json_response
 
 INTERNAL_SERVER_ERROR_RESPONSE_BODY = json.dumps(
     {'error': 'Internal server error'}
 )
 JSON_CONTENT_TYPE = 'application/json'
 logger = logging.getLogger(__name__)
+request_logger = logging.getLogger('service.requests')
 
-TITLE_NOT_FOUND_RESPONSE = Response(
-    json.dumps({'error': 'Title not found'}),
-    status=404,
-    mimetype=JSON_CONTENT_TYPE
-)
+TITLE_NOT_FOUND_RESPONSE_BODY = json.dumps({'error': 'Title not found'})
+SERVICE_UNAVAILABLE_RESPONSE_BODY = json.dumps({'error': 'Service temporarily unavailable'})
+
+# Titles are compressed once and then served from the cache of compressed bodies, so they can afford
+# higher levels than search pages, which are compressed for every request.
+TITLE_COMPRESSION = compression.CompressionSettings(min_size=1024, gzip_level=9, brotli_quality=9)
+SEARCH_COMPRESSION = compression.CompressionSettings(min_size=1024, gzip_level=5, brotli_quality=4)
+
+# Fewer characters than this match too many addresses to be worth suggesting
+MIN_ADDRESS_SUGGESTION_LENGTH = 2
+
+# Batch postcode searches are streamed as one JSON document per line, a postcode's result at a time
+BATCH_CONTENT_TYPE = 'application/x-ndjson'
+
+api = Blueprint('api', __name__)
+
+
+@api.before_request
+def start_request():
+    g.request_started = time.time()
+
+
+@api.before_request
+def admit_request():
+    retry_after = admission.admit()
+    if retry_after is not None:
+        return _service_unavailable_response(retry_after)
+
+
+@api.after_request
+def log_request(response):
+    if current_app.config['LOG_REQUESTS']:
+        # Read by scripts/replay_traffic.py, so the format must be kept in step with it
+        query_string = request.query_string.decode('utf-8', 'replace')
+        request_logger.info('Served method=[{}] path=[{}] status=[{}] duration_ms=[{:.1f}]'.format(
+            request.method, request.path + ('?' + query_string if query_string else ''), response.status_code,
+            (time.time() - g.request_started) * 1000))
+    return response
+
+
+@api.teardown_request
+def release_request(exception):
+    admission.release()
 
 
-@app.errorhandler(Exception)
+# Registered before the handler for all exceptions, as Flask tries handlers in the order they were registered
+@api.app_errorhandler(circuit_breaker.CircuitOpenError)
+def handleCircuitOpenError(error):
+    logger.warning('Failing fast: {}'.format(error))
+    return _service_unavailable_response(error.retry_after)
+
+
+@api.app_errorhandler(Exception)
 def handleServerError(error):
     logger.error(
         'An error occurred when processing a request',
@@ -32,103 +82,131 @@ def handleServerError(error):
 
 
 # TODO: remove the root route when the monitoring tools can work without it
-@app.route('/', methods=['GET'])
-@app.route('/health', methods=['GET'])
+@api.route('/', methods=['GET'])
+@api.route('/health', methods=['GET'])
 def health_check():
     errors = _check_elasticsearch_connection() + _check_postgresql_connection()
     status = 'error' if errors else 'ok'
     http_status = 500 if errors else 200
 
-    response_body = {'status': status}
+    response_body = {'status': status, 'circuit_breakers': circuit_breaker.get_statuses()}
     if errors:
         response_body['errors'] = errors
 
-    return Response(
-        json.dumps(response_body),
-        status=http_status,
-        mimetype=JSON_CONTENT_TYPE,
-    )
+    return json_response(response_body, status=http_status)
+
+
+@api.route('/metrics', methods=['GET'])
+def get_metrics():
+    # Metrics are kept per process, so these only describe the worker that serves the request
+    return json_response(metrics.snapshot())
 
 
-@app.route('/titles/<title_ref>', methods=['GET'])
+@api.route('/titles/<title_ref>', methods=['GET'])
 def get_title(title_ref):
     logger.debug('Start GET titles: {}'.format(title_ref))
+    cached = _cached_title_response('titles', title_ref)
+    if cached:
+        logger.debug('End GET titles. Served from the cache.')
+        return cached
     data = db_access.get_title_register(title_ref)
     if data:
-        result = {
-            'data': data.register_data,
-            'title_number': data.title_number,
-            'geometry_data': data.geometry_data,
-        }
         logger.debug('End GET titles')
-        return jsonify(result)
+        return compression.compressed(lambda: json_response(title_result(data)), TITLE_COMPRESSION,
+                                      title_cache_key('titles', data))
     else:
         logger.debug('End GET titles. Title not found.')
-        return TITLE_NOT_FOUND_RESPONSE
+        return _title_not_found_response()
 
 
-@app.route('/titles/<title_ref>/official-copy', methods=['GET'])
+@api.route('/titles/<title_ref>/official-copy', methods=['GET'])
 def get_official_copy(title_ref):
     logger.debug('Start GET titles official copy')
-    data = db_access.get_official_copy_data(title_ref)
+    sub_register_names = _get_sub_register_names()
+    # An empty list asks for none of the sub-registers, which is a variant of its own
+    variant = tuple(sub_register_names) if sub_register_names is not None else None
+    cached = _cached_title_response('official-copy', title_ref, variant)
+    if cached:
+        logger.debug('End GET titles official copy. Served from the cache.')
+        return cached
+    data = db_access.get_official_copy_data(title_ref, sub_register_names)
     if data:
-        result = {
-            'official_copy_data': {
-                'sub_registers': data.official_copy_data['sub_registers'],
-                'title_number': data.title_number,
-            }
-        }
         logger.debug('End GET titles official copy')
-        return jsonify(result)
+        return compression.compressed(lambda: json_response(official_copy_result(data)), TITLE_COMPRESSION,
+                                      title_cache_key('official-copy', data, variant))
     else:
         logger.debug('End GET titles official copy.Title not found')
-        return TITLE_NOT_FOUND_RESPONSE
+        return _title_not_found_response()
 
 
-@app.route('/title_search_postcode/<postcode>', methods=['GET'])
+@api.route('/title_search_postcode/<postcode>', methods=['GET'])
 def get_properties_for_postcode(postcode):
     logger.debug('Start get properties for postcode using {}'.format(postcode))
     page_number = int(request.args.get('page', 0))
-    normalised_postcode = postcode.replace('_', '').strip().upper()
+    normalised_postcode = _normalise_postcode(postcode)
     # call Address_search_api to obtain list of AddressBase addresses
     address_records = api_client.get_titles_by_postcode(normalised_postcode, page_number, _get_page_size())
     # Iterate over dict collecting the AddressBase uprns to obtain the mapped LR_Uprns from PG
+    summary = _is_summary_view()
     if address_records:
-        for address in address_records.get('data').get('addresses'):
-            address['title_number'] = 'not found'
-            address['tenure'] = ''
-            address_base_uprn = address.get('uprn')
-            if address_base_uprn:
-                # using AB uprn get Land Registry's version
-                logger.info('Searching for lruprn using adressbase uprn {}'.format(address_base_uprn))
-                lr_uprn_mapping = db_access.get_mapped_lruprn(address_base_uprn)
-                # Now using LR_uprn obtain some title details (currently title details and tenure)
-                if lr_uprn_mapping:
-                    logger.info('Using {} to look up title number and register data'.format(lr_uprn_mapping.lr_uprn))
-                    title_details = db_access.get_title_number_and_register_data(lr_uprn_mapping.lr_uprn)
-                    if title_details:
-                        logger.info('Title details found: {}, {}'.format(title_details.title_number, title_details.register_data.get('tenure')))
-                        address['title_number'] = title_details.title_number
-                        address['tenure'] = title_details.register_data.get('tenure')
-                        logger.debug('Register_data found: {}'.format(title_details.register_data))
-                        address['register_data'] = title_details.register_data
-
-    result = _paginated_address_records_v2(address_records, page_number)
-    return jsonify(result)
-
-
-@app.route('/title_search_address/<address>', methods=['GET'])
+        # Lookups for different addresses are independent, so they can overlap under a cooperative worker
+        concurrency.map_concurrently(partial(_add_title_details, summary=summary), address_records.get('data').get('addresses'))
+
+    result = _paginated_address_records_v2(address_records, page_number, summary)
+    return compression.compressed(lambda: json_response(result), SEARCH_COMPRESSION)
+
+
+@api.route('/title_search_postcode/batch', methods=['POST'])
+def get_properties_for_postcodes():
+    """
+    Searches each postcode of the JSON body's 'postcodes' as GET /title_search_postcode/<postcode> would, and
+    streams back a line of JSON per postcode: its page of results, with its 'postcode'.
+    """
+    postcodes = _get_batch_postcodes()
+    if postcodes is None:
+        return json_response({'error': 'Expected a JSON object with a list of at most {} postcodes'.format(
+            current_app.config['MAX_BATCH_POSTCODES'])}, status=400)
+    logger.debug('Start batch title_search_postcode using {}'.format(postcodes))
+    page_number = int(request.args.get('page', 0))
+    summary = _is_summary_view()
+    # The address-search-api calls overlap, at most LOOKUP_POOL_SIZE at a time (in threads under a sync worker)
+    search = partial(api_client.get_titles_by_postcode, page_number=page_number, page_size=_get_page_size())
+    postcode_records = concurrency.map_concurrently(search, postcodes, threads=True)
+
+    # The titles of all the postcodes' addresses are found at once
+    addresses = [address for address_records in postcode_records if address_records
+                 for address in address_records['data']['addresses']]
+    _add_titles_details(addresses, summary)
+
+    results = [dict(_paginated_address_records_v2(address_records, page_number, summary), postcode=postcode)
+               for postcode, address_records in zip(postcodes, postcode_records)]
+    logger.debug('End batch title_search_postcode')
+    encode = json_encoding.get_encoder(current_app.config['JSON_ENCODER'])
+    return Response((encode(result) + b'\n' for result in results), mimetype=BATCH_CONTENT_TYPE)
+
+
+@api.route('/title_search_address/<address>', methods=['GET'])
 def get_titles_for_address(address):
     logger.debug('Start title_search_address using {}'.format(address))
     page_number = int(request.args.get('page', 0))
 
     address_records = es_access.get_properties_for_address(address, _get_page_size(), page_number)
-    result = _paginated_address_records(address_records, page_number)
+    result = _paginated_address_records(address_records, page_number, _is_summary_view())
     logger.debug('End title_search_address - paginated address: {}'.format(result))
-    return jsonify(result)
+    return compression.compressed(lambda: json_response(result), SEARCH_COMPRESSION)
+
+
+@api.route('/address_suggestions', methods=['GET'])
+def get_address_suggestions():
+    text = request.args.get('q', '').strip()
+    if len(text) < MIN_ADDRESS_SUGGESTION_LENGTH:
+        return json_response({'suggestions': []})
+
+    suggestions = es_access.get_address_suggestions(text, current_app.config['MAX_ADDRESS_SUGGESTIONS'])
+    return json_response({'suggestions': suggestions})
 
 
-@app.route('/save_search_request', methods=['POST'])
+@api.route('/save_search_request', methods=['POST'])
 def save_search_request():
     logger.debug('Start save_search_request')
     # N.B.: "request.form" is a 'multidict', so need to flatten it first; assume single value per key.
@@ -139,7 +217,7 @@ def save_search_request():
     return cart_id, 200
 
 
-@app.route('/user_can_view/<username>/<title_number>', methods=['GET'])
+@api.route('/user_can_view/<username>/<title_number>', methods=['GET'])
 def user_can_view(username, title_number):
     logger.debug('Start user_can_view using {} and {}'.format(username, title_number))
     result = str(db_access.user_can_view(username, title_number))
@@ -147,20 +225,144 @@ def user_can_view(username, title_number):
     return make_response(result, 200) if result == 'True' else make_response(result, 403)
 
 
-@app.route('/get_price/<product>', methods=['GET'])
+@api.route('/get_price/<product>', methods=['GET'])
 def get_price(product):
     logger.debug('Start get_price for product: {}'.format(product))
     price = db_access.get_price(product)
+    if price is None:
+        logger.debug('End get_price for product. Product not found.')
+        return json_response({'error': 'Product not found'}, status=404)
     logger.debug('End get_price for product. Price : {}'.format(price))
     return str(price), 200
 
 
+def _add_title_details(address, summary=False):
+    title_details = None
+    address_base_uprn = address.get('uprn')
+    if address_base_uprn:
+        # using AB uprn get Land Registry's version
+        logger.info('Searching for lruprn using adressbase uprn {}'.format(address_base_uprn))
+        lr_uprn_mapping = db_access.get_mapped_lruprn(address_base_uprn)
+        # Now using LR_uprn obtain some title details (currently title details and tenure)
+        if lr_uprn_mapping:
+            logger.info('Using {} to look up title number and register data'.format(lr_uprn_mapping.lr_uprn))
+            if summary:
+                title_details = db_access.get_title_number_and_summary(lr_uprn_mapping.lr_uprn)
+            else:
+                title_details = db_access.get_title_number_and_register_data(lr_uprn_mapping.lr_uprn)
+    _set_title_details(address, title_details, summary)
+
+
+def _add_titles_details(addresses, summary=False):
+    """Adds the title details of all the addresses, as _add_title_details does, with a single query"""
+    address_base_uprns = [address['uprn'] for address in addresses if address.get('uprn')]
+    if summary:
+        titles = db_access.get_titles_and_summaries_by_uprn(address_base_uprns)
+    else:
+        titles = db_access.get_titles_and_register_data_by_uprn(address_base_uprns)
+    for address in addresses:
+        _set_title_details(address, titles.get(address.get('uprn')), summary)
+
+
+def _set_title_details(address, title_details, summary):
+    address['title_number'] = 'not found'
+    address['tenure'] = ''
+    if title_details:
+        data = title_details.title_summary if summary else title_details.register_data
+        logger.info('Title details found: {}, {}'.format(title_details.title_number, data.get('tenure')))
+        address['title_number'] = title_details.title_number
+        address['tenure'] = data.get('tenure')
+        logger.debug('Register_data found: {}'.format(data))
+        address['title_summary' if summary else 'register_data'] = data
+
+
+def _service_unavailable_response(retry_after):
+    response = Response(SERVICE_UNAVAILABLE_RESPONSE_BODY, status=503, mimetype=JSON_CONTENT_TYPE)
+    response.headers['Retry-After'] = str(retry_after)
+    return response
+
+
+def title_result(title):
+    """The body of GET /titles/<title_ref>"""
+    return {
+        'data': title.register_data,
+        'title_number': title.title_number,
+        'geometry_data': title.geometry_data,
+    }
+
+
+def official_copy_result(title):
+    """The body of GET /titles/<title_ref>/official-copy"""
+    return {
+        'official_copy_data': {
+            'sub_registers': title.official_copy_data['sub_registers'],
+            'title_number': title.title_number,
+        }
+    }
+
+
+def title_cache_key(route, title, *variant):
+    """The key of a title route's compressed body (see service/compression.py)"""
+    # A title's last_modified changes whenever its data does, so stale bodies are never served
+    return (route, title.title_number, title.last_modified) + variant if title.last_modified else None
+
+
+def _cached_title_response(route, title_ref, *variant):
+    """
+    The title route's cached compressed body, found by reading only the title's last_modified, or None if it
+    isn't cached. A miss is cached by compression.compressed under the key of the title that is then read, so
+    a body is only ever cached under the version it was made from.
+    """
+    encoding = compression.choose_encoding()
+    if not encoding:
+        return None
+    version = db_access.get_title_version(title_ref)
+    return version and compression.cached_response(title_cache_key(route, version, *variant), encoding)
+
+
+def _normalise_postcode(postcode):
+    return postcode.replace('_', '').strip().upper()
+
+
+def _get_batch_postcodes():
+    """The distinct normalised postcodes of a batch search, in the order given, or None if the body is invalid"""
+    body = request.get_json(force=True, silent=True)
+    postcodes = body.get('postcodes') if isinstance(body, dict) else None
+    if not isinstance(postcodes, list) or not all(isinstance(postcode, str) for postcode in postcodes):
+        return None
+    normalised_postcodes = []
+    for postcode in map(_normalise_postcode, postcodes):
+        if postcode and postcode not in normalised_postcodes:
+            normalised_postcodes.append(postcode)
+    if len(normalised_postcodes) > current_app.config['MAX_BATCH_POSTCODES']:
+        return None
+    return normalised_postcodes
+
+
+def _is_summary_view():
+    # '?view=summary' returns each title's summary (see TitleRegisterData.title_summary) instead of its register
+    return request.args.get('view') == 'summary'
+
+
+def _get_sub_register_names():
+    # e.g. '?sub_registers=A,C'. None means all of them.
+    sub_registers = request.args.get('sub_registers')
+    if sub_registers is None:
+        return None
+    return [name.strip() for name in sub_registers.split(',') if name.strip()]
+
+
+def _title_not_found_response():
+    # A new response each time - response objects are mutable and must not be shared between concurrent requests
+    return Response(TITLE_NOT_FOUND_RESPONSE_BODY, status=404, mimetype=JSON_CONTENT_TYPE)
+
+
 def _hit_postgresql_with_sample_query():
     # Hitting PostgreSQL database to see if it responds properly
     db_access.get_title_register('non-existing-title')
 
 
-def _paginated_address_records(address_records, page_number):
+def _paginated_address_records(address_records, page_number, summary=False):
     # NOTE: our code uses the number of records reported by elasticsearch.
     # Records that have been deleted are not included in the search results list.
     nof_results = min(address_records.total, _get_max_number_search_results())
@@ -168,9 +370,15 @@ def _paginated_address_records(address_records, page_number):
 
     if address_records:
         title_numbers = [rec.title_number for rec in address_records]
-        titles = db_access.get_title_registers(title_numbers)
+        if summary:
+            titles = db_access.get_title_summaries(title_numbers)
+        else:
+            titles = db_access.get_title_registers(title_numbers)
         ordered = sorted(titles, key=lambda t: title_numbers.index(t.title_number))
-        title_dicts = [{'title_number': t.title_number, 'data': t.register_data} for t in ordered]
+        if summary:
+            title_dicts = [{'title_number': t.title_number, 'summary': t.title_summary} for t in ordered]
+        else:
+            title_dicts = [{'title_number': t.title_number, 'data': t.register_data} for t in ordered]
     else:
         title_dicts = []
 
@@ -178,14 +386,17 @@ def _paginated_address_records(address_records, page_number):
             'number_results': nof_results}
 
 
-def _paginated_address_records_v2(address_records, page_number):
+def _paginated_address_records_v2(address_records, page_number, summary=False):
     # NOTE: our code uses the number of records reported by elasticsearch.
     # Records that have been deleted are not included in the search results list.
     nof_results = min(address_records['data'].get('total'), _get_max_number_search_results())
     nof_pages = math.ceil(nof_results / _get_page_size())  # 0 if no results
     logger.info('Number of results: {}, Number of pages: {}'.format(nof_results, nof_pages))
     if address_records:
-        title_dicts = [{'title_number': address.get('title_number'), 'data': address.get('register_data'), 'address': address.get('joined_fields')} for address in address_records['data']['addresses']]
+        if summary:
+            title_dicts = [{'title_number': address.get('title_number'), 'summary': address.get('title_summary'), 'address': address.get('joined_fields')} for address in address_records['data']['addresses']]
+        else:
+            title_dicts = [{'title_number': address.get('title_number'), 'data': address.get('register_data'), 'address': address.get('joined_fields')} for address in address_records['data']['addresses']]
         logger.debug('list of paginated results {}'.format(title_dicts))
     else:
         logger.info('No records found')
@@ -225,8 +436,8 @@ def _check_elasticsearch_connection():
 
 
 def _get_page_size():
-    return app.config['SEARCH_RESULTS_PER_PAGE']
+    return current_app.config['SEARCH_RESULTS_PER_PAGE']
 
 
 def _get_max_number_search_results():
-    return app.config['MAX_NUMBER_SEARCH_RESULTS']
+    return current_app.config['MAX_NUMBER_SEARCH_RESULTS']
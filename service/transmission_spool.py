@@ -0,0 +1,311 @@
+"""
+An append-only spool on local disk for the legacy transmission messages (see LEGACY_SPOOL_DIR in config.py).
+
+Requests append their message to the spool, which is flushed to disk before they return, and a background
+publisher sends what's in the spool to RabbitMQ in batches, moving its saved position on only once the broker
+has confirmed a batch. Messages therefore survive a broker outage (they're sent when it comes back) and a
+crash of the process (the publisher carries on from its saved position).
+
+The spool is a directory of numbered segment files, shared by all the workers on the host:
+
+- records are appended under an flock on 'append.lock', to the last segment until it reaches its maximum size
+- one worker at a time, the one holding an flock on 'publisher.lock', reads and publishes them
+- 'position' holds the segment and offset up to which records have been published
+
+Each record is MAGIC, the payload length, a CRC32, the time it was spooled and the payload. A record torn by a
+crash part way through an append is skipped, by searching for the next MAGIC with a valid CRC.
+"""
+import collections
+import fcntl
+import logging
+import os
+import re
+import struct
+import threading
+import time
+import zlib
+from contextlib import contextmanager
+
+from service import metrics
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b'LRS1'
+HEADER = struct.Struct('>4sIId')  # MAGIC, payload length, CRC32 of timestamp and payload, timestamp
+SEGMENT_NAME_PATTERN = re.compile(r'^segment-(\d{8})\.log$')
+POSITION_FILE = 'position'
+
+SpooledRecord = collections.namedtuple('SpooledRecord', ['payload', 'spooled_at', 'end'])
+
+
+class Spool:
+
+    def __init__(self, directory, segment_max_bytes=64 * 1024 * 1024):
+        self.directory = directory
+        self.segment_max_bytes = segment_max_bytes
+        os.makedirs(directory, exist_ok=True)
+        # For get_stats: the position the counts start from, and for each segment from there on, the offset
+        # it has been read up to and the number of records before that offset
+        self._stats_lock = threading.Lock()
+        self._stats_position = None
+        self._segment_counts = {}
+
+    def append(self, payload):
+        """Appends the payload (bytes), returning once it's on disk"""
+        spooled_at = time.time()
+        body = struct.pack('>d', spooled_at) + payload
+        record = HEADER.pack(MAGIC, len(payload), zlib.crc32(body) & 0xffffffff, spooled_at) + payload
+        with self._lock('append.lock'):
+            segment = self._get_last_segment() or 1
+            path = self._segment_path(segment)
+            if os.path.exists(path) and os.path.getsize(path) >= self.segment_max_bytes:
+                segment += 1
+                path = self._segment_path(segment)
+            created = not os.path.exists(path)
+            fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o640)
+            try:
+                os.write(fd, record)
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+            if created:
+                self._sync_directory()
+
+    def read(self, max_records):
+        """Returns up to max_records of the records not yet published, oldest first"""
+        segment, offset = self.get_position()
+        records = []
+        while len(records) < max_records:
+            with self._lock('append.lock'):
+                # Only what had been fully appended when the lock was taken is read
+                last_segment = self._get_last_segment()
+                path = self._segment_path(segment)
+                size = os.path.getsize(path) if os.path.exists(path) else 0
+
+            if size > offset:
+                with open(path, 'rb') as segment_file:
+                    segment_file.seek(offset)
+                    data = segment_file.read(size - offset)
+                for payload, spooled_at, end in self._parse(data, max_records - len(records)):
+                    records.append(SpooledRecord(payload, spooled_at, (segment, offset + end)))
+                if len(records) >= max_records:
+                    break
+
+            if last_segment is None or segment >= last_segment:
+                break
+            segment, offset = segment + 1, 0
+        return records
+
+    def commit(self, position):
+        """Saves position (the end of the last record published) and deletes the segments before it"""
+        temporary_path = os.path.join(self.directory, POSITION_FILE + '.tmp')
+        with open(temporary_path, 'w') as position_file:
+            position_file.write('{} {}'.format(*position))
+            position_file.flush()
+            os.fsync(position_file.fileno())
+        os.replace(temporary_path, os.path.join(self.directory, POSITION_FILE))
+        self._sync_directory()
+        for segment in self._get_segments():
+            if segment < position[0]:
+                os.remove(self._segment_path(segment))
+
+    def get_position(self):
+        try:
+            with open(os.path.join(self.directory, POSITION_FILE)) as position_file:
+                segment, offset = position_file.read().split()
+                return int(segment), int(offset)
+        except FileNotFoundError:
+            return self._get_first_segment() or 1, 0
+
+    def get_stats(self):
+        """
+        Returns the number of records waiting to be published, and the time the oldest was spooled (or None).
+
+        Other processes append to the spool and publish from it, so the counts kept from the last call are
+        brought up to date by reading only the records appended or published since.
+        """
+        position = self.get_position()
+        with self._stats_lock:
+            self._count_published(position)
+            self._count_appended(position)
+            count = sum(count for _, count in self._segment_counts.values())
+        return count, self._get_oldest(position) if count else None
+
+    @contextmanager
+    def lock_publisher(self):
+        """Holds the publisher lock, if no other process does. Yields whether it's held"""
+        fd = os.open(os.path.join(self.directory, 'publisher.lock'), os.O_CREAT | os.O_RDWR)
+        try:
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                yield False
+                return
+            yield True
+        finally:
+            os.close(fd)
+
+    def _parse(self, data, max_records):
+        """Yields (payload, spooled_at, end offset) for the complete, valid records in data"""
+        start = 0
+        while len(data) - start >= HEADER.size and (max_records is None or max_records > 0):
+            magic, length, crc, spooled_at = HEADER.unpack_from(data, start)
+            end = start + HEADER.size + length
+            if magic == MAGIC and end <= len(data):
+                payload = data[start + HEADER.size:end]
+                if zlib.crc32(struct.pack('>d', spooled_at) + payload) & 0xffffffff == crc:
+                    yield payload, spooled_at, end
+                    start = end
+                    if max_records is not None:
+                        max_records -= 1
+                    continue
+            # A torn record, left by a crash: carries on from the next record
+            next_start = data.find(MAGIC, start + 1)
+            if next_start < 0:
+                return
+            logger.warning('Skipping {} bytes of a damaged spool record'.format(next_start - start))
+            start = next_start
+
+    def _count_published(self, position):
+        if self._stats_position is None or position < self._stats_position:
+            # The first call, or the spool has been started afresh
+            self._segment_counts = {}
+        segment, offset = position
+        for number in [number for number in self._segment_counts if number < segment]:
+            del self._segment_counts[number]
+        if segment in self._segment_counts:
+            read_to, count = self._segment_counts[segment]
+            start = self._stats_position[1] if self._stats_position[0] == segment else 0
+            if offset >= read_to:
+                del self._segment_counts[segment]
+            elif offset > start:
+                self._segment_counts[segment] = (read_to, max(count - self._count_records(segment, start, offset), 0))
+        self._stats_position = position
+
+    def _count_appended(self, position):
+        with self._lock('append.lock'):
+            # Only what had been fully appended when the lock was taken is counted
+            sizes = [(number, self._get_size(number)) for number in self._get_segments() if number >= position[0]]
+        for number, size in sizes:
+            read_to, count = self._segment_counts.get(number, (position[1] if number == position[0] else 0, 0))
+            if size > read_to:
+                self._segment_counts[number] = (size, count + self._count_records(number, read_to, size))
+
+    def _count_records(self, segment, start, end):
+        return sum(1 for _ in self._parse(self._read_segment(segment, start, end - start), None))
+
+    def _get_oldest(self, position):
+        # Only the first record from the position is read, unless it's damaged
+        segment, offset = position
+        for number in self._get_segments():
+            if number < segment:
+                continue
+            start = offset if number == segment else 0
+            header = self._read_segment(number, start, HEADER.size)
+            if len(header) == HEADER.size and header.startswith(MAGIC):
+                record = self._read_segment(number, start, HEADER.size + HEADER.unpack(header)[1])
+                for _, spooled_at, _ in self._parse(record, 1):
+                    return spooled_at
+            # A damaged record, so the next valid one is searched for
+            for _, spooled_at, _ in self._parse(self._read_segment(number, start), 1):
+                return spooled_at
+        return None
+
+    def _read_segment(self, segment, offset, size=-1):
+        # Nothing if another process has published the whole segment, and deleted it, since it was listed
+        try:
+            with open(self._segment_path(segment), 'rb') as segment_file:
+                segment_file.seek(offset)
+                return segment_file.read(size)
+        except FileNotFoundError:
+            return b''
+
+    def _get_size(self, segment):
+        try:
+            return os.path.getsize(self._segment_path(segment))
+        except FileNotFoundError:
+            return 0
+
+    def _get_segments(self):
+        matches = (SEGMENT_NAME_PATTERN.match(name) for name in os.listdir(self.directory))
+        return sorted(int(match.group(1)) for match in matches if match)
+
+    def _get_first_segment(self):
+        segments = self._get_segments()
+        return segments[0] if segments else None
+
+    def _get_last_segment(self):
+        segments = self._get_segments()
+        return segments[-1] if segments else None
+
+    def _segment_path(self, segment):
+        return os.path.join(self.directory, 'segment-{:08d}.log'.format(segment))
+
+    @contextmanager
+    def _lock(self, name):
+        fd = os.open(os.path.join(self.directory, name), os.O_CREAT | os.O_RDWR)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            yield
+        finally:
+            os.close(fd)
+
+    def _sync_directory(self):
+        fd = os.open(self.directory, os.O_RDONLY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+
+class SpoolPublisher:
+    """
+    Publishes the spooled records in batches with publish_batch, which must return only once the broker has
+    confirmed them all (and raise otherwise). Backs off while the broker can't be reached.
+    """
+
+    def __init__(self, spool, publish_batch, batch_size=100, poll_seconds=0.2, max_backoff_seconds=30):
+        self.spool = spool
+        self._publish_batch = publish_batch
+        self.batch_size = batch_size
+        self.poll_seconds = poll_seconds
+        self.max_backoff_seconds = max_backoff_seconds
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='legacy-spool-publisher')
+            self._thread.daemon = True
+            self._thread.start()
+
+    def publish_pending(self):
+        """Publishes one batch. Returns the number of records published"""
+        records = self.spool.read(self.batch_size)
+        if not records:
+            return 0
+        start = time.time()
+        self._publish_batch([record.payload for record in records])
+        self.spool.commit(records[-1].end)
+        metrics.increment('legacy_spool.published', len(records))
+        metrics.observe('legacy_spool.batch_ms', (time.time() - start) * 1000)
+        return len(records)
+
+    def _run(self):
+        backoff = self.poll_seconds
+        while True:
+            # Only one process on the host publishes; the others stand by in case it dies
+            with self.spool.lock_publisher() as is_publisher:
+                while is_publisher:
+                    try:
+                        published = self.publish_pending()
+                        backoff = self.poll_seconds
+                    except Exception as e:
+                        logger.error('Failed to publish spooled legacy transmissions, retrying in {}s: {}'.format(
+                            backoff, e))
+                        metrics.increment('legacy_spool.publish_failures')
+                        published = 0
+                        time.sleep(backoff)
+                        backoff = min(backoff * 2, self.max_backoff_seconds)
+                    if not published:
+                        time.sleep(self.poll_seconds)
+            time.sleep(self.poll_seconds * 5)
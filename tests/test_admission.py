@@ -0,0 +1,87 @@
+import fcntl
+import mock
+import os
+import tempfile
+import time
+from service import app, admission
+from service.admission import RouteLimiter
+
+
+class TestRouteLimiter:
+
+    def setup_method(self, method):
+        self.lock_dir = tempfile.mkdtemp()
+        self.limiter = RouteLimiter('route', 2, self.lock_dir)
+
+    def test_try_acquire_hands_out_each_slot_once(self):
+        assert self.limiter.try_acquire() == 0
+        assert self.limiter.try_acquire() == 1
+        assert self.limiter.try_acquire() is None
+
+    def test_released_slot_can_be_acquired_again(self):
+        self.limiter.try_acquire()
+        self.limiter.try_acquire()
+        self.limiter.release(0)
+
+        assert self.limiter.try_acquire() == 0
+
+    def test_slot_locked_by_another_process_is_not_acquired(self):
+        # A descriptor of its own stands in for another worker
+        other_worker_slot = os.open(os.path.join(self.lock_dir, 'route.0.lock'), os.O_CREAT | os.O_RDWR)
+        fcntl.flock(other_worker_slot, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        try:
+            assert self.limiter.try_acquire() == 1
+            assert self.limiter.try_acquire() is None
+        finally:
+            os.close(other_worker_slot)
+
+    def test_acquire_gives_up_after_the_timeout(self):
+        self.limiter.try_acquire()
+        self.limiter.try_acquire()
+
+        start = time.time()
+        assert self.limiter.acquire(0.05) is None
+        assert time.time() - start >= 0.05
+
+
+class TestGetQueuedMs:
+
+    def test_returns_none_without_a_header(self):
+        assert admission.get_queued_ms(None) is None
+        assert admission.get_queued_ms('not a time') is None
+
+    def test_accepts_seconds_milliseconds_and_microseconds(self):
+        started = time.time() - 2
+        for request_start in ('t={:.3f}'.format(started), 't={:d}'.format(int(started * 1e3)),
+                              '{:d}'.format(int(started * 1e6))):
+            assert 1900 < admission.get_queued_ms(request_start) < 2500
+
+
+class TestAdmission:
+
+    def setup_method(self, method):
+        self.app = app.test_client()
+
+    @mock.patch('service.server.db_access.get_price', return_value=300)
+    def test_request_queued_for_too_long_is_shed_with_503_response(self, mock_get_price):
+        with mock.patch.dict(app.config, {'ADMISSION_MAX_QUEUE_MS': 500}):
+            response = self.app.get('/get_price/drvSummary', headers={'X-Request-Start': 't={:.3f}'.format(time.time() - 1)})
+
+        assert response.status_code == 503
+        assert response.headers['Retry-After'] == '1'
+        assert mock_get_price.call_count == 0
+
+    @mock.patch('service.server.db_access.get_price', return_value=300)
+    def test_request_to_a_route_with_no_free_slot_is_shed(self, mock_get_price):
+        config = {'ADMISSION_LIMITS': {'get_price': 1}, 'ADMISSION_MAX_QUEUE_MS': 0,
+                  'ADMISSION_LOCK_DIR': tempfile.mkdtemp()}
+        with mock.patch.dict(app.config, config):
+            assert self.app.get('/get_price/drvSummary').status_code == 200
+
+            with app.app_context():
+                limiter = admission._get_limiter('get_price', 1)
+                number = limiter.try_acquire()
+            try:
+                assert self.app.get('/get_price/drvSummary').status_code == 503
+            finally:
+                limiter.release(number)
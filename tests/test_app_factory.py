@@ -0,0 +1,26 @@
+import json
+import subprocess
+import sys
+from config import CONFIG_DICT
+from service import create_app
+
+
+class TestCreateApp:
+
+    def test_create_app_uses_the_given_config(self):
+        app = create_app(dict(CONFIG_DICT, SEARCH_RESULTS_PER_PAGE=7))
+
+        assert app.config['SEARCH_RESULTS_PER_PAGE'] == 7
+
+    def test_create_app_registers_the_api_routes(self):
+        response = create_app().test_client().get('/metrics')
+
+        assert response.status_code == 200
+        assert 'counters' in json.loads(response.data.decode())
+
+    def test_importing_the_app_does_not_load_dependencies_only_some_routes_need(self):
+        script = 'import sys, service; print([m for m in ("elasticsearch", "kombu") if m in sys.modules])'
+
+        output = subprocess.check_output([sys.executable, '-c', script])
+
+        assert output.decode().strip() == '[]'
@@ -0,0 +1,93 @@
+import mock
+from collections import namedtuple
+from datetime import datetime
+from service import app, cache_warmup, compression
+
+FakeTitleRegisterData = namedtuple(
+    'TitleRegisterData',
+    ['title_number', 'register_data', 'geometry_data', 'official_copy_data', 'last_modified']
+)
+
+LAST_MODIFIED = datetime(2016, 1, 26, 13, 0, 30)
+
+
+def _get_title(title_number, last_modified=LAST_MODIFIED):
+    # Large enough to be compressed
+    entries = ['entry {} of {}'.format(number, title_number) for number in range(100)]
+    return FakeTitleRegisterData(title_number, {'entries': entries}, {'geometry': 'data'},
+                                 {'sub_registers': [{'A': entries}]}, last_modified)
+
+
+@mock.patch('service.cache_warmup.db_access')
+class TestWarmUp:
+
+    def setup_method(self, method):
+        compression.clear_cache()
+
+    def teardown_method(self, method):
+        compression.clear_cache()
+
+    def test_warm_up_caches_every_route_and_encoding_of_the_most_searched_titles(self, mock_db_access):
+        mock_db_access.get_most_searched_title_numbers.return_value = (10, [('TITLE1', 5), ('TITLE2', 3)])
+        mock_db_access.get_title_registers_with_official_copies.return_value = [_get_title('TITLE1'),
+                                                                                 _get_title('TITLE2')]
+
+        cache_warmup.warm_up(app, 10, 24)
+
+        encodings = compression.available_encodings()
+        cached_titles = [key[0][1] for key in compression._cache]
+        assert len(compression._cache) == 2 * 2 * len(encodings)
+        # The most searched is put in last, so that it's evicted last
+        assert cached_titles[-1] == 'TITLE1'
+        assert (('official-copy', 'TITLE1', LAST_MODIFIED, None), encodings[0]) in compression._cache
+
+    def test_warmed_up_title_is_served_from_the_cache(self, mock_db_access):
+        mock_db_access.get_most_searched_title_numbers.return_value = (1, [('TITLE1', 1)])
+        mock_db_access.get_title_registers_with_official_copies.return_value = [_get_title('TITLE1')]
+        cache_warmup.warm_up(app, 10, 24)
+
+        with mock.patch('service.server.db_access.get_title_version', return_value=_get_title('TITLE1')), \
+                mock.patch('service.server.db_access.get_title_register') as mock_get_title_register, \
+                mock.patch('service.compression._compress') as mock_compress:
+            response = app.test_client().get('/titles/TITLE1', headers={'Accept-Encoding': 'gzip'})
+
+        assert response.status_code == 200
+        assert mock_get_title_register.called is False
+        assert mock_compress.called is False
+
+    def test_warm_up_reports_the_share_of_searches_covered(self, mock_db_access):
+        mock_db_access.get_most_searched_title_numbers.return_value = (10, [('TITLE1', 5), ('TITLE2', 3)])
+        # TITLE2 has been deleted since it was searched
+        mock_db_access.get_title_registers_with_official_copies.return_value = [_get_title('TITLE1')]
+
+        report = cache_warmup.warm_up(app, 10, 24)
+
+        assert report.titles == 2
+        assert report.titles_warmed == 1
+        assert (report.searches, report.searches_covered) == (10, 5)
+
+    def test_warm_up_skips_titles_that_cannot_be_cached(self, mock_db_access):
+        mock_db_access.get_most_searched_title_numbers.return_value = (1, [('TITLE1', 1)])
+        mock_db_access.get_title_registers_with_official_copies.return_value = [_get_title('TITLE1', None)]
+
+        assert cache_warmup.warm_up(app, 10, 24).titles_warmed == 0
+        assert len(compression._cache) == 0
+
+    def test_warm_up_only_ranks_as_many_titles_as_fit_in_the_cache(self, mock_db_access):
+        mock_db_access.get_most_searched_title_numbers.return_value = (0, [])
+        entries_per_title = 2 * len(compression.available_encodings())
+
+        with mock.patch.dict(app.config, {'COMPRESSED_BODY_CACHE_SIZE': entries_per_title * 3}):
+            cache_warmup.warm_up(app, 10, 24)
+
+        assert mock_db_access.get_most_searched_title_numbers.call_args[0][1] == 3
+
+    def test_warm_up_reads_titles_in_chunks(self, mock_db_access):
+        ranked = [('TITLE{}'.format(number), 10 - number) for number in range(5)]
+        mock_db_access.get_most_searched_title_numbers.return_value = (100, ranked)
+        mock_db_access.get_title_registers_with_official_copies.return_value = []
+
+        cache_warmup.warm_up(app, 10, 24, chunk_size=2)
+
+        chunks = [call[0][0] for call in mock_db_access.get_title_registers_with_official_copies.call_args_list]
+        assert chunks == [['TITLE4', 'TITLE3'], ['TITLE2', 'TITLE1'], ['TITLE0']]
@@ -0,0 +1,122 @@
+import pytest
+import requests
+from elasticsearch.exceptions import ConnectionError as ElasticsearchConnectionError, TransportError
+from sqlalchemy import exc as sqlalchemy_exc
+from service import app, circuit_breaker
+from service.circuit_breaker import CircuitBreaker, CircuitOpenError
+
+
+class FakeClock:
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestCircuitBreaker:
+
+    def setup_method(self, method):
+        self.clock = FakeClock()
+        self.breaker = CircuitBreaker('test', window_size=10, minimum_calls=4, failure_rate=0.5, slow_call_ms=100,
+                                      slow_call_rate=0.75, open_seconds=30, half_open_calls=2, clock=self.clock)
+
+    def test_breaker_stays_closed_below_the_minimum_number_of_calls(self):
+        self._record_calls(3, failed=True)
+        assert self.breaker.state == circuit_breaker.CLOSED
+
+    def test_breaker_opens_when_the_failure_rate_reaches_the_threshold(self):
+        self._record_calls(2, failed=False)
+        self._record_calls(2, failed=True)
+
+        assert self.breaker.state == circuit_breaker.OPEN
+        with pytest.raises(CircuitOpenError) as e:
+            self.breaker.before_call()
+        assert e.value.retry_after == 30
+
+    def test_breaker_opens_when_the_slow_call_rate_reaches_the_threshold(self):
+        self._record_calls(1, failed=False)
+        self._record_calls(3, failed=False, duration_ms=150)
+        assert self.breaker.state == circuit_breaker.OPEN
+
+    def test_breaker_lets_a_limited_number_of_probes_through_when_half_open(self):
+        self._record_calls(4, failed=True)
+        self.clock.now += 30
+
+        assert self.breaker.state == circuit_breaker.HALF_OPEN
+        self.breaker.before_call()
+        self.breaker.before_call()
+        with pytest.raises(CircuitOpenError):
+            self.breaker.before_call()
+
+    def test_breaker_closes_when_the_probes_succeed(self):
+        self._record_calls(4, failed=True)
+        self.clock.now += 30
+
+        self._record_calls(2, failed=False)
+        assert self.breaker.state == circuit_breaker.CLOSED
+        assert self.breaker.status()['calls'] == 0
+
+    def test_breaker_opens_again_when_a_probe_fails(self):
+        self._record_calls(4, failed=True)
+        self.clock.now += 30
+
+        self._record_calls(1, failed=True)
+        assert self.breaker.state == circuit_breaker.OPEN
+        assert self.breaker.status()['retry_after'] == 30
+
+    def test_protected_counts_dependency_errors_as_failures_and_passes_them_on(self):
+        error = sqlalchemy_exc.OperationalError('SELECT 1', {}, Exception('could not connect to server'))
+        with app.app_context():
+            circuit_breaker.reset()
+            for _ in range(app.config['CIRCUIT_BREAKER_MINIMUM_CALLS']):
+                with pytest.raises(sqlalchemy_exc.OperationalError):
+                    with circuit_breaker.protected(circuit_breaker.POSTGRES):
+                        raise error
+
+            assert circuit_breaker.get_breaker(circuit_breaker.POSTGRES).state == circuit_breaker.OPEN
+            with pytest.raises(CircuitOpenError):
+                with circuit_breaker.protected(circuit_breaker.POSTGRES):
+                    pass
+            circuit_breaker.reset()
+
+    def test_protected_passes_on_other_errors_without_opening_the_breaker(self):
+        with app.app_context():
+            circuit_breaker.reset()
+            for _ in range(app.config['CIRCUIT_BREAKER_MINIMUM_CALLS']):
+                with pytest.raises(AttributeError):
+                    with circuit_breaker.protected(circuit_breaker.POSTGRES):
+                        raise AttributeError("'NoneType' object has no attribute 'price'")
+
+            assert circuit_breaker.get_breaker(circuit_breaker.POSTGRES).state == circuit_breaker.CLOSED
+            circuit_breaker.reset()
+
+    @pytest.mark.parametrize('sqlstate, is_failure', [(b'57014', True), (b'08006', True), (b'42601', False),
+                                                       (b'22012', False)])
+    def test_postgres_errors_are_failures_by_sqlstate_class(self, sqlstate, is_failure):
+        # As pg8000 raises them
+        error = sqlalchemy_exc.ProgrammingError('SELECT 1', {}, Exception(b'ERROR', sqlstate, b'message'))
+        assert circuit_breaker.is_postgres_failure(error) is is_failure
+
+    @pytest.mark.parametrize('error, is_failure', [
+        (ElasticsearchConnectionError('N/A', 'Connection refused', None), True),
+        (TransportError(503, 'unavailable'), True),
+        (TransportError(404, 'index_not_found_exception'), False),
+        (KeyError('hits'), False),
+    ])
+    def test_elasticsearch_errors_are_failures_unless_the_request_was_at_fault(self, error, is_failure):
+        assert circuit_breaker.is_elasticsearch_failure(error) is is_failure
+
+    def test_address_search_api_failures_are_connection_errors_and_timeouts(self):
+        assert circuit_breaker.is_address_search_api_failure(requests.exceptions.ConnectTimeout()) is True
+        assert circuit_breaker.is_address_search_api_failure(Exception('API response body is not JSON')) is False
+
+    def test_amqp_failures_are_connection_errors(self):
+        assert circuit_breaker.is_amqp_failure(ConnectionRefusedError()) is True
+        assert circuit_breaker.is_amqp_failure(TypeError('not JSON serializable')) is False
+
+    def _record_calls(self, count, failed, duration_ms=10):
+        for _ in range(count):
+            self.breaker.before_call()
+            self.breaker.after_call(duration_ms, failed)
@@ -0,0 +1,80 @@
+import gzip
+import json
+import mock
+import pytest
+from flask import jsonify
+from service import app, compression
+
+SETTINGS = compression.CompressionSettings(min_size=100, gzip_level=6, brotli_quality=5)
+LARGE_RESULT = {'data': ['entry {}'.format(i) for i in range(100)]}
+
+
+class TestCompressed:
+
+    def setup_method(self, method):
+        compression.clear_cache()
+
+    def _compressed(self, accept_encoding, result=LARGE_RESULT, cache_key=None, make_response=None):
+        headers = {'Accept-Encoding': accept_encoding} if accept_encoding else {}
+        with app.test_request_context('/', headers=headers):
+            return compression.compressed(make_response or (lambda: jsonify(result)), SETTINGS, cache_key)
+
+    def test_compressed_uses_gzip_when_accepted(self):
+        response = self._compressed('gzip, deflate')
+
+        assert response.headers['Content-Encoding'] == 'gzip'
+        assert json.loads(gzip.decompress(response.get_data()).decode()) == LARGE_RESULT
+
+    @pytest.mark.skipif(compression.brotli is None, reason='brotli is not installed')
+    def test_compressed_prefers_brotli_when_accepted(self):
+        response = self._compressed('gzip, br')
+
+        assert response.headers['Content-Encoding'] == 'br'
+        assert json.loads(compression.brotli.decompress(response.get_data()).decode()) == LARGE_RESULT
+
+    def test_compressed_respects_quality_values(self):
+        response = self._compressed('gzip;q=0, identity')
+
+        assert 'Content-Encoding' not in response.headers
+        assert json.loads(response.get_data().decode()) == LARGE_RESULT
+
+    def test_compressed_does_not_compress_bodies_under_the_minimum_size(self):
+        response = self._compressed('gzip', result={'data': 'small'})
+
+        assert 'Content-Encoding' not in response.headers
+        assert 'Accept-Encoding' in response.headers['Vary']
+
+    def test_compressed_does_not_compress_when_no_encoding_is_accepted(self):
+        response = self._compressed(None)
+
+        assert 'Content-Encoding' not in response.headers
+
+    def test_compressed_serves_cached_bodies_without_making_the_response(self):
+        first = self._compressed('gzip', cache_key=('titles', 'TITLE1', 1))
+        make_response = mock.Mock()
+
+        second = self._compressed('gzip', cache_key=('titles', 'TITLE1', 1), make_response=make_response)
+
+        assert make_response.called is False
+        assert second.get_data() == first.get_data()
+        assert second.headers['Content-Encoding'] == 'gzip'
+        assert second.mimetype == 'application/json'
+
+    def test_compressed_does_not_serve_cached_bodies_for_another_key(self):
+        self._compressed('gzip', cache_key=('titles', 'TITLE1', 1))
+        changed_result = {'data': ['changed entry {}'.format(i) for i in range(100)]}
+
+        response = self._compressed('gzip', result=changed_result, cache_key=('titles', 'TITLE1', 2))
+
+        assert json.loads(gzip.decompress(response.get_data()).decode()) == changed_result
+
+    @mock.patch.dict(app.config, {'COMPRESSED_BODY_CACHE_SIZE': 1})
+    def test_compressed_evicts_the_least_recently_used_body(self):
+        self._compressed('gzip', cache_key=('titles', 'TITLE1', 1))
+        self._compressed('gzip', cache_key=('titles', 'TITLE2', 1))
+
+        with app.test_request_context('/', headers={'Accept-Encoding': 'gzip'}):
+            make_response = mock.Mock(return_value=jsonify(LARGE_RESULT))
+            compression.compressed(make_response, SETTINGS, ('titles', 'TITLE1', 1))
+
+        assert make_response.called is True
@@ -0,0 +1,39 @@
+import mock
+import threading
+from service import app, concurrency
+
+
+class TestMapConcurrently:
+
+    def setup_method(self, method):
+        self.app_context = app.app_context()
+        self.app_context.push()
+
+    def teardown_method(self, method):
+        self.app_context.pop()
+
+    def test_map_concurrently_returns_results_in_order_of_items(self):
+        assert concurrency.map_concurrently(lambda item: item * 2, [3, 1, 2]) == [6, 2, 4]
+
+    @mock.patch.dict(app.config, {'WORKER_CLASS': 'sync', 'LOOKUP_POOL_SIZE': 2})
+    def test_map_concurrently_overlaps_calls_in_threads_when_asked_under_sync_workers(self):
+        # Both calls must be running at once for either to get past the barrier
+        barrier = threading.Barrier(2, timeout=5)
+
+        def wait_for_the_other(item):
+            barrier.wait()
+            return (item, threading.current_thread().name)
+
+        results = concurrency.map_concurrently(wait_for_the_other, ['a', 'b'], threads=True)
+
+        assert [item for item, _ in results] == ['a', 'b']
+        assert threading.current_thread().name not in [thread for _, thread in results]
+
+    @mock.patch.dict(app.config, {'WORKER_CLASS': 'sync'})
+    def test_map_concurrently_calls_one_after_another_under_sync_workers_by_default(self):
+        threads = concurrency.map_concurrently(lambda item: threading.current_thread(), [1, 2])
+        assert threads == [threading.current_thread()] * 2
+
+    @mock.patch.dict(app.config, {'WORKER_CLASS': 'sync'})
+    def test_map_concurrently_is_not_cooperative_with_sync_workers(self):
+        assert concurrency.is_cooperative() is False
@@ -0,0 +1,62 @@
+import mock
+import pytest
+from sqlalchemy import create_engine, exc  # type: ignore
+from service import db_pool, metrics
+
+
+def _create_engine(pool_class):
+    return create_engine('sqlite://', poolclass=pool_class, pool_size=2, max_overflow=1)
+
+
+class TestInstrumentedQueuePool:
+
+    def setup_method(self, method):
+        metrics.reset()
+
+    def test_checkout_wait_and_new_connections_are_recorded(self):
+        engine = _create_engine(db_pool.InstrumentedQueuePool)
+        engine.connect().close()
+
+        snapshot = metrics.snapshot()
+        assert snapshot['timings']['db_pool.checkout_wait_ms']['count'] == 1
+        assert snapshot['counters']['db_pool.connections_opened'] == 1
+
+    def test_invalidated_connections_are_counted(self):
+        engine = _create_engine(db_pool.InstrumentedQueuePool)
+        connection = engine.connect()
+        connection.invalidate()
+        connection.close()
+
+        assert metrics.snapshot()['counters']['db_pool.invalidations'] == 1
+
+    def test_pre_ping_raises_disconnection_error_when_connection_is_dead(self):
+        dbapi_connection = mock.Mock()
+        dbapi_connection.cursor.return_value.execute.side_effect = Exception('Connection closed')
+
+        with pytest.raises(exc.DisconnectionError):
+            db_pool._ping_connection(dbapi_connection, None, None)
+
+        dbapi_connection.cursor.return_value.close.assert_called_once_with()
+
+    def test_warm_up_leaves_the_requested_connections_open_in_the_pool(self):
+        engine = _create_engine(db_pool.InstrumentedQueuePool)
+        db_pool.warm_up(engine, 2)
+
+        assert engine.pool.checkedin() == 2
+        assert engine.pool.checkedout() == 0
+
+    def test_reset_after_fork_replaces_the_pool(self):
+        engine = _create_engine(db_pool.InstrumentedQueuePool)
+        engine.connect().close()
+        db_pool.reset_after_fork(engine)
+
+        assert engine.pool.checkedin() == 0
+
+    def test_connection_opened_by_another_process_is_replaced_on_checkout(self):
+        engine = _create_engine(db_pool.InstrumentedQueuePool)
+        engine.connect().close()
+
+        with mock.patch('os.getpid', return_value=-1):
+            engine.connect().close()
+
+        assert metrics.snapshot()['counters']['db_pool.connections_opened'] == 2
@@ -0,0 +1,56 @@
+import csv
+import io
+import json
+from scripts import generate_synthetic_data
+from scripts.generate_synthetic_data import CHUNK_SIZE
+
+
+class TestGenerateSyntheticData:
+
+    def test_the_same_seed_gives_the_same_titles(self):
+        assert generate_synthetic_data.generate_chunk(7, 3, 20) == generate_synthetic_data.generate_chunk(7, 3, 20)
+
+    def test_a_different_seed_gives_different_titles(self):
+        first = generate_synthetic_data.generate_chunk(7, 0, 20)
+        second = generate_synthetic_data.generate_chunk(8, 0, 20)
+
+        assert [title['title_number'] for title in first] == [title['title_number'] for title in second]
+        assert [title['register_data'] for title in first] != [title['register_data'] for title in second]
+
+    def test_a_partial_chunk_starts_like_the_whole_chunk(self):
+        assert generate_synthetic_data.generate_chunk(1, 2, 5) == generate_synthetic_data.generate_chunk(1, 2, 10)[:5]
+
+    def test_keys_are_unique_across_chunks(self):
+        titles = generate_synthetic_data.generate_chunk(1, 0, 200) + generate_synthetic_data.generate_chunk(1, 1, 200)
+        lr_uprns = [lr_uprn for title in titles for lr_uprn in title['lr_uprns']]
+        uprns = [address['uprn'] for title in titles for address in title['addresses']]
+
+        assert len({title['title_number'] for title in titles}) == len(titles)
+        assert len(set(lr_uprns)) == len(lr_uprns)
+        assert len(set(uprns)) == len(uprns)
+        assert max(len(title['title_number']) for title in titles) <= 10
+
+    def test_get_chunks_covers_exactly_the_titles_asked_for(self):
+        assert generate_synthetic_data.get_chunks(CHUNK_SIZE * 2 + 5) == [(0, CHUNK_SIZE), (1, CHUNK_SIZE), (2, 5)]
+        assert generate_synthetic_data.get_chunks(CHUNK_SIZE * 2 + 5, first_chunk=2) == [(2, 5)]
+
+    def test_title_copy_data_has_a_row_per_title(self):
+        titles = generate_synthetic_data.generate_chunk(1, 0, 10)
+
+        rows = list(csv.reader(io.StringIO(generate_synthetic_data.make_title_copy_data(titles).getvalue().decode())))
+
+        assert len(rows) == 10
+        assert rows[0][0] == titles[0]['title_number']
+        assert json.loads(rows[0][1]) == titles[0]['register_data']
+        assert rows[0][6] == '{' + ','.join(titles[0]['lr_uprns']) + '}'
+
+    def test_elasticsearch_actions_index_each_address_for_both_searches(self):
+        titles = generate_synthetic_data.generate_chunk(1, 0, 10)
+        addresses = sum(len(title['addresses']) for title in titles)
+
+        actions = list(generate_synthetic_data.make_elasticsearch_actions(titles, 'index', 'by_postcode', 'by_address'))
+
+        assert len(actions) == addresses * 2
+        assert actions[0]['_type'] == 'by_postcode'
+        assert ' ' not in actions[0]['_source']['postcode']
+        assert actions[1]['_type'] == 'by_address'
@@ -0,0 +1,57 @@
+import json
+import mock
+import pytest
+import uuid
+from datetime import datetime
+from flask import jsonify  # type: ignore
+from service import app, json_encoding
+
+BODY = {
+    'title_number': 'DN1000',
+    'data': {'tenure': 'Freehold', 'entries': [{'entry_number': 1, 'text': 'Café "quoted"'}]},
+    'geometry_data': {'type': 'Polygon', 'coordinates': [[[530857.01, 181500.0], [530857.0, 181500.01]]]},
+    'viewed': datetime(2016, 1, 26, 13, 0, 30),
+    'id': uuid.UUID('12345678-1234-5678-1234-567812345678'),
+    'empty': None,
+}
+
+AVAILABLE_ENCODERS = ['json'] + (['orjson'] if json_encoding.orjson else [])
+
+
+class TestJsonEncoding:
+
+    @pytest.mark.parametrize('encoder_name', AVAILABLE_ENCODERS)
+    def test_encoders_decode_to_what_jsonify_did(self, encoder_name):
+        with app.test_request_context():
+            expected = json.loads(jsonify(BODY).get_data(as_text=True))
+
+        assert json.loads(json_encoding.get_encoder(encoder_name)(BODY).decode('utf-8')) == expected
+
+    @pytest.mark.parametrize('encoder_name', AVAILABLE_ENCODERS)
+    def test_encoders_are_compact(self, encoder_name):
+        assert json_encoding.get_encoder(encoder_name)({'a': [1, {'b': 2}]}) == b'{"a":[1,{"b":2}]}'
+
+    @pytest.mark.parametrize('encoder_name', AVAILABLE_ENCODERS)
+    def test_encoders_turn_keys_into_strings_as_json_does(self, encoder_name):
+        assert json_encoding.get_encoder(encoder_name)({1: True}) == b'{"1":true}'
+
+    @mock.patch('service.json_encoding.orjson', None)
+    def test_auto_falls_back_to_json_without_orjson(self):
+        assert json_encoding.get_encoder('auto') is json_encoding.ENCODERS['json']
+
+    def test_unknown_encoder_is_rejected(self):
+        with pytest.raises(ValueError):
+            json_encoding.get_encoder('xml')
+
+    @mock.patch('service.json_encoding.orjson', None)
+    def test_orjson_encoder_needs_orjson(self):
+        with pytest.raises(ValueError):
+            json_encoding.get_encoder('orjson')
+
+    def test_json_response_uses_the_configured_encoder(self):
+        with app.test_request_context(), mock.patch.dict(app.config, JSON_ENCODER='json'):
+            response = json_encoding.json_response({'error': 'x'}, status=404)
+
+        assert response.status_code == 404
+        assert response.mimetype == 'application/json'
+        assert response.get_data() == b'{"error":"x"}'
@@ -1,4 +1,3 @@
-import json                                          # type: ignore
 from decimal import Decimal                          # type: ignore
 from datetime import datetime                        # type: ignore
 from service import legacy_transmission_queue        # type: ignore
@@ -35,13 +34,11 @@ FakeEmptySearchTransmissionDict = {}      # type: ignore
 class TestCreateSearchMessage:
 
     def test_message_is_created_when_db_row_is_returned(self):
-        created_message = legacy_transmission_queue.create_user_search_message(FakeReturnSearchRowFound)  # type: ignore
-        created_message = json.loads(created_message)
+        created_message = legacy_transmission_queue.build_user_search_message(FakeReturnSearchRowFound)  # type: ignore
         assert created_message['title_number'] == FakeSearchTransmissionDict['TITLE_NUMBER']
 
     def test_message_is_not_created_when_no_row_returned(self):
-        created_message = legacy_transmission_queue.create_user_search_message(FakeReturnNoSearchRowFound)  # type: ignore
-        created_message = json.loads(created_message)
+        created_message = legacy_transmission_queue.build_user_search_message(FakeReturnNoSearchRowFound)  # type: ignore
         assert created_message == {}
 
     def integration_test_message_is_published_when_created_message_is_not_empty(self):
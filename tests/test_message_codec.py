@@ -0,0 +1,79 @@
+import json
+import mock
+import pytest
+from kombu.serialization import dumps  # type: ignore
+from service import legacy_transmission_queue, message_codec
+
+MESSAGE = {'TITLE_NUMBER': 'GR12345', 'USER_ID': 'Test User', 'AMOUNT': '2', 'EVENT_ID': 2}
+
+
+class TestMessageCodec:
+
+    def test_json_codec_encodes_once(self):
+        encoded = message_codec.encode(MESSAGE, 'json', 1024)
+
+        assert json.loads(encoded.body.decode()) == MESSAGE
+        assert encoded.headers == {'message_format': 2}
+
+    def test_legacy_codec_matches_what_kombu_sent(self):
+        encoded = message_codec.encode(MESSAGE, 'legacy', 1024)
+
+        # As published before, with serializer='json' on the JSON of the message, always compressed
+        content_type, content_encoding, body = dumps(json.dumps(MESSAGE), serializer='json')
+        assert encoded.body == body.encode('utf-8')
+        assert (encoded.content_type, encoded.content_encoding) == (content_type, content_encoding)
+        assert encoded.compression == 'zlib'
+        assert encoded.headers == {}
+
+    def test_small_message_is_not_compressed(self):
+        assert message_codec.encode(MESSAGE, 'json', 1024).compression is None
+
+    def test_message_at_threshold_is_compressed(self):
+        body_size = len(message_codec.encode(MESSAGE, 'json', 1024).body)
+
+        assert message_codec.encode(MESSAGE, 'json', body_size).compression == 'zlib'
+
+    @pytest.mark.parametrize('codec_name', ['legacy', 'json'])
+    def test_decode_reads_each_format(self, codec_name):
+        encoded = message_codec.encode(MESSAGE, codec_name, 1024)
+
+        assert message_codec.decode(encoded.body, encoded.headers) == MESSAGE
+
+    def test_decode_treats_message_without_format_as_legacy(self):
+        encoded = message_codec.encode(MESSAGE, 'legacy', 1024)
+
+        assert message_codec.decode(encoded.body, {}) == MESSAGE
+
+    def test_unknown_codec_is_rejected(self):
+        with pytest.raises(ValueError):
+            message_codec.encode(MESSAGE, 'xml', 1024)
+
+    @mock.patch('service.message_codec.msgpack', None)
+    def test_msgpack_codec_needs_msgpack(self):
+        with pytest.raises(ValueError):
+            message_codec.encode(MESSAGE, 'msgpack', 1024)
+
+
+class TestPublish:
+
+    def test_publish_sends_encoded_body_with_its_format(self):
+        producer = mock.Mock()
+        with mock.patch.dict(legacy_transmission_queue.QUEUE_DICT, {'LEGACY_MESSAGE_CODEC': 'json'}):
+            legacy_transmission_queue.publish(producer, MESSAGE, retry=False)
+
+        body = producer.publish.call_args[0][0]
+        kwargs = producer.publish.call_args[1]
+        assert json.loads(body.decode()) == MESSAGE
+        assert kwargs['content_type'] == 'application/json'
+        assert kwargs['headers'] == {'message_format': 2}
+        assert kwargs['retry'] is False
+
+    def test_publish_frames_legacy_messages_as_before_by_default(self):
+        producer = mock.Mock()
+        legacy_transmission_queue.publish(producer, MESSAGE)
+
+        kwargs = producer.publish.call_args[1]
+        assert kwargs['content_type'] == 'application/json'
+        assert kwargs['content_encoding'] == 'utf-8'
+        assert kwargs['compression'] == 'zlib'
+        assert kwargs['headers'] == {}
@@ -0,0 +1,21 @@
+import mock
+from service.process_local import ProcessLocal
+
+
+class TestProcessLocal:
+
+    def test_get_returns_the_same_value_within_a_process(self):
+        local = ProcessLocal(object)
+        assert local.get() is local.get()
+
+    def test_get_creates_a_new_value_in_a_forked_process(self):
+        local = ProcessLocal(object)
+        parent_value = local.get()
+
+        with mock.patch('os.getpid', return_value=-1):
+            assert local.get() is not parent_value
+
+    def test_get_creates_a_new_value_when_arguments_change(self):
+        local = ProcessLocal(lambda url: [url])
+        assert local.get('http://one') == ['http://one']
+        assert local.get('http://two') == ['http://two']
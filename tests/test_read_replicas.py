@@ -0,0 +1,118 @@
+import mock
+import pytest
+from sqlalchemy import exc
+from service import app, read_replicas
+from service.read_replicas import ReplicaSet
+
+
+def _make_engine(lag_seconds=0, checked_out=0, version=(9, 6)):
+    engine = mock.MagicMock()
+    engine.pool.checkedout.return_value = checked_out
+    connection = engine.connect.return_value.__enter__.return_value
+    connection.dialect.server_version_info = version
+    connection.execute.return_value.scalar.return_value = lag_seconds
+    return engine
+
+
+class TestReplicaSet:
+
+    def test_replicas_are_not_used_before_they_have_been_checked(self):
+        assert ReplicaSet({'replica1': _make_engine()}, 5, 1).choose() is None
+
+    def test_check_uses_replicas_within_the_lag_ceiling(self):
+        replica_set = ReplicaSet({'replica1': _make_engine(lag_seconds=2), 'replica2': _make_engine(lag_seconds=9)},
+                                 5, 1)
+
+        replica_set.check()
+
+        assert [replica.usable for replica in replica_set.replicas] == [True, False]
+        assert replica_set.replicas[1].lag_seconds == 9
+
+    def test_check_does_not_use_a_replica_that_has_yet_to_replay_anything(self):
+        replica_set = ReplicaSet({'replica1': _make_engine(lag_seconds=None)}, 5, 1)
+
+        replica_set.check()
+
+        assert replica_set.replicas[0].usable is False
+
+    def test_check_does_not_use_a_replica_that_cannot_be_reached(self):
+        engine = _make_engine()
+        engine.connect.side_effect = exc.OperationalError('SELECT', {}, Exception('connection refused'))
+        replica_set = ReplicaSet({'replica1': engine}, 5, 1)
+        replica_set.replicas[0].usable = True
+
+        replica_set.check()
+
+        assert replica_set.replicas[0].usable is False
+
+    @pytest.mark.parametrize('version, query', [((9, 4), read_replicas.LAG_QUERY_BEFORE_POSTGRES_10),
+                                                ((10, 1), read_replicas.LAG_QUERY)])
+    def test_check_uses_the_lag_functions_of_the_replicas_version(self, version, query):
+        engine = _make_engine(version=version)
+
+        ReplicaSet({'replica1': engine}, 5, 1).check()
+
+        engine.connect.return_value.__enter__.return_value.execute.assert_called_once_with(query)
+
+    def test_choose_prefers_the_replica_with_the_fewest_connections_in_use(self):
+        replica_set = ReplicaSet({'replica1': _make_engine(checked_out=3), 'replica2': _make_engine(checked_out=1)},
+                                 5, 1)
+        replica_set.check()
+
+        assert replica_set.choose().name == 'replica2'
+
+    def test_choose_takes_turns_between_equally_busy_replicas(self):
+        replica_set = ReplicaSet({'replica1': _make_engine(), 'replica2': _make_engine()}, 5, 1)
+        replica_set.check()
+
+        assert {replica_set.choose().name for _ in range(2)} == {'replica1', 'replica2'}
+
+
+class TestReadFromReplica:
+
+    def setup_method(self, method):
+        self.replica_set = ReplicaSet({'replica1': _make_engine()}, 5, 1)
+        self.replica_set.check()
+        self.app_context = app.app_context()
+        self.app_context.push()
+        self.session = app.extensions['sqlalchemy'].db.session()
+        self.session.info.clear()
+
+    def teardown_method(self, method):
+        self.session.info.clear()
+        self.app_context.pop()
+
+    def _read(self, func):
+        with mock.patch('service.read_replicas.get_replica_set', return_value=self.replica_set):
+            return read_replicas.read_from_replica(func)()
+
+    def test_queries_are_bound_to_the_chosen_replica(self):
+        bind = self._read(lambda: self.session.get_bind())
+
+        assert bind is self.replica_set.replicas[0].engine
+        assert self.session.get_bind() is not bind
+
+    def test_queries_are_bound_to_the_primary_once_the_session_has_written(self):
+        self.session.info['has_written'] = True
+
+        assert self._read(lambda: self.session.get_bind()) is not self.replica_set.replicas[0].engine
+
+    def test_func_is_run_again_on_the_primary_when_the_replica_is_unavailable(self):
+        binds = []
+
+        def read():
+            binds.append(self.session.get_bind())
+            if len(binds) == 1:
+                raise exc.OperationalError('SELECT', {}, Exception('server closed the connection'))
+            return 'result'
+
+        assert self._read(read) == 'result'
+        assert binds[0] is self.replica_set.replicas[0].engine
+        assert binds[1] is not binds[0]
+        assert self.replica_set.replicas[0].usable is False
+
+    def test_other_errors_are_raised(self):
+        with pytest.raises(ValueError):
+            self._read(mock.Mock(side_effect=ValueError('bad title number')))
+
+        assert self.replica_set.replicas[0].usable is True
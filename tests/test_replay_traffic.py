@@ -0,0 +1,89 @@
+import json
+import logging
+import mock
+from datetime import datetime, timezone
+
+from config import CONFIG_DICT
+from scripts import replay_traffic
+from scripts.replay_traffic import RecordedRequest
+from service import app
+
+with open(CONFIG_DICT['LOGGING_CONFIG_FILE_PATH']) as logging_config_file:
+    LOG_FORMAT = json.load(logging_config_file)['formatters']['default']['format']
+
+
+class TestParseLine:
+
+    def test_parses_a_gunicorn_access_log_line(self):
+        line = ('127.0.0.1 - - [26/Jan/2016:13:00:30 +0000] "GET /titles/GR12345 HTTP/1.1" 200 512 "-" '
+                '"python-requests/2.5.1"')
+
+        request = replay_traffic.parse_line(line)
+
+        assert request.method == 'GET'
+        assert request.path == '/titles/GR12345'
+        assert request.time == datetime(2016, 1, 26, 13, 0, 30, tzinfo=timezone.utc).timestamp()
+
+    def test_parses_the_line_the_api_logs_for_a_request(self):
+        app.config['LOG_REQUESTS'] = True
+        try:
+            with mock.patch('service.server.request_logger') as mock_logger, \
+                    mock.patch('service.server.db_access.get_price', return_value=300):
+                app.test_client().get('/get_price/drvSummaryView?x=1')
+        finally:
+            app.config['LOG_REQUESTS'] = False
+        record = logging.LogRecord('service.requests', logging.INFO, 'server.py', 1,
+                                   mock_logger.info.call_args[0][0], None, None)
+
+        request = replay_traffic.parse_line(logging.Formatter(LOG_FORMAT).format(record))
+
+        assert request.method == 'GET'
+        assert request.path == '/get_price/drvSummaryView?x=1'
+        assert request.duration_ms >= 0
+
+    def test_parses_a_captured_request(self):
+        line = json.dumps({'time': 1453813230.5, 'method': 'post', 'path': '/save_search_request',
+                           'form': {'MC_titleNumber': 'GR12345'}})
+
+        assert replay_traffic.parse_line(line) == RecordedRequest(
+            1453813230.5, 'POST', '/save_search_request', {'MC_titleNumber': 'GR12345'}, None)
+
+    def test_ignores_other_lines(self):
+        assert replay_traffic.parse_line('2016-01-26 13:00:30,005 level=[INFO] message=[Queue declared]') is None
+
+
+class TestReplayStatistics:
+
+    def test_peak_concurrency_counts_overlapping_requests(self):
+        requests = [RecordedRequest(0, 'GET', '/', None, 1000), RecordedRequest(0.5, 'GET', '/', None, 1000),
+                    RecordedRequest(1.5, 'GET', '/', None, 100)]
+
+        assert replay_traffic.get_peak_concurrency(requests, None) == 2
+
+    def test_peak_concurrency_without_durations_is_the_default(self):
+        assert replay_traffic.get_peak_concurrency([RecordedRequest(0, 'GET', '/', None, None)], 50) == 50
+
+    def test_percentile_is_nearest_rank(self):
+        values = list(range(1, 101))
+
+        assert replay_traffic.percentile(values, 50) == 50
+        assert replay_traffic.percentile(values, 99) == 99
+        assert replay_traffic.percentile([], 50) is None
+
+    def test_saturation_is_the_first_speed_that_falls_behind(self):
+        summaries = [
+            {'speed': '1x', 'offered_rate': 10, 'achieved_rate': 10, 'error_rate': 0},
+            {'speed': '2x', 'offered_rate': 20, 'achieved_rate': 19.5, 'error_rate': 0},
+            {'speed': '4x', 'offered_rate': 40, 'achieved_rate': 25, 'error_rate': 0},
+            {'speed': 'max', 'offered_rate': None, 'achieved_rate': 26, 'error_rate': 0},
+        ]
+
+        kept_up, fell_behind = replay_traffic.find_saturation(summaries)
+
+        assert kept_up['speed'] == '2x'
+        assert fell_behind['speed'] == '4x'
+
+    def test_errors_count_as_falling_behind(self):
+        summaries = [{'speed': '1x', 'offered_rate': 10, 'achieved_rate': 10, 'error_rate': 0.05}]
+
+        assert replay_traffic.find_saturation(summaries) == (None, summaries[0])
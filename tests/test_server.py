@@ -1,15 +1,21 @@
+import gzip
 import json
 import mock
 from datetime import datetime
 from collections import namedtuple
 from elasticsearch_dsl.utils import AttrList
-from service import app
+from service import app, circuit_breaker
 from service.server import db_access, es_access, api_client
 
 FakeTitleRegisterData = namedtuple(
     'TitleRegisterData',
-    ['title_number', 'register_data', 'geometry_data', 'official_copy_data']
+    ['title_number', 'register_data', 'geometry_data', 'official_copy_data', 'last_modified']
 )
+FakeTitleRegisterData.__new__.__defaults__ = (None,)
+
+FakeTitleVersion = namedtuple('TitleVersionRecord', ['title_number', 'last_modified'])
+
+FakeTitleSummary = namedtuple('TitleRegisterData', ['title_number', 'title_summary'])
 
 FakeUprnMapping = namedtuple(
     'UprnMapping',
@@ -186,6 +192,10 @@ def _get_sample_title(number):
     )
 
 
+def _get_sample_summary(number):
+    return FakeTitleSummary(str(number), {'tenure': 'Freehold {}'.format(number)})
+
+
 def _get_sample_uprn():
     return FakeUprnMapping(
         uprn='1234',
@@ -205,7 +215,9 @@ class TestHealthCheck:
 
         response = self.app.get('/health')
         assert response.status_code == 200
-        assert response.data.decode() == '{"status": "ok"}'
+        json_response = json.loads(response.data.decode())
+        assert json_response['status'] == 'ok'
+        assert 'errors' not in json_response
 
     @mock.patch.object(db_access, 'get_title_register', side_effect=Exception('Test PG exception'))
     @mock.patch.object(es_access, 'get_info', return_value={'status': 200})
@@ -214,10 +226,8 @@ class TestHealthCheck:
 
         assert response.status_code == 500
         json_response = json.loads(response.data.decode())
-        assert json_response == {
-            'status': 'error',
-            'errors': ['Problem talking to PostgreSQL: Test PG exception'],
-        }
+        assert json_response['status'] == 'error'
+        assert json_response['errors'] == ['Problem talking to PostgreSQL: Test PG exception']
 
     @mock.patch.object(db_access, 'get_title_register', return_value=None)
     @mock.patch.object(es_access, 'get_info', side_effect=Exception('Test ES exception'))
@@ -226,10 +236,8 @@ class TestHealthCheck:
 
         assert response.status_code == 500
         json_response = json.loads(response.data.decode())
-        assert json_response == {
-            'status': 'error',
-            'errors': ['Problem talking to elasticsearch: Test ES exception'],
-        }
+        assert json_response['status'] == 'error'
+        assert json_response['errors'] == ['Problem talking to elasticsearch: Test ES exception']
 
     @mock.patch.object(db_access, 'get_title_register', side_effect=Exception('Test PG exception'))
     @mock.patch.object(es_access, 'get_info', side_effect=Exception('Test ES exception'))
@@ -240,13 +248,36 @@ class TestHealthCheck:
 
         assert response.status_code == 500
         json_response = json.loads(response.data.decode())
-        assert json_response == {
-            'status': 'error',
-            'errors': [
-                'Problem talking to elasticsearch: Test ES exception',
-                'Problem talking to PostgreSQL: Test PG exception',
-            ],
-        }
+        assert json_response['status'] == 'error'
+        assert json_response['errors'] == [
+            'Problem talking to elasticsearch: Test ES exception',
+            'Problem talking to PostgreSQL: Test PG exception',
+        ]
+
+    @mock.patch.object(db_access, 'get_title_register', return_value=None)
+    @mock.patch.object(es_access, 'get_info', return_value={'status': 200})
+    def test_health_check_reports_the_state_of_each_circuit_breaker(self, mock_get_info, mock_get_user):
+        circuit_breaker.reset()
+        response = self.app.get('/health')
+
+        breakers = json.loads(response.data.decode())['circuit_breakers']
+        assert sorted(breakers.keys()) == sorted(circuit_breaker.DEPENDENCIES)
+        assert breakers['postgres']['state'] == 'closed'
+
+    @mock.patch.object(db_access, 'get_price', return_value=None)
+    def test_get_price_returns_404_response_for_an_unknown_product(self, mock_get_price):
+        response = self.app.get('/get_price/bogus')
+
+        assert response.status_code == 404
+        assert json.loads(response.data.decode()) == {'error': 'Product not found'}
+
+    @mock.patch.object(db_access, 'get_price', side_effect=circuit_breaker.CircuitOpenError('postgres', 12))
+    def test_open_circuit_breaker_returns_503_response_with_retry_after(self, mock_get_price):
+        response = self.app.get('/get_price/drvSummary')
+
+        assert response.status_code == 503
+        assert response.headers['Retry-After'] == '12'
+        assert json.loads(response.data.decode()) == {'error': 'Service temporarily unavailable'}
 
 
 class TestGetTitle:
@@ -292,6 +323,42 @@ class TestGetTitle:
                 'geometry_data': geometry_data,
             }
 
+    def test_get_title_returns_gzipped_response_when_accepted(self):
+        register_data = {'entries': ['entry {}'.format(i) for i in range(200)]}
+        title = FakeTitleRegisterData('title123', register_data, {'geometry': 'data'}, {}, datetime(2016, 1, 1))
+
+        with mock.patch('service.server.db_access.get_title_version', return_value=title), \
+                mock.patch('service.server.db_access.get_title_register', return_value=title):
+            response = self.app.get('/titles/title123', headers={'Accept-Encoding': 'gzip'})
+
+        assert response.status_code == 200
+        assert response.headers['Content-Encoding'] == 'gzip'
+        assert json.loads(gzip.decompress(response.data).decode())['data'] == register_data
+
+    def test_get_title_serves_a_cached_title_without_reading_its_data(self):
+        register_data = {'entries': ['entry {}'.format(i) for i in range(200)]}
+        title = FakeTitleRegisterData('title124', register_data, {'geometry': 'data'}, {}, datetime(2016, 1, 1))
+        version = FakeTitleVersion('title124', datetime(2016, 1, 1))
+
+        with mock.patch('service.server.db_access.get_title_version', return_value=version), \
+                mock.patch('service.server.db_access.get_title_register', return_value=title) as mock_get_title:
+            self.app.get('/titles/title124', headers={'Accept-Encoding': 'gzip'})
+            response = self.app.get('/titles/title124', headers={'Accept-Encoding': 'gzip'})
+
+        assert mock_get_title.call_count == 1
+        assert json.loads(gzip.decompress(response.data).decode())['data'] == register_data
+
+    def test_get_title_reads_the_title_again_once_it_has_changed(self):
+        title = FakeTitleRegisterData('title125', {'entries': ['entry'] * 200}, {}, {}, datetime(2016, 1, 1))
+        changed_title = title._replace(register_data={'entries': ['changed'] * 200}, last_modified=datetime(2016, 1, 2))
+
+        with mock.patch('service.server.db_access.get_title_version', side_effect=[title, changed_title]), \
+                mock.patch('service.server.db_access.get_title_register', side_effect=[title, changed_title]):
+            self.app.get('/titles/title125', headers={'Accept-Encoding': 'gzip'})
+            response = self.app.get('/titles/title125', headers={'Accept-Encoding': 'gzip'})
+
+        assert json.loads(gzip.decompress(response.data).decode())['data'] == {'entries': ['changed'] * 200}
+
 
 class TestGetOfficialCopy:
 
@@ -302,7 +369,13 @@ class TestGetOfficialCopy:
     def test_get_official_copy_calls_db_access_to_get_the_copy(self, mock_get_official_copy_data):
         title_number = 'title123'
         self.app.get('/titles/{}/official-copy'.format(title_number))
-        mock_get_official_copy_data.assert_called_once_with(title_number)
+        mock_get_official_copy_data.assert_called_once_with(title_number, None)
+
+    @mock.patch.object(db_access, 'get_official_copy_data', return_value=None)
+    def test_get_official_copy_passes_requested_sub_registers_to_db_access(self, mock_get_official_copy_data):
+        title_number = 'title123'
+        self.app.get('/titles/{}/official-copy?sub_registers=A, C'.format(title_number))
+        mock_get_official_copy_data.assert_called_once_with(title_number, ['A', 'C'])
 
     @mock.patch.object(db_access, 'get_official_copy_data', return_value=None)
     def test_get_official_copy_returns_404_response_when_db_access_returns_none(self, mock_get_official_copy_data):
@@ -321,6 +394,18 @@ class TestGetOfficialCopy:
         json_body = json.loads(response.data.decode())
         assert json_body == {'error': 'Internal server error'}
 
+    def test_get_official_copy_caches_a_request_for_no_sub_registers(self):
+        title = FakeTitleRegisterData('title126', {}, {}, {'sub_registers': []}, datetime(2016, 1, 1))
+
+        with mock.patch('service.server.db_access.get_title_version', return_value=title), \
+                mock.patch('service.server.db_access.get_official_copy_data', return_value=title) as mock_get_copy:
+            response = self.app.get('/titles/title126/official-copy?sub_registers=,',
+                                    headers={'Accept-Encoding': 'gzip'})
+
+        assert response.status_code == 200
+        mock_get_copy.assert_called_once_with('title126', [])
+        assert json.loads(response.data.decode())['official_copy_data']['sub_registers'] == []
+
     def test_get_official_copy_returns_200_response_with_copy_from_db_access(self):
         title_number = 'title123'
         sub_registers = [{'A': 'register A'}, {'B': 'register B'}]
@@ -478,6 +563,92 @@ class TestGetPropertiesForPostcode:
         assert json_body == {'number_pages': 1, 'number_results': 1, 'page_number': 0, 'titles': []}
 
 
+    @mock.patch.object(api_client, 'get_titles_by_postcode', return_value=_get_one_result_from_api_client())
+    @mock.patch.object(db_access, 'get_mapped_lruprn', return_value=_get_sample_uprn())
+    @mock.patch.object(db_access, 'get_title_number_and_summary', return_value=_get_sample_summary(1))
+    @mock.patch.object(db_access, 'get_title_number_and_register_data')
+    def test_get_properties_for_postcode_returns_summaries_in_summary_view(
+            self, mock_get_register_data, mock_get_summary, mock_get_mapped_lruprn, mock_get_titles):
+
+        response = self.app.get('/title_search_postcode/SW11%202DR?view=summary')
+
+        assert response.status_code == 200
+        assert json.loads(response.data.decode())['titles'] == [
+            {'address': '1 INGLEWOOD HOUSE, SIDWELL STREET, EXETER, EX1 1AA', 'summary': {'tenure': 'Freehold 1'}, 'title_number': '1'}
+        ]
+        mock_get_summary.assert_called_once_with('1234')
+        assert mock_get_register_data.called is False
+
+
+class TestGetPropertiesForPostcodes:
+
+    def setup_method(self, method):
+        self.app = app.test_client()
+
+    def _post(self, body, query=''):
+        return self.app.post('/title_search_postcode/batch{}'.format(query), data=json.dumps(body),
+                             content_type='application/json')
+
+    def _get_results(self, response):
+        return [json.loads(line) for line in response.data.decode().splitlines()]
+
+    @mock.patch.object(api_client, 'get_titles_by_postcode', return_value=_get_empty_api_client())
+    @mock.patch.object(db_access, 'get_titles_and_register_data_by_uprn', return_value={})
+    def test_searches_each_distinct_normalised_postcode_once(self, mock_get_titles, mock_get_properties):
+        response = self._post({'postcodes': ['  Sw11_ 2dR ', 'EX1 1AA', 'SW11 2DR', ' ']}, '?page=2')
+
+        assert response.status_code == 200
+        assert mock_get_properties.call_args_list == [
+            mock.call('SW11 2DR', page_number=2, page_size=_get_page_size()),
+            mock.call('EX1 1AA', page_number=2, page_size=_get_page_size()),
+        ]
+
+    @mock.patch.object(api_client, 'get_titles_by_postcode',
+                       side_effect=[_get_one_result_from_api_client(), _get_empty_api_client()])
+    @mock.patch.object(db_access, 'get_titles_and_register_data_by_uprn',
+                       return_value={'10023117067': _get_sample_title(1)})
+    @mock.patch.object(db_access, 'get_mapped_lruprn')
+    def test_streams_a_result_per_postcode_with_titles_found_in_one_query(
+            self, mock_get_mapped_lruprn, mock_get_titles, mock_get_properties):
+
+        response = self._post({'postcodes': ['EX1 1AA', 'SW11 2DR']})
+
+        assert response.status_code == 200
+        assert response.mimetype == 'application/x-ndjson'
+        assert self._get_results(response) == [
+            {'postcode': 'EX1 1AA', 'number_pages': 1, 'number_results': 1, 'page_number': 0, 'titles': [
+                {'address': '1 INGLEWOOD HOUSE, SIDWELL STREET, EXETER, EX1 1AA', 'data': {'register': 'data 1'},
+                 'title_number': '1'}
+            ]},
+            {'postcode': 'SW11 2DR', 'number_pages': 0, 'number_results': 0, 'page_number': 0, 'titles': []},
+        ]
+        mock_get_titles.assert_called_once_with(['10023117067'])
+        assert mock_get_mapped_lruprn.called is False
+
+    @mock.patch.object(api_client, 'get_titles_by_postcode', return_value=_get_two_results_from_api_client())
+    @mock.patch.object(db_access, 'get_titles_and_summaries_by_uprn', return_value={})
+    def test_returns_summaries_in_summary_view(self, mock_get_summaries, mock_get_properties):
+        response = self._post({'postcodes': ['EX1 1AA']}, '?view=summary')
+
+        assert [title['title_number'] for title in self._get_results(response)[0]['titles']] == ['not found'] * 2
+        mock_get_summaries.assert_called_once_with(['10023117067', '10023117067'])
+
+    @mock.patch.object(api_client, 'get_titles_by_postcode')
+    def test_rejects_bodies_without_a_list_of_postcodes(self, mock_get_properties):
+        for body in ({}, {'postcodes': 'SW11 2DR'}, {'postcodes': [1]}, ['SW11 2DR']):
+            response = self._post(body)
+
+            assert response.status_code == 400
+            assert 'error' in json.loads(response.data.decode())
+        assert mock_get_properties.called is False
+
+    @mock.patch.dict(app.config, {'MAX_BATCH_POSTCODES': 2})
+    @mock.patch.object(api_client, 'get_titles_by_postcode')
+    def test_rejects_more_postcodes_than_the_maximum(self, mock_get_properties):
+        assert self._post({'postcodes': ['SW11 2DR', 'sw112dr', 'EX1 1AA']}).status_code == 400
+        assert mock_get_properties.called is False
+
+
 class TestGetPropertiesForAddress:
 
     def setup_method(self, method):
@@ -511,6 +682,26 @@ class TestGetPropertiesForAddress:
         json_body = json.loads(response.data.decode())
         assert json_body == {'error': 'Internal server error'}
 
+    @mock.patch.dict(app.config, {'MAX_ADDRESS_SUGGESTIONS': 5})
+    @mock.patch.object(es_access, 'get_address_suggestions')
+    def test_get_address_suggestions_returns_suggestions_from_es_access(self, mock_get_suggestions):
+        suggestions = [{'title_number': 'TITLE1', 'address': '12 High Street, Plymouth'}]
+        mock_get_suggestions.return_value = suggestions
+
+        response = self.app.get('/address_suggestions?q=12 High ')
+
+        assert response.status_code == 200
+        assert json.loads(response.data.decode()) == {'suggestions': suggestions}
+        mock_get_suggestions.assert_called_once_with('12 High', 5)
+
+    @mock.patch.object(es_access, 'get_address_suggestions')
+    def test_get_address_suggestions_returns_no_suggestions_for_too_short_text(self, mock_get_suggestions):
+        response = self.app.get('/address_suggestions?q=1')
+
+        assert response.status_code == 200
+        assert json.loads(response.data.decode()) == {'suggestions': []}
+        assert mock_get_suggestions.call_count == 0
+
     @mock.patch.object(db_access, 'get_title_registers', return_value=_get_titles(1))
     def test_get_properties_for_address_calls_db_access_with_data_from_elasticsearch(
             self, mock_get_registers):
@@ -539,6 +730,22 @@ class TestGetPropertiesForAddress:
             ]
         }
 
+    @mock.patch.object(es_access, 'get_properties_for_address', return_value=_get_es_address_results(1, 2))
+    @mock.patch.object(db_access, 'get_title_summaries', return_value=[_get_sample_summary(2), _get_sample_summary(1)])
+    @mock.patch.object(db_access, 'get_title_registers')
+    def test_get_properties_for_address_returns_summaries_in_summary_view(
+            self, mock_get_registers, mock_get_summaries, mock_get_properties):
+
+        response = self.app.get('/title_search_address/searchterm?view=summary')
+
+        assert response.status_code == 200
+        assert json.loads(response.data.decode())['titles'] == [
+            {'summary': {'tenure': 'Freehold 1'}, 'title_number': '1'},
+            {'summary': {'tenure': 'Freehold 2'}, 'title_number': '2'}
+        ]
+        mock_get_summaries.assert_called_once_with(['1', '2'])
+        assert mock_get_registers.called is False
+
     @mock.patch.object(es_access, 'get_properties_for_address', return_value=_get_es_address_results(3, 1, 2))
     @mock.patch.object(db_access, 'get_title_registers', return_value=_get_titles(1, 2, 3))
     def test_get_properties_for_address_returns_titles_in_order_given_by_es_access(
@@ -0,0 +1,211 @@
+import json
+import mock
+import os
+import pytest
+import tempfile
+from collections import defaultdict
+from service import legacy_transmission_queue
+from service.legacy_transmission_queue import ConfirmedPublisher
+from service.transmission_spool import HEADER, Spool, SpoolPublisher
+
+
+class TestSpool:
+
+    def setup_method(self, method):
+        self.directory = tempfile.mkdtemp()
+        self.spool = Spool(self.directory, segment_max_bytes=100)
+
+    def test_read_returns_appended_records_in_order(self):
+        self.spool.append(b'first')
+        self.spool.append(b'second')
+
+        records = self.spool.read(10)
+
+        assert [record.payload for record in records] == [b'first', b'second']
+
+    def test_read_returns_at_most_max_records(self):
+        for number in range(5):
+            self.spool.append('message {}'.format(number).encode())
+
+        assert len(self.spool.read(3)) == 3
+
+    def test_committed_records_are_not_read_again(self):
+        self.spool.append(b'first')
+        self.spool.append(b'second')
+
+        self.spool.commit(self.spool.read(1)[0].end)
+
+        assert [record.payload for record in self.spool.read(10)] == [b'second']
+
+    def test_position_survives_a_new_spool_on_the_same_directory(self):
+        self.spool.append(b'first')
+        self.spool.append(b'second')
+        self.spool.commit(self.spool.read(1)[0].end)
+
+        records = Spool(self.directory).read(10)
+
+        assert [record.payload for record in records] == [b'second']
+
+    def test_records_are_read_across_segments(self):
+        for number in range(10):
+            self.spool.append('message {}'.format(number).encode())
+
+        records = self.spool.read(20)
+
+        assert len(self._segments()) > 1
+        assert [record.payload for record in records] == ['message {}'.format(n).encode() for n in range(10)]
+
+    def test_commit_deletes_segments_before_the_position(self):
+        for number in range(10):
+            self.spool.append('message {}'.format(number).encode())
+        segments = self._segments()
+
+        self.spool.commit(self.spool.read(20)[-1].end)
+
+        assert self._segments() == segments[-1:]
+        assert self.spool.read(20) == []
+
+    def test_torn_record_is_skipped(self):
+        self.spool.append(b'first')
+        # A crash part way through appending the second record
+        with open(os.path.join(self.directory, self._segments()[0]), 'ab') as segment:
+            segment.write(b'LRS1\x00\x00')
+        self.spool.append(b'third')
+
+        assert [record.payload for record in self.spool.read(10)] == [b'first', b'third']
+
+    def test_get_stats_counts_pending_records(self):
+        assert self.spool.get_stats() == (0, None)
+
+        self.spool.append(b'first')
+        self.spool.append(b'second')
+        first = self.spool.read(1)[0]
+        self.spool.commit(first.end)
+
+        count, oldest = self.spool.get_stats()
+        assert count == 1
+        assert oldest >= first.spooled_at
+
+    def test_get_stats_counts_records_appended_and_published_by_other_processes(self):
+        other_process_spool = Spool(self.directory, segment_max_bytes=100)
+        for number in range(10):
+            self.spool.append('message {}'.format(number).encode())
+        assert self.spool.get_stats()[0] == 10
+
+        records = other_process_spool.read(20)
+        other_process_spool.commit(records[6].end)
+        other_process_spool.append(b'message 10')
+
+        count, oldest = self.spool.get_stats()
+        assert count == 4
+        assert oldest == records[7].spooled_at
+
+    def test_get_stats_only_reads_the_records_spooled_or_published_since_it_was_last_called(self):
+        for number in range(5):
+            self.spool.append('message {}'.format(number).encode())
+        self.spool.get_stats()
+        self.spool.commit(self.spool.read(1)[0].end)
+        self.spool.append(b'message 5')
+
+        with mock.patch.object(self.spool, '_parse', wraps=self.spool._parse) as mock_parse:
+            assert self.spool.get_stats()[0] == 5
+
+        # Only the published record, the appended one and the oldest are read, each a record's worth of bytes
+        record_size = HEADER.size + len(b'message 0')
+        assert [len(call[0][0]) for call in mock_parse.call_args_list] == [record_size] * 3
+
+    def test_publisher_lock_is_held_by_one_process_at_a_time(self):
+        with self.spool.lock_publisher() as is_publisher:
+            with Spool(self.directory).lock_publisher() as other_is_publisher:
+                assert is_publisher is True
+                assert other_is_publisher is False
+
+    def _segments(self):
+        return sorted(name for name in os.listdir(self.directory) if name.startswith('segment-'))
+
+
+class TestSpoolPublisher:
+
+    def setup_method(self, method):
+        self.spool = Spool(tempfile.mkdtemp())
+        self.published = []
+
+    def test_publish_pending_publishes_a_batch_and_commits_it(self):
+        for number in range(3):
+            self.spool.append('message {}'.format(number).encode())
+        publisher = SpoolPublisher(self.spool, self.published.append, batch_size=2)
+
+        assert publisher.publish_pending() == 2
+        assert publisher.publish_pending() == 1
+        assert publisher.publish_pending() == 0
+        assert self.published == [[b'message 0', b'message 1'], [b'message 2']]
+
+    def test_failed_batch_is_not_committed(self):
+        self.spool.append(b'message')
+        publisher = SpoolPublisher(self.spool, mock.Mock(side_effect=Exception('broker down')))
+
+        with pytest.raises(Exception):
+            publisher.publish_pending()
+
+        assert [record.payload for record in self.spool.read(10)] == [b'message']
+
+
+class FakeChannel:
+
+    def __init__(self):
+        self.events = defaultdict(set)
+        self.confirm_select = mock.Mock()
+
+    def send(self, event, *args):
+        for callback in self.events[event]:
+            callback(*args)
+
+
+class TestConfirmedPublisher:
+
+    def setup_method(self, method):
+        self.channel = FakeChannel()
+        self.producer = mock.Mock(channel=self.channel)
+
+    def test_publish_batch_returns_once_all_messages_are_confirmed(self):
+        self.producer.connection.drain_events.side_effect = lambda timeout: self.channel.send('basic_ack', 3, True)
+        publisher = ConfirmedPublisher(self.producer)
+
+        publisher.publish_batch([b'{"number": 1}', b'{"number": 2}', b'{"number": 3}'], 1)
+
+        self.channel.confirm_select.assert_called_once_with()
+        assert self.producer.publish.call_count == 3
+        assert self.producer.publish.call_args[1]['retry'] is False
+
+    def test_publish_batch_raises_when_a_message_is_rejected(self):
+        def confirm(timeout):
+            self.channel.send('basic_ack', 1, False)
+            self.channel.send('basic_nack', 2, False, False)
+        self.producer.connection.drain_events.side_effect = confirm
+        publisher = ConfirmedPublisher(self.producer)
+
+        with pytest.raises(Exception) as e:
+            publisher.publish_batch([b'{"number": 1}', b'{"number": 2}'], 1)
+
+        assert 'rejected' in str(e.value)
+
+    def test_publish_batch_raises_when_not_confirmed_in_time(self):
+        publisher = ConfirmedPublisher(self.producer)
+
+        with pytest.raises(Exception) as e:
+            publisher.publish_batch([b'{"number": 1}'], 0)
+
+        assert 'not confirmed' in str(e.value)
+
+
+class TestSpooledTransmission:
+
+    @mock.patch('service.legacy_transmission_queue.start_spool_publisher')
+    def test_message_is_spooled_when_spool_is_configured(self, mock_start):
+        spool_dir = tempfile.mkdtemp()
+        with mock.patch.dict(legacy_transmission_queue.QUEUE_DICT, {'LEGACY_SPOOL_DIR': spool_dir}):
+            assert legacy_transmission_queue.send_legacy_transmission({'TITLE_NUMBER': 'GR12345'}) is True
+            records = legacy_transmission_queue.get_spool().read(10)
+
+        assert json.loads(records[0].payload.decode())['TITLE_NUMBER'] == 'GR12345'
+        mock_start.assert_called_once_with()